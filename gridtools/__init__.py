@@ -1 +1,65 @@
-__version__ = '0.4.1'
+__version__ = '0.5.0.dev0'
+
+
+def warmup(dtypes=('float32', 'float64', 'uint8', 'int16'), ds_methods=None, us_methods=None, masked=True,
+           parallel=False):
+    """
+    JIT-compile the resampling and gap-filling kernels for the given grid data types and resampling methods.
+
+    Compiled kernels are cached on disk (in the ``__pycache__`` directories of the package or in the
+    directory given by the environment variable ``NUMBA_CACHE_DIR``), so that subsequent processes load them
+    instead of compiling them again. Calling this function once, e.g. when a worker process starts or when a
+    container image is built, avoids the compilation latency of the first calls of the gridtools functions.
+
+    :param dtypes: sequence of numpy data types, optional
+        The data types of the grids to be processed. Gap-filling kernels are compiled for floating point types only.
+    :param ds_methods: sequence of *DS_* constants, optional
+        The aggregation methods to compile. Defaults to ``DS_MEAN`` and ``DS_MODE``.
+    :param us_methods: sequence of *US_* constants, optional
+        The interpolation methods to compile. Defaults to ``US_LINEAR``.
+    :param masked: *bool*, optional
+        Whether to also compile the kernels for masked arrays.
+    :param parallel: *bool*, optional
+        Whether to also compile the multi-threaded kernels used if *parallel* is ``True``.
+    :return: A dictionary that maps the name of each data type to the time in seconds taken to compile
+        (or to load from the cache) its kernels.
+    """
+    import time
+
+    import numpy as np
+
+    import gridtools.gapfilling as gtg
+    import gridtools.resampling as gtr
+
+    if ds_methods is None:
+        ds_methods = (gtr.DS_MEAN, gtr.DS_MODE)
+    if us_methods is None:
+        us_methods = (gtr.US_LINEAR,)
+    timings = {}
+    for dtype in dtypes:
+        dtype = np.dtype(dtype)
+        start = time.perf_counter()
+        srcs = [np.ones((17, 17), dtype=dtype)]
+        if masked:
+            srcs.append(np.ma.array(srcs[0], mask=np.eye(17, dtype=np.bool_)))
+        fill_values = (None, np.nan) if dtype.kind == 'f' else (None,)
+        for src in srcs:
+            for fill_value in fill_values:
+                for parallel_ in ((False, True) if parallel else (False,)):
+                    kwargs = dict(fill_value=fill_value, parallel=parallel_)
+                    for ds_method in ds_methods:
+                        # generic, block, and integral image or histogram downsampling
+                        gtr.downsample_2d(src, 5, 5, method=ds_method, **kwargs)
+                        gtr.downsample_2d(src[:16, :16], 4, 4, method=ds_method, **kwargs)
+                        gtr.downsample_2d(src, 2, 2, method=ds_method, **kwargs)
+                    for us_method in us_methods:
+                        gtr.upsample_2d(src, 35, 35, method=us_method, **kwargs)
+                        for ds_method in ds_methods:
+                            gtr.resample_2d(src, 35, 5, ds_method=ds_method, us_method=us_method, **kwargs)
+        if dtype.kind == 'f':
+            src = np.ones((17, 17), dtype=dtype)
+            src[8, 8] = np.nan
+            gtg.fillgaps_lowpass_2d(src)
+            gtg.fillgaps_multiscale_2d(src)
+        timings[dtype.name] = time.perf_counter() - start
+    return timings
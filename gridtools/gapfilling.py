@@ -1,5 +1,9 @@
+import concurrent.futures
+import time
+from collections import namedtuple
+
 import numpy as np
-from numba import jit
+from numba import jit, prange
 
 import gridtools.resampling as gtr
 
@@ -9,45 +13,720 @@ DEFAULT_KERNEL = np.array([[0.5, 0.7, 0.5],
                            [0.7, 1.0, 0.7],
                            [0.5, 0.7, 0.5]])
 
+#: The default kernel of :py:func:`fillgaps_lowpass_3d`: :py:data:`DEFAULT_KERNEL` for the current time step,
+#: weighted by 0.7 for the previous and the next one, see :py:func:`make_kernel_3d`.
+DEFAULT_KERNEL_3D = DEFAULT_KERNEL[np.newaxis] * np.array([0.7, 1.0, 0.7])[:, np.newaxis, np.newaxis]
+
+
+#: The result of :py:func:`fillgaps_lowpass_2d` if called with ``full_output=True``:
+#: *iteration_count* is the number of iterations performed, *gap_count* the number of remaining gaps,
+#: *stalled* tells whether the last iteration could not fill any gap, and *iteration_times* holds the
+#: time in seconds taken by each iteration.
+LowpassResult = namedtuple('LowpassResult', ['iteration_count', 'gap_count', 'stalled', 'iteration_times'])
+
+
+def fillgaps_lowpass_2d(src, kernel=DEFAULT_KERNEL, threshold=1, max_iterations=None, progress=None,
+                        full_output=False):
+    """
+    Fill the gaps of a 2-D grid by repeatedly averaging the values of the neighbours of gap cells.
+
+    The iterations stop if all gaps are filled, if an iteration cannot fill any gap because the remaining ones
+    never reach the *threshold*, or after *max_iterations*.
 
-def fillgaps_lowpass_2d(src, kernel=DEFAULT_KERNEL, threshold=1):
-    w = src.shape[-1]
-    h = src.shape[-2]
-    pixel_count = w * h
-    gap_count = 1
-    out = src
-    while 0 < gap_count < pixel_count:
-        out, gap_count = _apply_low_pass_filter(out, kernel, threshold)
+    :param src: 2-D *ndarray*
+    :param kernel: 2-D *ndarray*, optional
+        The weights of the neighbours of a gap cell
+    :param threshold: *scalar*, optional
+        The minimum sum of the weights of the valid neighbours required to fill a gap cell
+    :param max_iterations: *int*, optional
+        The maximum number of iterations. Unlimited by default.
+    :param progress: *callable*, optional
+        Called after each iteration with the number of iterations performed and the number of remaining gaps
+    :param full_output: *bool*, optional
+        If ``True``, a :py:class:`LowpassResult` is returned together with the gap-filled grid.
+    :return: A gap-filled copy of *src*, or a tuple (gap-filled copy, :py:class:`LowpassResult`)
+        if *full_output* is ``True``.
+    """
+    out = src.copy()
+    result = _fillgaps_lowpass(out[np.newaxis], kernel[np.newaxis], threshold, max_iterations, progress, False)
+    if full_output:
+        return out, result
     return out
 
 
-def fillgaps_multiscale_2d(src, ds_iter=True, ds_method=gtr.DS_MEAN, us_method=gtr.US_LINEAR):
-    w = src.shape[-1]
-    h = src.shape[-2]
-    out = src
-    pyramid = [src]
-    s = 2
-    while True:
-        out_w = (w + s - 1) // s
-        out_h = (h + s - 1) // s
-        s *= 2
-        out = gtr.downsample_2d(out if ds_iter else src, out_w, out_h, method=ds_method, fill_value=np.nan)
-        pyramid.append(out)
-        gap_count = count_gaps(out)
-        if gap_count == 0 or gap_count == out_w * out_h or (out_w == 1 and out_h == 1):
+def fillgaps_lowpass_3d(src, kernel=None, threshold=1, max_iterations=None, progress=None, full_output=False,
+                        parallel=False, num_threads=None):
+    """
+    Fill the gaps of a 3-D cube of grids, e.g. a time series, by repeatedly averaging the values of the
+    spatio-temporal neighbours of gap cells. This is the 3-D equivalent of :py:func:`fillgaps_lowpass_2d`,
+    which fills the whole cube within JIT-compiled code.
+
+    :param src: 3-D *ndarray* of shape (time, height, width)
+    :param kernel: 3-D *ndarray*, optional
+        The weights of the neighbours of a gap cell, of shape (time, height, width). Defaults to
+        :py:data:`DEFAULT_KERNEL_3D`. Use :py:func:`make_kernel_3d` to weight time and space differently.
+    :param threshold: *scalar*, optional
+        The minimum sum of the weights of the valid neighbours required to fill a gap cell
+    :param max_iterations: *int*, optional
+        The maximum number of iterations. Unlimited by default.
+    :param progress: *callable*, optional
+        Called after each iteration with the number of iterations performed and the number of remaining gaps
+    :param full_output: *bool*, optional
+        If ``True``, a :py:class:`LowpassResult` is returned together with the gap-filled cube.
+    :param parallel: *bool*, optional
+        If ``True``, the gap cells of each iteration are computed by multiple threads. The result is identical
+        to the one computed by a single thread.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``.
+    :return: A gap-filled copy of *src*, or a tuple (gap-filled copy, :py:class:`LowpassResult`)
+        if *full_output* is ``True``.
+    """
+    if kernel is None:
+        kernel = DEFAULT_KERNEL_3D
+    if src.ndim != 3 or kernel.ndim != 3:
+        raise ValueError("'src' and 'kernel' must be 3-D")
+    out = src.copy()
+    with gtr._num_threads(num_threads):
+        result = _fillgaps_lowpass(out, kernel, threshold, max_iterations, progress, parallel)
+    if full_output:
+        return out, result
+    return out
+
+
+def make_kernel_3d(time_scale=1.0, time_radius=1, kernel=DEFAULT_KERNEL):
+    """
+    Create a 3-D kernel for :py:func:`fillgaps_lowpass_3d` from a 2-D *kernel* for the neighbours within
+    the same time step.
+
+    Like the weights of :py:data:`DEFAULT_KERNEL`, which decrease by a factor of 0.7 per step along each axis,
+    the weights of the neighbouring time steps are those of *kernel* times 0.7 raised to the power of
+    *time_scale* times the distance in time steps.
+
+    :param time_scale: *float*, optional
+        The distance between two time steps in units of grid cells. Values greater than one decrease the weights
+        of the neighbouring time steps, values less than one increase them.
+    :param time_radius: *int*, optional
+        The number of neighbouring time steps before and after a gap cell
+    :param kernel: 2-D *ndarray*, optional
+        The weights of the neighbours within the same time step
+    :return: 3-D *ndarray* of shape (2 * *time_radius* + 1, height, width)
+    """
+    distance = np.abs(np.arange(-time_radius, time_radius + 1))
+    return kernel[np.newaxis] * 0.7 ** (time_scale * distance)[:, np.newaxis, np.newaxis]
+
+
+def _fillgaps_lowpass(out, kernel, threshold, max_iterations, progress, parallel):
+    """Fills the gaps of the stack of 2-D grids *out* in place and returns a :py:class:`LowpassResult`."""
+    fill_gaps = gtr._get_kernel(_fill_gaps_lowpass_kernel, parallel)
+    state = _init_lowpass_frontier(out, kernel)
+    frontier, next_frontier, values, filled, queued, frontier_size, gap_count = state
+    iteration_times = []
+    stalled = False
+    while frontier_size > 0 and (max_iterations is None or len(iteration_times) < max_iterations):
+        start = time.perf_counter()
+        fill_count, frontier_size = fill_gaps(out, kernel, threshold, frontier, next_frontier, values,
+                                              filled, queued, frontier_size)
+        frontier, next_frontier = next_frontier, frontier
+        iteration_times.append(time.perf_counter() - start)
+        gap_count -= fill_count
+        if progress is not None:
+            progress(len(iteration_times), gap_count)
+        if fill_count == 0:
+            stalled = True
+            break
+    return LowpassResult(len(iteration_times), gap_count, stalled, iteration_times)
+
+
+def fillgaps_multiscale_2d(src, ds_iter=True, ds_method=gtr.DS_MEAN, us_method=gtr.US_LINEAR, workspace=None,
+                           out=None):
+    """
+    Fill the gaps of a 2-D grid from a pyramid of downsampled versions of it.
+
+    The grid is repeatedly downsampled by a factor of two until a level contains no more gaps, only gaps, or a single
+    grid cell. Then, from the coarsest level upwards, the gaps of each level are filled with the upsampled values of
+    the level below.
+
+    :param src: 2-D *ndarray*
+    :param ds_iter: *bool*, optional
+        If ``True``, each level is downsampled from the previous one, otherwise from *src*.
+    :param ds_method: one of the *DS_* constants, optional
+        Grid cell aggregation method
+    :param us_method: one of the *US_* constants, optional
+        Grid cell interpolation method
+    :param workspace: :py:class:`MultiscaleWorkspace`, optional
+        The buffers of the pyramid levels. Reusing a workspace for grids of the same shape and data type
+        avoids allocating them for every call.
+    :param out: 2-D *ndarray*, optional
+        Alternate output array in which to place the result. It may be *src* itself.
+    :return: A gap-filled copy of *src*, or *out* if given.
+    """
+    if workspace is None:
+        workspace = MultiscaleWorkspace(src.shape, src.dtype)
+    elif workspace.shape != src.shape or workspace.dtype != src.dtype:
+        raise ValueError("'src' and 'workspace' are incompatible")
+    if out is None:
+        out = src.copy()
+    elif out is not src:
+        out[...] = src
+    level_count = 0
+    for level in workspace.levels:
+        source = workspace.levels[level_count - 1] if ds_iter and level_count > 0 else src
+        gtr.downsample_2d(source, level.shape[-1], level.shape[-2], method=ds_method, fill_value=np.nan, out=level)
+        level_count += 1
+        gap_count = count_gaps(level)
+        if gap_count == 0 or gap_count == level.size:
             break
-    pyramid.reverse()
-    out_low = pyramid[0]
-    for i in range(1, len(pyramid)):
-        out_hi = pyramid[i]
-        w = out_hi.shape[-1]
-        h = out_hi.shape[-2]
-        fill_data = gtr.upsample_2d(out_low, w, h, method=us_method, fill_value=np.nan)
-        out_low, _ = _fill_gaps(out_hi, fill_data)
-    return out_low
-
-
-@jit(nopython=True)
+    for i in range(level_count - 1, -1, -1):
+        gtr._upsample_gaps(workspace.levels[i], workspace.levels[i - 1] if i > 0 else out, us_method)
+    return out
+
+
+def fillgaps_multiscale_3d(src, time_scale=1.0, ds_iter=True, us_method=gtr.US_LINEAR, out=None, parallel=False,
+                           num_threads=None):
+    """
+    Fill the gaps of a 3-D cube of grids, e.g. a time series, from a pyramid of downsampled versions of it.
+    This is the 3-D equivalent of :py:func:`fillgaps_multiscale_2d` using ``DS_MEAN``, where each level aggregates
+    and interpolates the neighbouring time steps together with the neighbouring grid cells.
+
+    :param src: 3-D *ndarray* of shape (time, height, width)
+    :param time_scale: *float*, optional
+        The distance between two time steps in units of grid cells. Each level halves the resolution of the cube
+        measured in these units, so for values greater than one, time steps are aggregated at coarser levels only,
+        and for values less than one, at finer levels already.
+    :param ds_iter: *bool*, optional
+        If ``True``, each level is downsampled from the previous one, otherwise from *src*.
+    :param us_method: one of the *US_* constants, optional
+        Grid cell interpolation method
+    :param out: 3-D *ndarray*, optional
+        Alternate output array in which to place the result. It may be *src* itself.
+    :param parallel: *bool*, optional
+        If ``True``, the time steps and rows of each level are computed by multiple threads. The result is identical
+        to the one computed by a single thread.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``.
+    :return: A gap-filled copy of *src*, or *out* if given.
+    """
+    if src.ndim != 3:
+        raise ValueError("'src' must be 3-D")
+    if out is None:
+        out = src.copy()
+    elif out.shape != src.shape:
+        raise ValueError("'src' and 'out' are incompatible")
+    elif out is not src:
+        out[...] = src
+    t, h, w = src.shape
+    downsample = gtr._get_kernel(_downsample_3d_kernel, parallel)
+    upsample_gaps = gtr._get_kernel(_upsample_gaps_3d_kernel, parallel, us_method)
+    levels = []
+    s = 2
+    with gtr._num_threads(num_threads):
+        while True:
+            shape = (min(t, max(1, int(np.ceil(t * time_scale / s)))), (h + s - 1) // s, (w + s - 1) // s)
+            if shape == (levels[-1].shape if levels else src.shape):
+                break
+            source = levels[-1] if ds_iter and levels else src
+            level = np.empty(shape, dtype=src.dtype)
+            downsample(source, *_axis_tables(gtr._downsample_axis, source.shape, shape, True), level)
+            levels.append(level)
+            s *= 2
+            gap_count = np.count_nonzero(~np.isfinite(level))
+            if gap_count == 0 or gap_count == level.size:
+                break
+        for i in range(len(levels) - 1, -1, -1):
+            target = levels[i - 1] if i > 0 else out
+            upsample_gaps(levels[i], *_axis_tables(gtr._upsample_axis, levels[i].shape, target.shape, us_method),
+                          target)
+    return out
+
+
+def _axis_tables(axis_func, src_shape, dst_shape, arg):
+    """Returns the concatenated (index, weight) tables of *axis_func* for the three axes of a cube."""
+    tables = ()
+    for src_size, dst_size in zip(src_shape, dst_shape):
+        tables += axis_func(src_size, dst_size, arg)
+    return tables
+
+
+def fillgaps_tiled_2d(src, fill_func=None, tile_size=1024, halo=64, out=None, executor=None, num_workers=None,
+                      **kwargs):
+    """
+    Fill the gaps of a large 2-D grid tile by tile, in parallel.
+
+    Each tile is filled together with a halo of surrounding grid cells. If the gaps of a tile depend on grid cells
+    beyond its halo, the tile is filled again with a halo of twice the size, up to the whole grid. The result is
+    therefore the same as the one of *fill_func* applied to the whole grid, without seams at the tile borders.
+    For :py:func:`fillgaps_nearest_2d`, nearest valid grid cells at equal distances may be chosen differently.
+
+    :param src: 2-D *ndarray*
+    :param fill_func: *callable*, optional
+        Either :py:func:`fillgaps_lowpass_2d` (the default) or :py:func:`fillgaps_nearest_2d`
+    :param tile_size: *int*, optional
+        The height and width of the tiles, excluding their halos
+    :param halo: *int*, optional
+        The initial width of the halos
+    :param out: 2-D *ndarray*, optional
+        Alternate output array in which to place the result.
+    :param executor: *concurrent.futures.Executor*, optional
+        The executor filling the tiles, e.g. a ``ProcessPoolExecutor``. Defaults to a thread pool, in which
+        the JIT-compiled kernels run without holding the global interpreter lock.
+    :param num_workers: *int*, optional
+        The number of threads of the default thread pool
+    :param kwargs: keyword arguments passed to *fill_func*
+    :return: A gap-filled copy of *src*, or *out* if given.
+    """
+    if fill_func is None:
+        fill_func = fillgaps_lowpass_2d
+    if fill_func is not fillgaps_lowpass_2d and fill_func is not fillgaps_nearest_2d:
+        raise ValueError('fill_func must be fillgaps_lowpass_2d or fillgaps_nearest_2d')
+    h, w = src.shape
+    if out is None:
+        out = np.empty_like(src)
+    elif out.shape != src.shape:
+        raise ValueError("'src' and 'out' are incompatible")
+    tiles = [((y, min(y + tile_size, h), x, min(x + tile_size, w)), halo)
+             for y in range(0, h, tile_size) for x in range(0, w, tile_size)]
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers)
+    try:
+        while tiles:
+            futures = []
+            for (y0, y1, x0, x1), tile_halo in tiles:
+                wy0, wy1 = max(y0 - tile_halo, 0), min(y1 + tile_halo, h)
+                wx0, wx1 = max(x0 - tile_halo, 0), min(x1 + tile_halo, w)
+                # the halo widths on each side, unlimited at the grid borders
+                margin = min(y0 - wy0 if wy0 > 0 else np.inf, wy1 - y1 if wy1 < h else np.inf,
+                             x0 - wx0 if wx0 > 0 else np.inf, wx1 - x1 if wx1 < w else np.inf)
+                core = (y0 - wy0, y1 - wy0, x0 - wx0, x1 - wx0)
+                futures.append(executor.submit(_fill_tile, src[wy0:wy1, wx0:wx1], core, margin, fill_func, kwargs))
+            next_tiles = []
+            for ((y0, y1, x0, x1), tile_halo), future in zip(tiles, futures):
+                core_out, exact = future.result()
+                if exact:
+                    out[y0:y1, x0:x1] = core_out
+                else:
+                    next_tiles.append(((y0, y1, x0, x1), 2 * max(tile_halo, 1)))
+            tiles = next_tiles
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return out
+
+
+def _fill_tile(window, core, margin, fill_func, kwargs):
+    """
+    Fills the gaps of *window*. Returns the filled *core* region and whether it is independent of grid cells
+    farther than *margin* from it.
+    """
+    cy0, cy1, cx0, cx1 = core
+    if fill_func is fillgaps_lowpass_2d:
+        out, result = fillgaps_lowpass_2d(window, full_output=True, **kwargs)
+        kh, kw = kwargs.get('kernel', DEFAULT_KERNEL).shape
+        reach = max(kh // 2, kh - 1 - kh // 2, kw // 2, kw - 1 - kw // 2)
+        # the cells beyond the window change the cells within reach of its border in each iteration, and may
+        # still fill the remaining gaps of the core after the window has stalled
+        exact = margin == np.inf or (result.iteration_count * reach <= margin and
+                                     np.isfinite(out[cy0:cy1, cx0:cx1]).all())
+    else:
+        k = kwargs.get('k', 1)
+        out, feature_y, feature_x = _fillgaps_nearest(window, k, kwargs.get('power', 2.0),
+                                                      kwargs.get('max_distance'))
+        y, x = np.mgrid[cy0:cy1, cx0:cx1]
+        feature_y = feature_y[cy0:cy1, cx0:cx1]
+        feature_x = feature_x[cy0:cy1, cx0:cx1]
+        gaps = ~np.isfinite(window[cy0:cy1, cx0:cx1])
+        if not gaps.any():
+            exact = True
+        elif (feature_y[gaps] < 0).any():
+            exact = margin == np.inf
+        else:
+            distance = np.sqrt((feature_y[gaps] - y[gaps]) ** 2 + (feature_x[gaps] - x[gaps]) ** 2).max()
+            if k > 1:
+                # blending uses the nearest valid cells of the cells within k rows and columns, which are less
+                # than (1 + sqrt(2)) * k farther away
+                distance += 3 * k
+            exact = distance <= margin
+    return out[cy0:cy1, cx0:cx1], exact
+
+
+class MultiscaleWorkspace(object):
+    """
+    The buffers of the pyramid levels used by :py:func:`fillgaps_multiscale_2d` for grids of a given shape
+    and data type.
+
+    :param shape: the shape (height, width) of the grids
+    :param dtype: the data type of the grids, optional
+    """
+
+    def __init__(self, shape, dtype=np.float64):
+        h, w = shape
+        self._shape = (h, w)
+        self._dtype = np.dtype(dtype)
+        self._levels = []
+        s = 2
+        while (h, w) != (1, 1) and (not self._levels or self._levels[-1].shape != (1, 1)):
+            self._levels.append(np.empty(((h + s - 1) // s, (w + s - 1) // s), dtype=self._dtype))
+            s *= 2
+
+    @property
+    def shape(self):
+        """The shape (height, width) of the grids."""
+        return self._shape
+
+    @property
+    def dtype(self):
+        """The data type of the grids."""
+        return self._dtype
+
+    @property
+    def levels(self):
+        """The buffers of the pyramid levels, starting with the one of half the resolution."""
+        return self._levels
+
+
+class MultiscalePlan(object):
+    """
+    A reusable plan for filling the gaps of grids that share the same gap mask, e.g. the time steps of a data cube
+    with a fixed sensor footprint, in the same way as :py:func:`fillgaps_multiscale_2d` with ``DS_MEAN``.
+
+    The plan analyzes the mask once: it determines the depth of the pyramid, the pyramid cells that are actually
+    used to fill the gaps, and, as sparse tables, the positions and weights of the cells that supply their values
+    and those of the gap cells. Applying the plan only gathers these values, for all grids of a stack in a single
+    JIT-compiled call, without downsampling the grids as a whole or visiting their valid cells.
+
+    :param mask: 2-D boolean *ndarray*, ``True`` for the gap cells
+    :param ds_iter: *bool*, optional
+        If ``True``, each level is downsampled from the previous one, otherwise from the grid.
+    :param us_method: one of the *US_* constants, optional
+        Grid cell interpolation method
+    """
+
+    def __init__(self, mask, ds_iter=True, us_method=gtr.US_LINEAR):
+        mask = np.array(mask, dtype=np.bool_)
+        self._shape = mask.shape
+        # the gap masks of the pyramid levels of a grid whose only non-finite cells are the gaps
+        workspace = MultiscaleWorkspace(mask.shape)
+        grid = np.where(mask, np.nan, 0.0)
+        level_masks = [mask]
+        for level in workspace.levels:
+            source = workspace.levels[len(level_masks) - 2] if ds_iter and len(level_masks) > 1 else grid
+            gtr.downsample_2d(source, level.shape[-1], level.shape[-2], fill_value=np.nan, out=level)
+            level_masks.append(~np.isfinite(level))
+            gap_count = np.count_nonzero(level_masks[-1])
+            if gap_count == 0 or gap_count == level.size:
+                break
+        self._level_count = len(level_masks) - 1
+        # the fill table of the gap cells, referring to the concatenated pyramid levels
+        offsets = np.cumsum([0] + [level_mask.size for level_mask in level_masks[1:]])
+        gaps = np.flatnonzero(level_masks[-1])
+        indptr = np.zeros(gaps.size + 1, dtype=np.int64)
+        positions = np.zeros(0, dtype=np.int64)
+        weights = np.zeros(0, dtype=np.float64)
+        for i in range(len(level_masks) - 1, 0, -1):
+            gaps, indptr, positions, weights = _compose_fill_table(level_masks[i], level_masks[i - 1], offsets[i - 1],
+                                                                   gaps, indptr, positions, weights, us_method)
+        # the pyramid cells used per level, from the coarsest to the finest one, and their downsampling tables
+        levels = np.searchsorted(offsets, positions, side='right')
+        cells = [None] * len(level_masks)
+        cell_tables = [None] * len(level_masks)
+        for i in range(len(level_masks) - 1, 0, -1):
+            cells[i] = np.unique(positions[levels == i] - offsets[i - 1])
+            if ds_iter and i < len(level_masks) - 1:
+                cells[i] = np.union1d(cells[i], cell_tables[i + 1][1])
+            source_mask = level_masks[i - 1] if ds_iter else mask
+            cell_tables[i] = _downsample_table(source_mask, level_masks[i].shape, cells[i])
+        # the value positions of the cells: the valid grid cells, followed by the used pyramid cells
+        grid_size = mask.size
+        cell_offsets = np.cumsum([grid_size] + [cells[i].size for i in range(1, len(level_masks))])
+        cell_lengths = []
+        cell_positions = []
+        cell_weights = []
+        for i in range(1, len(level_masks)):
+            cell_indptr_i, cell_positions_i, cell_weights_i = cell_tables[i]
+            if ds_iter and i > 1:
+                cell_positions_i = cell_offsets[i - 2] + np.searchsorted(cells[i - 1], cell_positions_i)
+            cell_lengths.append(np.diff(cell_indptr_i))
+            cell_positions.append(cell_positions_i)
+            cell_weights.append(cell_weights_i)
+        self._cell_indptr = np.zeros(sum(lengths.size for lengths in cell_lengths) + 1, dtype=np.int64)
+        if cell_lengths:
+            np.cumsum(np.concatenate(cell_lengths), out=self._cell_indptr[1:])
+        self._cell_positions = np.concatenate(cell_positions) if cell_positions else positions
+        self._cell_weights = np.concatenate(cell_weights) if cell_weights else weights
+        self._gaps = gaps
+        self._indptr = indptr
+        self._positions = np.zeros(positions.size, dtype=np.int64)
+        for i in range(1, len(level_masks)):
+            selected = levels == i
+            self._positions[selected] = cell_offsets[i - 1] - grid_size \
+                + np.searchsorted(cells[i], positions[selected] - offsets[i - 1])
+        self._weights = weights
+
+    @property
+    def shape(self):
+        """The (height, width) of the grids."""
+        return self._shape
+
+    @property
+    def gap_count(self):
+        """The number of gap cells of the grids."""
+        return self._gaps.size
+
+    @property
+    def level_count(self):
+        """The number of downsampled pyramid levels."""
+        return self._level_count
+
+    @property
+    def cell_count(self):
+        """The number of pyramid cells used to fill the gaps."""
+        return self._cell_indptr.size - 1
+
+    def apply(self, src, out=None):
+        """
+        Fill the gaps of a 2-D grid or a stack of 2-D grids according to this plan.
+
+        :param src: *ndarray* of shape (..., height, width), where (height, width) must equal *shape*. Gaps outside
+            the mask of the plan are not filled. If they contribute to filled values, a *ValueError* is raised.
+        :param out: *ndarray*, optional
+            Alternate output array in which to place the result. It may be *src* itself.
+        :return: A gap-filled copy of *src*, or *out* if given.
+        """
+        if src.shape[-2:] != self._shape:
+            raise ValueError("'src' and plan are incompatible")
+        if out is not None and out.shape != src.shape:
+            raise ValueError("'src' and 'out' are incompatible")
+        src_2d = src.reshape((-1, self._shape[0] * self._shape[1]))
+        # checked before anything is written, so that neither *out* nor *src* is modified on failure
+        if not _gathered_cells_valid(src_2d, self._cell_positions):
+            raise ValueError("'src' has gaps that are not in the mask of the plan")
+        if out is None:
+            out = src.copy()
+        elif out is not src:
+            out[...] = src
+        out_2d = out.reshape(src_2d.shape)
+        _gather_fill_values(src_2d, self._cell_indptr, self._cell_positions, self._cell_weights,
+                            self._gaps, self._indptr, self._positions, self._weights, out_2d)
+        if not np.shares_memory(out_2d, out):
+            out[...] = out_2d.reshape(out.shape)
+        return out
+
+
+def _downsample_table(src_mask, dst_shape, cells):
+    """
+    Creates the table of the ``DS_MEAN`` weights of the valid cells of the grid *src_mask* that are aggregated
+    into the given flat *cells* of a grid of shape *dst_shape*.
+
+    :return: a tuple (indptr, positions, weights), where the flat source positions and weights of the i-th cell
+        are found at *indptr[i]:indptr[i + 1]*
+    """
+    src_w = src_mask.shape[-1]
+    plan = gtr.get_resampling_plan(src_mask.shape, dst_shape)
+    y_index, y_weight, x_index, x_weight = plan._ds_tables
+    cell_y, cell_x = np.divmod(cells, dst_shape[-1])
+    y0, y1 = y_index[cell_y, 0], y_index[cell_y, 1]
+    x0, x1 = x_index[cell_x, 0], x_index[cell_x, 1]
+    # all source cells of the index ranges
+    w = x1 - x0 + 1
+    lengths = (y1 - y0 + 1) * w
+    rows = np.repeat(np.arange(cells.size), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    dy, dx = np.divmod(offsets, w[rows])
+    y = y0[rows] + dy
+    x = x0[rows] + dx
+    # only the first and last source cells of a range have fractional weights
+    wy = np.where(dy == 0, y_weight[cell_y, 0][rows], np.where(y == y1[rows], y_weight[cell_y, 1][rows], 1.0))
+    wx = np.where(dx == 0, x_weight[cell_x, 0][rows], np.where(x == x1[rows], x_weight[cell_x, 1][rows], 1.0))
+    positions = y * src_w + x
+    valid = ~src_mask.ravel()[positions]
+    rows, positions, weights = rows[valid], positions[valid], (wy * wx)[valid]
+    weights /= np.bincount(rows, weights, minlength=cells.size)[rows]
+    indptr = np.zeros(cells.size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=cells.size), out=indptr[1:])
+    return indptr, positions, weights
+
+
+def _compose_fill_table(src_mask, dst_mask, src_offset, src_gaps, src_indptr, src_positions, src_weights, us_method):
+    """
+    Creates the fill table of the gap cells of the grid *dst_mask* from the one of the gap cells of the coarser grid
+    *src_mask*, which refers to the concatenated pyramid levels starting at *src_offset*.
+
+    A table is given by the flat indices *gaps* of the gap cells, in ascending order, and the pyramid positions and
+    weights of their valid cells, where those of the i-th gap cell are found at *indptr[i]:indptr[i + 1]*.
+    Gap cells without valid cells remain gaps.
+
+    :return: a tuple (gaps, indptr, positions, weights)
+    """
+    src_w = src_mask.shape[-1]
+    plan = gtr.get_resampling_plan(src_mask.shape, dst_mask.shape, us_method=us_method)
+    y_index, y_weight, x_index, x_weight = plan._us_tables
+    gaps = np.flatnonzero(dst_mask)
+    gap_y, gap_x = np.divmod(gaps, dst_mask.shape[-1])
+    # the flat indices of the four interpolated source cells and their weights
+    wy = y_weight[gap_y][:, None]
+    wx = x_weight[gap_x][:, None]
+    refs = np.concatenate([(y_index[gap_y, iy] * src_w + x_index[gap_x, ix])[:, None]
+                           for iy in (0, 1) for ix in (0, 1)], axis=1)
+    if us_method == gtr.US_NEAREST:
+        ref_weights = np.zeros((gaps.size, 4))
+        ref_weights[:, 0] = 1.0
+    else:
+        ref_weights = np.concatenate([(1 - wx) * (1 - wy), wx * (1 - wy), (1 - wx) * wy, wx * wy], axis=1)
+    # a source cell is valid, or a gap cell that is filled itself
+    src_rows = np.full(src_mask.size, -1, dtype=np.int64)
+    src_rows[src_gaps] = np.arange(src_gaps.size)
+    src_filled = src_rows < 0
+    src_filled[src_gaps] = np.diff(src_indptr) > 0
+    ok = src_filled[refs]
+    if us_method != gtr.US_NEAREST:
+        # gaps in any of the four cells: nearest cell according to the weights
+        partial = ~ok.all(axis=1)
+        nearest = (wy[:, 0] >= 0.5) * 2 + (wx[:, 0] >= 0.5)
+        nearest_refs = refs[np.arange(gaps.size), nearest]
+        refs[partial] = nearest_refs[partial, None]
+        ref_weights[partial] = [1.0, 0.0, 0.0, 0.0]
+        ok[partial] = src_filled[nearest_refs[partial], None]
+    ok &= ref_weights != 0
+    rows, columns = np.nonzero(ok)
+    refs = refs[rows, columns]
+    ref_weights = ref_weights[rows, columns]
+    # references to valid cells become entries, those to gap cells are replaced by the entries of these
+    ref_rows = src_rows[refs]
+    valid = ref_rows < 0
+    lengths = np.where(valid, 1, src_indptr[ref_rows + 1] - src_indptr[ref_rows])
+    entries = np.repeat(np.where(valid, 0, src_indptr[ref_rows]) - (np.cumsum(lengths) - lengths), lengths) \
+        + np.arange(lengths.sum())
+    expanded = np.repeat(~valid, lengths)
+    rows = np.repeat(rows, lengths)
+    positions = np.repeat(src_offset + refs, lengths)
+    weights = np.repeat(ref_weights, lengths)
+    positions[expanded] = src_positions[entries[expanded]]
+    weights[expanded] *= src_weights[entries[expanded]]
+    # merge the entries of equal positions
+    order = np.lexsort((positions, rows))
+    rows, positions, weights = rows[order], positions[order], weights[order]
+    first = np.ones(rows.size, dtype=np.bool_)
+    first[1:] = (rows[1:] != rows[:-1]) | (positions[1:] != positions[:-1])
+    starts = np.flatnonzero(first)
+    weights = np.add.reduceat(weights, starts) if starts.size else weights
+    rows, positions = rows[starts], positions[starts]
+    indptr = np.zeros(gaps.size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=gaps.size), out=indptr[1:])
+    return gaps, indptr, positions, weights
+
+
+def fillgaps_nearest_2d(src, k=1, power=2.0, max_distance=None):
+    """
+    Fill the gaps of a 2-D grid with the value of the nearest valid grid cell.
+
+    The nearest valid grid cells are found by an exact Euclidean distance transform, whose cost is linear in the
+    number of grid cells, independent of the size of the gaps.
+
+    If *k* is greater than one, gaps are filled with the inverse distance weighted mean of the *k* nearest
+    among the valid grid cells found for the grid cells within a distance of *k* cells, so that the cost is
+    proportional to the number of grid cells times *k* squared.
+
+    :param src: 2-D *ndarray*
+    :param k: *int*, optional
+        The number of valid grid cells to blend
+    :param power: *scalar*, optional
+        The power of the inverse distance weights if *k* is greater than one
+    :param max_distance: *scalar*, optional
+        If given, gaps farther away from the nearest valid grid cell remain gaps.
+    :return: A gap-filled copy of *src*.
+    """
+    return _fillgaps_nearest(src, k, power, max_distance)[0]
+
+
+def _fillgaps_nearest(src, k, power, max_distance):
+    if k < 1:
+        raise ValueError('k must be >= 1')
+    out = src.copy()
+    feature_y, feature_x = _distance_transform(src)
+    _fill_gaps_nearest(src, feature_y, feature_x, k, power, np.inf if max_distance is None else max_distance, out)
+    return out, feature_y, feature_x
+
+
+#: The result of :py:func:`fillgaps_laplace_2d` if called with ``full_output=True``:
+#: *cycle_count* is the number of V-cycles performed, *residual* the final maximum residual relative to the
+#: value range of the valid grid cells, and *converged* tells whether it is less than or equal to the tolerance.
+LaplaceResult = namedtuple('LaplaceResult', ['cycle_count', 'residual', 'converged'])
+
+
+def fillgaps_laplace_2d(src, tolerance=1e-6, max_cycles=100, smoothing_steps=2, full_output=False):
+    """
+    Fill the gaps of a 2-D grid smoothly by solving the Laplace equation over the gap cells, with the
+    valid grid cells as boundary values.
+
+    The discrete Laplace equation is solved by a multigrid method: each V-cycle smoothes the solution by
+    red-black Gauss-Seidel sweeps, restricts the residual to a grid of half the resolution using
+    ``downsample_2d()`` with ``DS_MEAN``, recursively solves for the correction there, and prolongates the correction
+    using ``upsample_2d()`` with ``US_LINEAR``. The cost of a V-cycle is linear in the number of grid cells and
+    the number of V-cycles required is independent of the grid size. The initial fill is computed by
+    :py:func:`fillgaps_nearest_2d`.
+
+    :param src: 2-D *ndarray*
+    :param tolerance: *scalar*, optional
+        The maximum residual of the Laplace equation, relative to the value range of the valid grid cells
+    :param max_cycles: *int*, optional
+        The maximum number of V-cycles
+    :param smoothing_steps: *int*, optional
+        The number of Gauss-Seidel sweeps before and after the coarse grid correction
+    :param full_output: *bool*, optional
+        If ``True``, a :py:class:`LaplaceResult` is returned together with the gap-filled grid.
+    :return: A gap-filled copy of *src*, or a tuple (gap-filled copy, :py:class:`LaplaceResult`)
+        if *full_output* is ``True``.
+    """
+    unknown = ~np.isfinite(src)
+    out = fillgaps_nearest_2d(src).astype(np.float64)
+    valid_values = src[~unknown]
+    value_range = valid_values.max() - valid_values.min() if valid_values.size else 0.0
+    cycle_count = 0
+    residual = 0.0
+    if value_range > 0:
+        unknowns = [unknown]
+        while unknowns[-1].shape[0] > 2 or unknowns[-1].shape[1] > 2:
+            h, w = unknowns[-1].shape
+            h, w = (h + 1) // 2 if h > 2 else h, (w + 1) // 2 if w > 2 else w
+            # coarse cells are unknown only if covered by unknown cells entirely, so that every coarse
+            # grid keeps boundary values
+            coarse_unknown = gtr.downsample_2d(unknowns[-1].astype(np.float64), w, h, method=gtr.DS_MEAN) > 1 - 1e-6
+            if not coarse_unknown.any():
+                break
+            unknowns.append(coarse_unknown)
+        rhs = np.zeros(out.shape, dtype=np.float64)
+        r = np.empty(out.shape, dtype=np.float64)
+        residual = _laplace_residual(out, unknowns[0], rhs, r) / value_range
+        while residual > tolerance and cycle_count < max_cycles:
+            _laplace_v_cycle(out, rhs, unknowns, smoothing_steps)
+            cycle_count += 1
+            residual = _laplace_residual(out, unknowns[0], rhs, r) / value_range
+    out = out.astype(src.dtype, copy=False)
+    if full_output:
+        return out, LaplaceResult(cycle_count, residual, residual <= tolerance)
+    return out
+
+
+def _laplace_v_cycle(u, rhs, unknowns, smoothing_steps):
+    unknown = unknowns[0]
+    if len(unknowns) == 1:
+        # the coarsest grid has at most 2 x 2 unknown cells or few unknown cells between known ones
+        _laplace_smooth(u, unknown, rhs, 50)
+        return
+    _laplace_smooth(u, unknown, rhs, smoothing_steps)
+    r = np.empty(u.shape, dtype=np.float64)
+    _laplace_residual(u, unknown, rhs, r)
+    coarse_h, coarse_w = unknowns[1].shape
+    # the coarse grid spacing is twice the fine one
+    coarse_rhs = 4.0 * gtr.downsample_2d(r, coarse_w, coarse_h, method=gtr.DS_MEAN)
+    coarse_e = np.zeros((coarse_h, coarse_w), dtype=np.float64)
+    _laplace_v_cycle(coarse_e, coarse_rhs, unknowns[1:], smoothing_steps)
+    e = gtr.upsample_2d(coarse_e, u.shape[1], u.shape[0], method=gtr.US_LINEAR)
+    u[unknown] += e[unknown]
+    _laplace_smooth(u, unknown, rhs, smoothing_steps)
+
+
+@jit(nopython=True, nogil=True, cache=True)
 def count_gaps(data):
     w = data.shape[-1]
     h = data.shape[-2]
@@ -59,65 +738,464 @@ def count_gaps(data):
     return gap_count
 
 
-@jit(nopython=True)
+@jit(nopython=True, nogil=True, cache=True)
 def is_gap(v):
     return not np.isfinite(v)
 
 
-@jit(nopython=True)
-def _apply_low_pass_filter(data, kernel, threshold):
+@jit(nopython=True, nogil=True, cache=True)
+def _init_lowpass_frontier(data, kernel):
+    """
+    Creates the state of the low-pass gap filling of *data*.
+
+    :param data: The data to gap-fill, a stack of 2-D grids of shape (time, height, width)
+    :param kernel: the weights of the neighbours, of shape (time, height, width)
+    :return: a tuple (frontier, next_frontier, values, filled, queued, frontier_size, gap_count), where
+        *frontier* holds the pixel indices of the gap pixels having a valid neighbour
+    """
     w = data.shape[-1]
     h = data.shape[-2]
-    out = data.copy()
-    kw = kernel.shape[-1]
-    kh = kernel.shape[-2]
-    kx0 = kw // 2
-    ky0 = kh // 2
+    t = data.shape[-3]
+
     gap_count = 0
+    for z in range(t):
+        gap_count += count_gaps(data[z])
+    # double-buffered frontier: pixel indices of the current and the next iteration
+    frontier = np.empty(gap_count, dtype=np.int64)
+    next_frontier = np.empty(gap_count, dtype=np.int64)
+    values = np.empty(gap_count, dtype=np.float64)
+    filled = np.empty(gap_count, dtype=np.bool_)
+    queued = np.zeros((t, h, w), dtype=np.bool_)
+    frontier_size = 0
+    for z in range(t):
+        for y in range(h):
+            for x in range(w):
+                if is_gap(data[z, y, x]) and _has_valid_neighbour(data, z, y, x, kernel.shape):
+                    queued[z, y, x] = True
+                    frontier[frontier_size] = (z * h + y) * w + x
+                    frontier_size += 1
+    return frontier, next_frontier, values, filled, queued, frontier_size, gap_count
+
+
+# This function creates a kernel which is JIT-compiled by Numba with nopython=True by gtr._get_kernel(), either
+# for a single thread or for multiple threads, which compute the frontier pixels in parallel.
+#
+def _fill_gaps_lowpass_kernel():
+    def kernel(data, weights, threshold, frontier, next_frontier, values, filled, queued, frontier_size):
+        """
+        Performs one iteration of the low-pass gap filling of *data* in place.
+
+        All frontier pixels are computed from the values of the previous iteration. The frontier of the next
+        iteration consists of the frontier pixels that could not be filled and the gap neighbours of the filled ones.
+
+        :param data: The data to gap-fill, a stack of 2-D grids of shape (time, height, width)
+        :param weights: the weights of the neighbours, of shape (time, height, width)
+        :param threshold: the minimum sum of the weights of the valid neighbours required to fill a pixel
+        :return: a tuple (fill_count, next_frontier_size)
+        """
+        w = data.shape[-1]
+        h = data.shape[-2]
+        t = data.shape[-3]
+        kw = weights.shape[-1]
+        kh = weights.shape[-2]
+        kt = weights.shape[-3]
+        kx0 = kw // 2
+        ky0 = kh // 2
+        kz0 = kt // 2
+
+        fill_count = 0
+        for j in prange(frontier_size):
+            z = frontier[j] // (h * w)
+            y = frontier[j] // w % h
+            x = frontier[j] % w
+            v_sum = 0.
+            k_sum = 0.
+            for kz in range(kt):
+                zz = z + kz - kz0
+                if 0 <= zz < t:
+                    for ky in range(kh):
+                        yy = y + ky - ky0
+                        if 0 <= yy < h:
+                            for kx in range(kw):
+                                xx = x + kx - kx0
+                                if 0 <= xx < w:
+                                    v = data[zz, yy, xx]
+                                    if not is_gap(v):
+                                        k = weights[kz, ky, kx]
+                                        v_sum += k * v
+                                        k_sum += k
+            filled[j] = k_sum != 0 and k_sum >= threshold
+            if filled[j]:
+                values[j] = v_sum / k_sum
+                fill_count += 1
+        if fill_count == 0:
+            return 0, frontier_size
+
+        next_frontier_size = 0
+        for j in range(frontier_size):
+            z = frontier[j] // (h * w)
+            y = frontier[j] // w % h
+            x = frontier[j] % w
+            if filled[j]:
+                data[z, y, x] = values[j]
+                queued[z, y, x] = False
+            else:
+                next_frontier[next_frontier_size] = frontier[j]
+                next_frontier_size += 1
+        for j in range(frontier_size):
+            if filled[j]:
+                z = frontier[j] // (h * w)
+                y = frontier[j] // w % h
+                x = frontier[j] % w
+                # the pixels whose kernel window contains the filled pixel
+                for kz in range(kt):
+                    zz = z - kz + kz0
+                    if 0 <= zz < t:
+                        for ky in range(kh):
+                            yy = y - ky + ky0
+                            if 0 <= yy < h:
+                                for kx in range(kw):
+                                    xx = x - kx + kx0
+                                    if 0 <= xx < w and not queued[zz, yy, xx] and is_gap(data[zz, yy, xx]):
+                                        queued[zz, yy, xx] = True
+                                        next_frontier[next_frontier_size] = (zz * h + yy) * w + xx
+                                        next_frontier_size += 1
+        return fill_count, next_frontier_size
+
+    return kernel
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _has_valid_neighbour(data, z, y, x, kernel_shape):
+    t, h, w = data.shape
+    kt, kh, kw = kernel_shape
+    for kz in range(kt):
+        zz = z + kz - kt // 2
+        if 0 <= zz < t:
+            for ky in range(kh):
+                yy = y + ky - kh // 2
+                if 0 <= yy < h:
+                    for kx in range(kw):
+                        xx = x + kx - kw // 2
+                        if 0 <= xx < w and not is_gap(data[zz, yy, xx]):
+                            return True
+    return False
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _distance_transform(data):
+    """
+    Computes the exact Euclidean distance transform of the gaps of *data* using the algorithm of
+    Felzenszwalb and Huttenlocher: a 1-D transform along the columns followed by the lower envelope of
+    parabolas along the rows.
+
+    :param data: The data with gaps
+    :return: a tuple (feature_y, feature_x) giving the indices of the nearest valid pixel of each pixel,
+        or -1 if there are no valid pixels
+    """
+    w = data.shape[-1]
+    h = data.shape[-2]
+    feature_y = np.full((h, w), -1, dtype=np.int64)
+    feature_x = np.full((h, w), -1, dtype=np.int64)
+
+    # nearest valid pixel within each column
+    column_y = np.full((h, w), -1, dtype=np.int64)
+    for x in range(w):
+        nearest_y = -1
+        for y in range(h):
+            if not is_gap(data[y, x]):
+                nearest_y = y
+            column_y[y, x] = nearest_y
+        nearest_y = -1
+        for y in range(h - 1, -1, -1):
+            if not is_gap(data[y, x]):
+                nearest_y = y
+            if nearest_y >= 0 and (column_y[y, x] < 0 or nearest_y - y < y - column_y[y, x]):
+                column_y[y, x] = nearest_y
+
+    # lower envelope of the parabolas (x - q)^2 + (y - column_y[y, q])^2 along each row
+    sites = np.empty(w, dtype=np.int64)
+    bounds = np.empty(w + 1, dtype=np.float64)
+    for y in range(h):
+        site_count = 0
+        for q in range(w):
+            if column_y[y, q] < 0:
+                continue
+            f_q = (y - column_y[y, q]) ** 2 + q * q
+            bound = -np.inf
+            while site_count > 0:
+                # the intersection of the parabolas of q and the last site
+                p = sites[site_count - 1]
+                bound = (f_q - (y - column_y[y, p]) ** 2 - p * p) / (2.0 * (q - p))
+                if bound > bounds[site_count - 1]:
+                    break
+                bound = -np.inf
+                site_count -= 1
+            bounds[site_count] = bound
+            sites[site_count] = q
+            site_count += 1
+        if site_count == 0:
+            continue
+        bounds[site_count] = np.inf
+        j = 0
+        for x in range(w):
+            while bounds[j + 1] < x:
+                j += 1
+            feature_y[y, x] = column_y[y, sites[j]]
+            feature_x[y, x] = sites[j]
+    return feature_y, feature_x
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _fill_gaps_nearest(data, feature_y, feature_x, k, power, max_distance, out):
+    """
+    Fills the gap pixels of *out* from the nearest valid pixels of *data* given by *feature_y* and *feature_x*.
+    If *k* > 1, the *k* nearest of the nearest valid pixels of the pixels within a distance of *k* are blended.
+    """
+    w = data.shape[-1]
+    h = data.shape[-2]
+    window_size = (2 * k + 1) * (2 * k + 1)
+    candidate_y = np.empty(window_size, dtype=np.int64)
+    candidate_x = np.empty(window_size, dtype=np.int64)
+    candidate_d = np.empty(window_size, dtype=np.float64)
     for y in range(h):
         for x in range(w):
-            v = data[y, x]
-            if is_gap(v):
-                v_sum = 0.
-                k_sum = 0.
-                for ky in range(kh):
-                    yy = y + ky - ky0
-                    if 0 <= yy < h:
-                        for kx in range(kw):
-                            xx = x + kx - kx0
-                            if 0 <= xx < w:
-                                v = data[yy, xx]
-                                if not is_gap(v):
-                                    k = kernel[ky, kx]
-                                    v_sum += k * v
-                                    k_sum += k
-                if k_sum != 0 and k_sum >= threshold:
-                    out[y, x] = v_sum / k_sum
+            if not is_gap(data[y, x]) or feature_y[y, x] < 0:
+                continue
+            dy = feature_y[y, x] - y
+            dx = feature_x[y, x] - x
+            if np.sqrt(dy * dy + dx * dx) > max_distance:
+                continue
+            if k == 1:
+                out[y, x] = data[feature_y[y, x], feature_x[y, x]]
+                continue
+            # collect the distinct nearest valid pixels of the window
+            candidate_count = 0
+            for yy in range(max(y - k, 0), min(y + k + 1, h)):
+                for xx in range(max(x - k, 0), min(x + k + 1, w)):
+                    fy = feature_y[yy, xx]
+                    fx = feature_x[yy, xx]
+                    known = False
+                    for j in range(candidate_count):
+                        if candidate_y[j] == fy and candidate_x[j] == fx:
+                            known = True
+                            break
+                    if not known:
+                        candidate_y[candidate_count] = fy
+                        candidate_x[candidate_count] = fx
+                        candidate_d[candidate_count] = np.sqrt((fy - y) ** 2 + (fx - x) ** 2)
+                        candidate_count += 1
+            # inverse distance weighted mean of the k nearest candidates, selected by a partial selection sort
+            v_sum = 0.
+            w_sum = 0.
+            for j in range(min(k, candidate_count)):
+                c = j
+                for i in range(j + 1, candidate_count):
+                    if candidate_d[i] < candidate_d[c]:
+                        c = i
+                candidate_y[j], candidate_y[c] = candidate_y[c], candidate_y[j]
+                candidate_x[j], candidate_x[c] = candidate_x[c], candidate_x[j]
+                candidate_d[j], candidate_d[c] = candidate_d[c], candidate_d[j]
+                weight = 1.0 / candidate_d[j] ** power
+                v_sum += weight * data[candidate_y[j], candidate_x[j]]
+                w_sum += weight
+            out[y, x] = v_sum / w_sum
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _gathered_cells_valid(src, cell_positions):
+    """
+    Tests whether the cells of the flattened grids of *src* that :py:func:`_gather_fill_values` gathers
+    according to *cell_positions* are all valid, where positions beyond the grid size refer to pyramid cells.
+    """
+    size = src.shape[-1]
+    for i in range(src.shape[0]):
+        for k in range(cell_positions.size):
+            p = cell_positions[k]
+            if p < size and is_gap(src[i, p]):
+                return False
+    return True
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _gather_fill_values(src, cell_indptr, cell_positions, cell_weights, gaps, indptr, positions, weights, out):
+    """
+    Fills the *gaps* of each flattened grid of *out*. First, the values of the pyramid cells are gathered from the
+    flattened grid of *src* and the preceding pyramid cells according to their table (*cell_indptr*,
+    *cell_positions*, *cell_weights*), where positions beyond the grid size refer to pyramid cells. Then the gaps
+    are gathered from the pyramid cells according to the table (*indptr*, *positions*, *weights*).
+    Gaps without any cells are set to NaN. The gathered grid cells must be valid, see
+    :py:func:`_gathered_cells_valid`.
+    """
+    size = src.shape[-1]
+    cells = np.empty(cell_indptr.size - 1, dtype=np.float64)
+    for i in range(src.shape[0]):
+        for j in range(cells.size):
+            v_sum = 0.
+            for k in range(cell_indptr[j], cell_indptr[j + 1]):
+                p = cell_positions[k]
+                v = src[i, p] if p < size else cells[p - size]
+                v_sum += cell_weights[k] * v
+            cells[j] = v_sum
+        for j in range(gaps.size):
+            if indptr[j] == indptr[j + 1]:
+                out[i, gaps[j]] = np.nan
+                continue
+            v_sum = 0.
+            for k in range(indptr[j], indptr[j + 1]):
+                v_sum += weights[k] * cells[positions[k]]
+            out[i, gaps[j]] = v_sum
+
+
+# This function creates a kernel which is JIT-compiled by Numba with nopython=True by gtr._get_kernel().
+#
+# The kernel computes the area-weighted mean of the valid cells of the cube *src* for each cell of the cube *out*.
+# Its time steps and rows are independent of each other so that they can be processed in parallel.
+#
+def _downsample_3d_kernel():
+    def kernel(src, z_index, z_weight, y_index, y_weight, x_index, x_weight, out):
+        out_t, out_h, out_w = out.shape
+        for row in prange(out_t * out_h):
+            out_z = row // out_h
+            out_y = row % out_h
+            src_z0 = z_index[out_z, 0]
+            src_z1 = z_index[out_z, 1]
+            src_y0 = y_index[out_y, 0]
+            src_y1 = y_index[out_y, 1]
+            for out_x in range(out_w):
+                src_x0 = x_index[out_x, 0]
+                src_x1 = x_index[out_x, 1]
+                w_sum = 0.
+                wv_sum = 0.
+                for src_z in range(src_z0, src_z1 + 1):
+                    wz = z_weight[out_z, 0] if src_z == src_z0 else z_weight[out_z, 1] if src_z == src_z1 else 1.0
+                    for src_y in range(src_y0, src_y1 + 1):
+                        wy = y_weight[out_y, 0] if src_y == src_y0 else y_weight[out_y, 1] if src_y == src_y1 else 1.0
+                        for src_x in range(src_x0, src_x1 + 1):
+                            v = src[src_z, src_y, src_x]
+                            if not is_gap(v):
+                                wx = x_weight[out_x, 0] if src_x == src_x0 \
+                                    else x_weight[out_x, 1] if src_x == src_x1 else 1.0
+                                w_sum += wz * wy * wx
+                                wv_sum += wz * wy * wx * v
+                if w_sum < gtr._EPS:
+                    out[out_z, out_y, out_x] = np.nan
                 else:
-                    gap_count += 1
+                    out[out_z, out_y, out_x] = wv_sum / w_sum
+        return out
+
+    return kernel
 
-    return out, gap_count
 
+# This function creates a kernel for the given interpolation method, which is JIT-compiled by Numba with
+# nopython=True by gtr._get_kernel().
+#
+# The kernel interpolates the cube *src* into the gap cells of the cube *out*. Like the one of
+# gtr._upsample_kernel(), linear interpolation falls back to the nearest cell if any of the interpolated cells
+# is a gap. Its time steps and rows are independent of each other so that they can be processed in parallel.
+#
+def _upsample_gaps_3d_kernel(method):
+    def kernel(src, z_index, z_weight, y_index, y_weight, x_index, x_weight, out):
+        if method != gtr.US_LINEAR and method != gtr.US_NEAREST:
+            raise ValueError('invalid upsampling method')
+        out_t, out_h, out_w = out.shape
+        for row in prange(out_t * out_h):
+            out_z = row // out_h
+            out_y = row % out_h
+            wz = z_weight[out_z]
+            wy = y_weight[out_y]
+            for out_x in range(out_w):
+                if not is_gap(out[out_z, out_y, out_x]):
+                    continue
+                wx = x_weight[out_x]
+                if method == gtr.US_LINEAR:
+                    z0 = z_index[out_z, 0]
+                    z1 = z_index[out_z, 1]
+                    y0 = y_index[out_y, 0]
+                    y1 = y_index[out_y, 1]
+                    x0 = x_index[out_x, 0]
+                    x1 = x_index[out_x, 1]
+                    v000 = src[z0, y0, x0]
+                    v001 = src[z0, y0, x1]
+                    v010 = src[z0, y1, x0]
+                    v011 = src[z0, y1, x1]
+                    v100 = src[z1, y0, x0]
+                    v101 = src[z1, y0, x1]
+                    v110 = src[z1, y1, x0]
+                    v111 = src[z1, y1, x1]
+                    if np.isfinite(v000 + v001 + v010 + v011 + v100 + v101 + v110 + v111):
+                        v00 = v000 + wx * (v001 - v000)
+                        v01 = v010 + wx * (v011 - v010)
+                        v10 = v100 + wx * (v101 - v100)
+                        v11 = v110 + wx * (v111 - v110)
+                        v0 = v00 + wy * (v01 - v00)
+                        v1 = v10 + wy * (v11 - v10)
+                        value = v0 + wz * (v1 - v0)
+                    else:
+                        # NEAREST according to weight
+                        value = src[z1 if wz >= 0.5 else z0, y1 if wy >= 0.5 else y0, x1 if wx >= 0.5 else x0]
+                else:
+                    value = src[z_index[out_z, 0], y_index[out_y, 0], x_index[out_x, 0]]
+                out[out_z, out_y, out_x] = value if np.isfinite(value) else np.nan
+        return out
+
+    return kernel
 
-@jit(nopython=True)
-def _fill_gaps(data, fill_data):
+
+@jit(nopython=True, nogil=True, cache=True)
+def _laplace_smooth(u, unknown, rhs, sweep_count):
+    """
+    Performs red-black Gauss-Seidel sweeps for the discrete Laplace equation n * u - sum(neighbours of u) = rhs
+    over the *unknown* pixels of *u*, where n is the number of neighbours inside the grid.
     """
-    Fills gap pixels by taking over values from a reduced resolution version of the grid.
+    w = u.shape[-1]
+    h = u.shape[-2]
+    for _ in range(sweep_count):
+        for color in range(2):
+            for y in range(h):
+                for x in range((y + color) % 2, w, 2):
+                    if unknown[y, x]:
+                        n, s = _laplace_neighbours(u, y, x)
+                        u[y, x] = (s + rhs[y, x]) / n
+
 
-    :param data: The data to gap-fill
-    :param fill_data: the data to take fill values from
-    :return: a raster using the old raster data array instance, but gap-filled
+@jit(nopython=True, nogil=True, cache=True)
+def _laplace_residual(u, unknown, rhs, r):
     """
-    out = data.copy()
-    w = out.shape[-1]
-    h = out.shape[-2]
-    gap_count = 0
+    Computes the residual *r* of the discrete Laplace equation over the *unknown* pixels of *u*.
+
+    :return: the maximum absolute residual
+    """
+    w = u.shape[-1]
+    h = u.shape[-2]
+    max_r = 0.0
     for y in range(h):
         for x in range(w):
-            if is_gap(out[y, x]):
-                v = fill_data[y, x]
-                if not is_gap(v):
-                    out[y, x] = v
-                else:
-                    gap_count += 1
-    return out, gap_count
+            if unknown[y, x]:
+                n, s = _laplace_neighbours(u, y, x)
+                r[y, x] = rhs[y, x] - (n * u[y, x] - s)
+                max_r = max(max_r, abs(r[y, x]))
+            else:
+                r[y, x] = 0.0
+    return max_r
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _laplace_neighbours(u, y, x):
+    w = u.shape[-1]
+    h = u.shape[-2]
+    n = 0
+    s = 0.0
+    if y > 0:
+        n += 1
+        s += u[y - 1, x]
+    if y < h - 1:
+        n += 1
+        s += u[y + 1, x]
+    if x > 0:
+        n += 1
+        s += u[y, x - 1]
+    if x < w - 1:
+        n += 1
+        s += u[y, x + 1]
+    return n, s
@@ -1,8 +1,13 @@
 # http://stackoverflow.com/questions/7075082/what-is-future-in-python-used-for-and-how-when-to-use-it-and-how-it-works
 from __future__ import division
 
+import os
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numba
 import numpy as np
-from numba import jit
+from numba import jit, prange
 
 #: Interpolation method for upsampling: Take nearest source grid cell, even if it is invalid.
 US_NEAREST = 10
@@ -13,8 +18,10 @@ US_LINEAR = 11
 DS_FIRST = 50
 #: Aggregation method for downsampling: Take last valid source grid cell, ignore contribution areas.
 DS_LAST = 51
-# DS_MIN = 52
-# DS_MAX = 53
+#: Aggregation method for downsampling: Take minimum of all valid source grid cells, ignore contribution areas.
+DS_MIN = 52
+#: Aggregation method for downsampling: Take maximum of all valid source grid cells, ignore contribution areas.
+DS_MAX = 53
 #: Aggregation method for downsampling: Compute average of all valid source grid cells,
 #: with weights given by contribution area.
 DS_MEAN = 54
@@ -30,14 +37,50 @@ DS_VAR = 57
 #: of variance
 #: (see https://en.wikipedia.org/wiki/Mean_square_weighted_deviation), with weights given by contribution area.
 DS_STD = 58
+#: Aggregation method for downsampling: Count the valid source grid cells contributing to a target grid cell.
+#: The default output type is float64.
+DS_COUNT = 59
+#: Aggregation method for downsampling: Compute the fraction of the area of a target grid cell that is covered
+#: by valid source grid cells. The default output type is float64.
+DS_COVERAGE = 60
+
+#: Aggregation methods supported by downsample_stats_2d()
+_STATS_METHODS = (DS_FIRST, DS_LAST, DS_MIN, DS_MAX, DS_MEAN, DS_VAR, DS_STD, DS_COUNT, DS_COVERAGE)
 
 #: Constant indicating an empty 2-D mask
 _NOMASK2D = np.ma.getmaskarray(np.ma.array([[0]], mask=[[0]]))
+#: Constant indicating an empty mask for a stack of 2-D grids
+_NOMASK3D = np.ma.getmaskarray(np.ma.array([[[0]]], mask=[[[0]]]))
 
 _EPS = 1e-10
 
+#: Integer grid types for which DS_MODE uses a dense histogram of all possible values
+_HISTOGRAM_DTYPES = (np.dtype(np.uint8), np.dtype(np.uint16))
+
+#: Minimum number of source grid cells per target grid cell from which on
+#: DS_MODE uses a dense histogram for the types in _HISTOGRAM_DTYPES
+_HISTOGRAM_MIN_CELL_COUNT = 8
+
+#: Constant indicating that no class fractions are computed
+_NOFRACTIONS = np.zeros((0, 0, 0, 0), dtype=np.float64)
+
+#: Constant indicating that no output mask is computed
+_NOOUTMASK = np.zeros((0, 0, 0), dtype=np.bool_)
+
+#: Minimum number of source grid cells per target grid cell from which on
+#: DS_MEAN, DS_VAR, and DS_STD are computed using integral images
+_INTEGRAL_MIN_CELL_COUNT = 64
+
+#: Number of target grid rows computed in one piece by the fused kernel for mixed resampling,
+#: which keeps the two most recently aggregated intermediate rows
+_FUSED_ROW_COUNT = 32
+
+#: Maximum number of resampling plans cached by get_resampling_plan()
+_PLAN_CACHE_SIZE = 256
 
-def resample_2d(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=None, mode_rank=1, out=None):
+
+def resample_2d(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=None, mode_rank=1, out=None,
+                parallel=False, num_threads=None, out_mask=None, assume_valid=False):
     """
     Resample a 2-D grid to a new resolution.
 
@@ -60,18 +103,34 @@ def resample_2d(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=No
     :param out: 2-D *ndarray*, optional
         Alternate output array in which to place the result. The default is *None*; if provided, it must have the same
         shape as the expected output.
+    :param parallel: *bool*, optional
+        If ``True``, the rows of the output grid are computed by multiple threads. The result is identical
+        to the one computed by a single thread.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``. Defaults to Numba's current setting,
+        which can be limited by the environment variable ``NUMBA_NUM_THREADS``.
+    :param out_mask: 2-D boolean *ndarray*, optional
+        Alternate output array in which to mark the target grid cells without valid source grid cells, which are
+        set to *fill_value*. If provided, it must have the same shape as the expected output.
+    :param assume_valid: *bool*, optional
+        If ``True``, all cells of *src* are assumed to be finite and not masked, so that the resampling kernels
+        skip testing them for validity. The result is undefined if *src* has invalid cells.
     :return: An resampled version of the *src* array.
     """
-    out = _get_out(out, src, (h, w))
-    if out is None:
+    out = _get_out(out, src, (h, w), ds_method)
+    if out is None or out.shape == src.shape:
         return src
     mask, use_mask = _get_mask(src)
     fill_value = _get_fill_value(fill_value, src, out)
-    return _mask_or_not(_resample_2d(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out),
-                        src, fill_value)
+    out_mask = _get_out_mask(out_mask, src, out)
+    with _num_threads(num_threads):
+        _resample(_as_stack(src), _as_stack(mask), use_mask, ds_method, us_method, fill_value, mode_rank,
+                  _as_stack(out), parallel, _as_stack(out_mask), assume_valid)
+    return _mask_or_not(out, src, fill_value, out_mask)
 
 
-def upsample_2d(src, w, h, method=US_LINEAR, fill_value=None, out=None):
+def upsample_2d(src, w, h, method=US_LINEAR, fill_value=None, out=None, parallel=False, num_threads=None,
+                out_mask=None, assume_valid=False):
     """
     Upsample a 2-D grid to a higher resolution by interpolating original grid cells.
 
@@ -89,17 +148,34 @@ def upsample_2d(src, w, h, method=US_LINEAR, fill_value=None, out=None):
     :param out: 2-D *ndarray*, optional
         Alternate output array in which to place the result. The default is *None*; if provided, it must have the same
         shape as the expected output.
+    :param parallel: *bool*, optional
+        If ``True``, the rows of the output grid are computed by multiple threads. The result is identical
+        to the one computed by a single thread.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``. Defaults to Numba's current setting,
+        which can be limited by the environment variable ``NUMBA_NUM_THREADS``.
+    :param out_mask: 2-D boolean *ndarray*, optional
+        Alternate output array in which to mark the target grid cells without valid source grid cells, which are
+        set to *fill_value*. If provided, it must have the same shape as the expected output.
+    :param assume_valid: *bool*, optional
+        If ``True``, all cells of *src* are assumed to be finite and not masked, so that the resampling kernels
+        skip testing them for validity. The result is undefined if *src* has invalid cells.
     :return: An upsampled version of the *src* array.
     """
     out = _get_out(out, src, (h, w))
-    if out is None:
+    if out is None or out.shape == src.shape:
         return src
     mask, use_mask = _get_mask(src)
     fill_value = _get_fill_value(fill_value, src, out)
-    return _mask_or_not(_upsample_2d(src, mask, use_mask, method, fill_value, out), src, fill_value)
+    out_mask = _get_out_mask(out_mask, src, out)
+    with _num_threads(num_threads):
+        _upsample(_as_stack(src), _as_stack(mask), use_mask, method, fill_value, _as_stack(out), parallel,
+                  _as_stack(out_mask), assume_valid)
+    return _mask_or_not(out, src, fill_value, out_mask)
 
 
-def downsample_2d(src, w, h, method=DS_MEAN, fill_value=None, mode_rank=1, out=None):
+def downsample_2d(src, w, h, method=DS_MEAN, fill_value=None, mode_rank=1, out=None,
+                  parallel=False, num_threads=None, out_mask=None, assume_valid=False):
     """
     Downsample a 2-D grid to a lower resolution by aggregating original grid cells.
 
@@ -120,21 +196,882 @@ def downsample_2d(src, w, h, method=DS_MEAN, fill_value=None, mode_rank=1, out=N
     :param out: 2-D *ndarray*, optional
         Alternate output array in which to place the result. The default is *None*; if provided, it must have the same
         shape as the expected output.
+    :param parallel: *bool*, optional
+        If ``True``, the rows of the output grid are computed by multiple threads. The result is identical
+        to the one computed by a single thread.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``. Defaults to Numba's current setting,
+        which can be limited by the environment variable ``NUMBA_NUM_THREADS``.
+    :param out_mask: 2-D boolean *ndarray*, optional
+        Alternate output array in which to mark the target grid cells without valid source grid cells, which are
+        set to *fill_value*. If provided, it must have the same shape as the expected output.
+    :param assume_valid: *bool*, optional
+        If ``True``, all cells of *src* are assumed to be finite and not masked, so that the resampling kernels
+        skip testing them for validity. The result is undefined if *src* has invalid cells.
     :return: A downsampled version of the *src* array.
     """
     if method == DS_MODE and mode_rank < 1:
         raise ValueError('mode_rank must be >= 1')
-    out = _get_out(out, src, (h, w))
-    if out is None:
+    out = _get_out(out, src, (h, w), method)
+    if out is None or out.shape == src.shape:
         return src
     mask, use_mask = _get_mask(src)
     fill_value = _get_fill_value(fill_value, src, out)
-    return _mask_or_not(_downsample_2d(src, mask, use_mask, method, fill_value, mode_rank, out), src, fill_value)
+    out_mask = _get_out_mask(out_mask, src, out)
+    with _num_threads(num_threads):
+        _downsample(_as_stack(src), _as_stack(mask), use_mask, method, fill_value, mode_rank,
+                    _as_stack(out), parallel, _as_stack(out_mask), assume_valid)
+    return _mask_or_not(out, src, fill_value, out_mask)
+
+
+def downsample_2d_stream(rows, src_h, w, h, method=DS_MEAN, fill_value=None, mode_rank=1,
+                         parallel=False, num_threads=None):
+    """
+    Downsample a 2-D grid delivered as a sequence of rows to a lower resolution by aggregating original grid cells.
+
+    The target grid rows are generated as soon as all source grid rows contributing to them, including the
+    partially contributing ones at their borders, have been received. Only these source grid rows are kept in
+    memory. The result is the same as the one of :py:func:`downsample_2d`.
+
+    :param rows: iterable of 1-D *ndarray*s (single rows) or 2-D *ndarray*s (blocks of rows) of the source grid,
+        in top to bottom order. The rows may be masked arrays.
+    :param src_h: *int*
+        The total number of source grid rows
+    :param w: *int*
+        Grid width, which must be less than or equal to the width of the source grid rows
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src_h*
+    :param method: one of the *DS_* constants, optional
+        Grid cell aggregation method
+    :param fill_value: *scalar*, optional
+        The value of invalid target grid cells. If ``None``, it is taken from the first rows if they are
+        a masked array, otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        The rank of the frequency determined by the *method* ``DS_MODE``. One (the default) means
+        most frequent value, zwo means second most frequent value, and so forth.
+    :param parallel: *bool*, optional
+        If ``True``, the target grid rows are computed by multiple threads.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``.
+    :return: A generator of the target grid rows, each a 1-D *ndarray* of size *w*. Once masked rows have
+        been received, the target grid rows are masked arrays, whose invalid cells are masked.
+    """
+    if method == DS_MODE and mode_rank < 1:
+        raise ValueError('mode_rank must be >= 1')
+    if h > src_h:
+        raise ValueError("invalid target size")
+    plan = None
+    data_blocks = []
+    mask_blocks = []
+    use_mask = False
+    masked = False
+    buffer_y0 = 0
+    received = 0
+    dst_y0 = 0
+    for block in rows:
+        if np.ndim(block) == 1:
+            block = block[np.newaxis]
+        if plan is None:
+            if w > block.shape[-1]:
+                raise ValueError("invalid target size")
+            plan = get_resampling_plan((src_h, block.shape[-1]), (h, w), ds_method=method)
+            fill_value = _get_fill_value(fill_value, block, None)
+        elif block.shape[-1] != plan.src_shape[-1]:
+            raise ValueError("all rows must have the same size")
+        if received + block.shape[0] > src_h:
+            raise ValueError("more than 'src_h' rows received")
+        mask, block_use_mask = _get_mask(block)
+        use_mask = use_mask or block_use_mask
+        masked = masked or isinstance(block, np.ma.MaskedArray)
+        data_blocks.append(np.ma.getdata(block))
+        mask_blocks.append(mask if block_use_mask else None)
+        received += block.shape[0]
+        dst_y1 = dst_y0
+        while dst_y1 < h and plan.source_rows(dst_y1, dst_y1 + 1)[1] <= received:
+            dst_y1 += 1
+        if dst_y1 == dst_y0:
+            continue
+        src_data = np.concatenate(data_blocks)
+        src_mask = _concatenate_masks(data_blocks, mask_blocks) if use_mask else _NOMASK2D
+        out = np.zeros((dst_y1 - dst_y0, w), dtype=_get_out_dtype(src_data.dtype, plan.src_shape, (h, w), method))
+        out_mask = np.zeros(out.shape, dtype=np.bool_) if masked else None
+        src_y0, src_y1 = plan.source_rows(dst_y0, dst_y1)
+        with _num_threads(num_threads):
+            out = plan._resample(_as_stack(src_data[src_y0 - buffer_y0:src_y1 - buffer_y0]),
+                                 _as_stack(src_mask[src_y0 - buffer_y0:src_y1 - buffer_y0] if use_mask else src_mask),
+                                 use_mask, fill_value, mode_rank, _as_stack(out), parallel, dst_y0=dst_y0,
+                                 out_mask=_as_stack(out_mask))[0]
+        if masked:
+            out = np.ma.MaskedArray(out, mask=out_mask, copy=False)
+            out.set_fill_value(fill_value)
+        for out_row in out:
+            yield out_row
+        dst_y0 = dst_y1
+        # keep only the source grid rows contributing to the next target grid rows
+        next_y0 = plan.source_rows(dst_y0, dst_y0 + 1)[0] if dst_y0 < h else received
+        data_blocks = [src_data[next_y0 - buffer_y0:]]
+        mask_blocks = [src_mask[next_y0 - buffer_y0:] if use_mask else None]
+        buffer_y0 = next_y0
+    if received < src_h:
+        raise ValueError("less than 'src_h' rows received")
+
+
+def resample_nd(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=None, mode_rank=1, out=None,
+                parallel=False, num_threads=None, out_mask=None, assume_valid=False):
+    """
+    Resample a stack of 2-D grids to a new resolution. All grids are resampled within a single
+    JIT-compiled call, where the grid cell geometry is computed only once for the whole stack.
+
+    :param src: N-D *ndarray* of shape (..., height, width), e.g. a time series of grids
+    :param w: *int*
+        New grid width
+    :param h:  *int*
+        New grid height
+    :param ds_method: one of the *DS_* constants, optional
+        Grid cell aggregation method for a possible downsampling
+    :param us_method: one of the *US_* constants, optional
+        Grid cell interpolation method for a possible upsampling
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        The rank of the frequency determined by the *ds_method* ``DS_MODE``. One (the default) means
+        most frequent value, zwo means second most frequent value, and so forth.
+    :param out: N-D *ndarray*, optional
+        Alternate output array in which to place the result. The default is *None*; if provided, it must have the same
+        shape as the expected output.
+    :param parallel: *bool*, optional
+        If ``True``, the rows of the output grid are computed by multiple threads. The result is identical
+        to the one computed by a single thread.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``. Defaults to Numba's current setting,
+        which can be limited by the environment variable ``NUMBA_NUM_THREADS``.
+    :param out_mask: N-D boolean *ndarray*, optional
+        Alternate output array in which to mark the target grid cells without valid source grid cells, which are
+        set to *fill_value*. If provided, it must have the same shape as the expected output.
+    :param assume_valid: *bool*, optional
+        If ``True``, all cells of *src* are assumed to be finite and not masked, so that the resampling kernels
+        skip testing them for validity. The result is undefined if *src* has invalid cells.
+    :return: An resampled version of the *src* array.
+    """
+    out = _get_out(out, src, src.shape[:-2] + (h, w), ds_method)
+    if out is None or out.shape == src.shape:
+        return src
+    fill_value = _get_fill_value(fill_value, src, out)
+    out_mask = _get_out_mask(out_mask, src, out)
+    src_3d, mask_3d, use_mask, out_3d = _get_nd_args(src, out)
+    out_mask_3d = _get_nd_out_mask(out_mask)
+    with _num_threads(num_threads):
+        _resample(src_3d, mask_3d, use_mask, ds_method, us_method, fill_value, mode_rank, out_3d, parallel,
+                  out_mask_3d, assume_valid)
+    return _mask_or_not(_set_nd_out(out, out_3d), src, fill_value, _set_nd_out(out_mask, out_mask_3d))
+
+
+def upsample_nd(src, w, h, method=US_LINEAR, fill_value=None, out=None, parallel=False, num_threads=None,
+                out_mask=None, assume_valid=False):
+    """
+    Upsample a stack of 2-D grids to a higher resolution by interpolating original grid cells.
+    All grids are upsampled within a single JIT-compiled call, where the grid cell geometry
+    is computed only once for the whole stack.
+
+    :param src: N-D *ndarray* of shape (..., height, width), e.g. a time series of grids
+    :param w: *int*
+        Grid width, which must be greater than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be greater than or equal to *src.shape[-2]*
+    :param method: one of the *US_* constants, optional
+        Grid cell interpolation method
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param out: N-D *ndarray*, optional
+        Alternate output array in which to place the result. The default is *None*; if provided, it must have the same
+        shape as the expected output.
+    :param parallel: *bool*, optional
+        If ``True``, the rows of the output grid are computed by multiple threads. The result is identical
+        to the one computed by a single thread.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``. Defaults to Numba's current setting,
+        which can be limited by the environment variable ``NUMBA_NUM_THREADS``.
+    :param out_mask: N-D boolean *ndarray*, optional
+        Alternate output array in which to mark the target grid cells without valid source grid cells, which are
+        set to *fill_value*. If provided, it must have the same shape as the expected output.
+    :param assume_valid: *bool*, optional
+        If ``True``, all cells of *src* are assumed to be finite and not masked, so that the resampling kernels
+        skip testing them for validity. The result is undefined if *src* has invalid cells.
+    :return: An upsampled version of the *src* array.
+    """
+    out = _get_out(out, src, src.shape[:-2] + (h, w))
+    if out is None or out.shape == src.shape:
+        return src
+    fill_value = _get_fill_value(fill_value, src, out)
+    out_mask = _get_out_mask(out_mask, src, out)
+    src_3d, mask_3d, use_mask, out_3d = _get_nd_args(src, out)
+    out_mask_3d = _get_nd_out_mask(out_mask)
+    with _num_threads(num_threads):
+        _upsample(src_3d, mask_3d, use_mask, method, fill_value, out_3d, parallel, out_mask_3d, assume_valid)
+    return _mask_or_not(_set_nd_out(out, out_3d), src, fill_value, _set_nd_out(out_mask, out_mask_3d))
+
+
+def downsample_nd(src, w, h, method=DS_MEAN, fill_value=None, mode_rank=1, out=None,
+                  parallel=False, num_threads=None, out_mask=None, assume_valid=False):
+    """
+    Downsample a stack of 2-D grids to a lower resolution by aggregating original grid cells.
+    All grids are downsampled within a single JIT-compiled call, where the grid cell geometry
+    is computed only once for the whole stack.
+
+    :param src: N-D *ndarray* of shape (..., height, width), e.g. a time series of grids
+    :param w: *int*
+        Grid width, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src.shape[-2]*
+    :param method: one of the *DS_* constants, optional
+        Grid cell aggregation method
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        The rank of the frequency determined by the *method* ``DS_MODE``. One (the default) means
+        most frequent value, zwo means second most frequent value, and so forth.
+    :param out: N-D *ndarray*, optional
+        Alternate output array in which to place the result. The default is *None*; if provided, it must have the same
+        shape as the expected output.
+    :param parallel: *bool*, optional
+        If ``True``, the rows of the output grid are computed by multiple threads. The result is identical
+        to the one computed by a single thread.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``. Defaults to Numba's current setting,
+        which can be limited by the environment variable ``NUMBA_NUM_THREADS``.
+    :param out_mask: N-D boolean *ndarray*, optional
+        Alternate output array in which to mark the target grid cells without valid source grid cells, which are
+        set to *fill_value*. If provided, it must have the same shape as the expected output.
+    :param assume_valid: *bool*, optional
+        If ``True``, all cells of *src* are assumed to be finite and not masked, so that the resampling kernels
+        skip testing them for validity. The result is undefined if *src* has invalid cells.
+    :return: A downsampled version of the *src* array.
+    """
+    if method == DS_MODE and mode_rank < 1:
+        raise ValueError('mode_rank must be >= 1')
+    out = _get_out(out, src, src.shape[:-2] + (h, w), method)
+    if out is None or out.shape == src.shape:
+        return src
+    fill_value = _get_fill_value(fill_value, src, out)
+    out_mask = _get_out_mask(out_mask, src, out)
+    src_3d, mask_3d, use_mask, out_3d = _get_nd_args(src, out)
+    out_mask_3d = _get_nd_out_mask(out_mask)
+    with _num_threads(num_threads):
+        _downsample(src_3d, mask_3d, use_mask, method, fill_value, mode_rank, out_3d, parallel, out_mask_3d,
+                    assume_valid)
+    return _mask_or_not(_set_nd_out(out, out_3d), src, fill_value, _set_nd_out(out_mask, out_mask_3d))
 
 
-def _get_out(out, src, shape):
+def downsample_classes_2d(src, w, h, class_count=None, mode_rank=1, fill_value=None, out=None, out_fractions=None,
+                          parallel=False, num_threads=None):
+    """
+    Downsample a 2-D grid of class values, e.g. surface types, to a lower resolution. In a single pass,
+    computes the most frequently seen class of each target grid cell as method ``DS_MODE`` does, and
+    the area fractions of all classes.
+
+    :param src: 2-D *ndarray* of non-negative integer class values
+    :param w: *int*
+        Grid width, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src.shape[-2]*
+    :param class_count: *int*, optional
+        The number of classes. Source grid cells whose value is not less than *class_count* are ignored.
+        Defaults to 256 for ``uint8`` and to 65536 for ``uint16`` grids, must be given for other integer types.
+    :param mode_rank: *scalar*, optional
+        The rank of the frequency of the class to be determined. One (the default) means
+        most frequent class, zwo means second most frequent class, and so forth.
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param out: 2-D *ndarray*, optional
+        Alternate output array in which to place the classes. The default is *None*; if provided, it must have
+        the shape (h, w).
+    :param out_fractions: 3-D *ndarray*, optional
+        Alternate output array in which to place the class fractions. The default is *None*; if provided, it must
+        have the shape (class_count, h, w).
+    :param parallel: *bool*, optional
+        If ``True``, the rows of the output grid are computed by multiple threads.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``.
+    :return: a tuple (classes, fractions), where *classes* is the downsampled version of the *src* array and
+        *fractions* is an array of shape (class_count, h, w) holding the fraction of the valid area of each
+        target grid cell that is covered by a given class.
+    """
+    if not np.issubdtype(src.dtype, np.integer):
+        raise ValueError("'src' must be an integer grid")
+    if class_count is None:
+        if src.dtype not in _HISTOGRAM_DTYPES:
+            raise ValueError("'class_count' must be given for grids of type %s" % src.dtype)
+        class_count = _get_class_count(src.dtype)
+    if mode_rank < 1:
+        raise ValueError('mode_rank must be >= 1')
+    src_h, src_w = src.shape
+    if w > src_w or h > src_h:
+        raise ValueError("invalid target size")
     if out is None:
-        return np.zeros(shape, dtype=src.dtype)
+        out = np.zeros((h, w), dtype=src.dtype)
+    elif out.shape != (h, w):
+        raise ValueError("'shape' and 'out' are incompatible")
+    if out_fractions is None:
+        out_fractions = np.zeros((class_count, h, w), dtype=np.float64)
+    elif out_fractions.shape != (class_count, h, w):
+        raise ValueError("'class_count', 'shape', and 'out_fractions' are incompatible")
+    else:
+        out_fractions[...] = 0
+    mask, use_mask = _get_mask(src)
+    fill_value = _get_fill_value(fill_value, src, out)
+    y_index, y_weight = _downsample_axis(src_h, h, True)
+    x_index, x_weight = _downsample_axis(src_w, w, True)
+    out_mask = _get_out_mask(None, src, out)
+    kernel = _get_kernel(_downsample_histogram_kernel, parallel, use_mask)
+    with _num_threads(num_threads):
+        kernel(_as_stack(src), _as_stack(mask), class_count, mode_rank, fill_value,
+               y_index, y_weight, x_index, x_weight, _as_stack(out), out_fractions[np.newaxis], _as_stack(out_mask))
+    return _mask_or_not(out, src, fill_value, out_mask), out_fractions
+
+
+def downsample_stats_2d(src, w, h, stats=(DS_MEAN, DS_STD), fill_value=None, out=None,
+                        parallel=False, num_threads=None):
+    """
+    Downsample a 2-D grid to a lower resolution by computing multiple statistics of the original grid cells.
+    All statistics are computed in a single traversal of the source grid.
+
+    :param src: 2-D *ndarray*
+    :param w: *int*
+        Grid width, which must be less than or equal to *src.shape[-1]*
+    :param h:  *int*
+        Grid height, which must be less than or equal to *src.shape[-2]*
+    :param stats: sequence of the *DS_* constants
+        ``DS_FIRST``, ``DS_LAST``, ``DS_MIN``, ``DS_MAX``, ``DS_MEAN``, ``DS_VAR``, ``DS_STD``, ``DS_COUNT``,
+        and ``DS_COVERAGE``
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+        ``DS_COUNT`` and ``DS_COVERAGE`` are zero for target grid cells without valid source grid cells.
+    :param out: 3-D *ndarray*, optional
+        Alternate output array in which to place the result. The default is *None*; if provided, it must have the
+        shape (len(stats), h, w).
+    :param parallel: *bool*, optional
+        If ``True``, the rows of the output grid are computed by multiple threads.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``.
+    :return: An array of shape (len(stats), h, w) holding the downsampled versions of the *src* array,
+        one for each of the *stats*.
+    """
+    stats = np.array(stats, dtype=np.int64).reshape((-1,))
+    for method in stats:
+        if method not in _STATS_METHODS:
+            raise ValueError('invalid downsampling method')
+    src_h, src_w = src.shape
+    if w > src_w or h > src_h:
+        raise ValueError("invalid target size")
+    if out is None:
+        out = np.zeros((len(stats), h, w), dtype=np.float64)
+    elif out.shape != (len(stats), h, w):
+        raise ValueError("'stats', 'shape', and 'out' are incompatible")
+    mask, use_mask = _get_mask(src)
+    fill_value = _get_fill_value(fill_value, src, out)
+    y_index, y_weight = _downsample_axis(src_h, h, True)
+    x_index, x_weight = _downsample_axis(src_w, w, True)
+    out_mask = _get_out_mask(None, src, out)
+    out_mask_4d = _NOOUTMASK[np.newaxis] if out_mask is None else out_mask[:, np.newaxis]
+    kernel = _get_kernel(_downsample_stats_kernel, parallel, use_mask)
+    with _num_threads(num_threads):
+        kernel(_as_stack(src), _as_stack(mask), stats, fill_value,
+               y_index, y_weight, x_index, x_weight, np.ma.getdata(out)[:, np.newaxis], out_mask_4d)
+    return _mask_or_not(out, src, fill_value, out_mask)
+
+
+def resample_2d_tiled(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=None, mode_rank=1, out=None,
+                      max_memory=256 * 1024 * 1024, parallel=False, num_threads=None):
+    """
+    Resample a 2-D grid that may not fit into memory to a new resolution.
+
+    The target grid is computed in bands of rows. Only the source grid rows contributing to the current band are
+    read into memory, so that *src* and *out* can be memory-mapped arrays or ``.npy`` files of arbitrary size.
+    The result is the same as the one of :py:func:`resample_2d`.
+
+    :param src: 2-D *ndarray*, e.g. a ``numpy.memmap``, or the path of a ``.npy`` file
+    :param w: *int*
+        New grid width
+    :param h:  *int*
+        New grid height
+    :param ds_method: one of the *DS_* constants, optional
+        Grid cell aggregation method for a possible downsampling
+    :param us_method: one of the *US_* constants, optional
+        Grid cell interpolation method for a possible upsampling
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise from *out* if it is a masked array,
+        otherwise numpy's default value is used.
+    :param mode_rank: *scalar*, optional
+        The rank of the frequency determined by the *ds_method* ``DS_MODE``. One (the default) means
+        most frequent value, zwo means second most frequent value, and so forth.
+    :param out: 2-D *ndarray*, optional
+        Alternate output array in which to place the result, e.g. a ``numpy.memmap``, or the path of a ``.npy``
+        file to be created. The default is *None*; if provided, it must have the same shape as the expected output.
+    :param max_memory: *int*, optional
+        The approximate number of bytes used for the source and target grid rows of a band.
+        At least one target grid row is computed at a time.
+    :param parallel: *bool*, optional
+        If ``True``, the rows of each band are computed by multiple threads.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``.
+    :return: An resampled version of the *src* array.
+    """
+    if isinstance(src, (str, os.PathLike)):
+        src = np.load(src, mmap_mode='r')
+    dtype = _get_out_dtype(src.dtype, src.shape, (h, w), ds_method)
+    if isinstance(out, (str, os.PathLike)):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=(h, w))
+    elif out is None:
+        if src.shape == (h, w):
+            return src
+        out = np.zeros((h, w), dtype=dtype)
+    elif out.shape != (h, w):
+        raise ValueError("'shape' and 'out' are incompatible")
+    mask, use_mask = _get_mask(src)
+    fill_value = _get_fill_value(fill_value, src, out)
+    out_mask = _get_out_mask(None, src, out)
+    src_data = np.ma.getdata(src)
+    out_data = np.ma.getdata(out)
+    plan = get_resampling_plan(src.shape, (h, w), ds_method=ds_method, us_method=us_method)
+    band_height = _get_band_height(plan, src.dtype.itemsize, out.dtype.itemsize, use_mask, max_memory)
+    with _num_threads(num_threads):
+        for y0 in range(0, h, band_height):
+            y1 = min(y0 + band_height, h)
+            src_y0, src_y1 = plan.source_rows(y0, y1)
+            src_band = np.array(src_data[src_y0:src_y1])
+            mask_band = np.array(mask[src_y0:src_y1]) if use_mask else mask
+            out_band = np.zeros((y1 - y0, w), dtype=out.dtype)
+            result = plan._resample(_as_stack(src_band), _as_stack(mask_band), use_mask, fill_value, mode_rank,
+                                    _as_stack(out_band), parallel, dst_y0=y0,
+                                    out_mask=None if out_mask is None else _as_stack(out_mask[y0:y1]))
+            out_data[y0:y1] = result[0]
+            if isinstance(out_data, np.memmap):
+                out_data.flush()
+    return _mask_or_not(out, src, fill_value, out_mask)
+
+
+def resample_nd_dask(src, w, h, ds_method=DS_MEAN, us_method=US_LINEAR, fill_value=None, mode_rank=1, chunks=None):
+    """
+    Lazily resample a dask array of 2-D grids of shape (..., height, width) to a new resolution.
+
+    The target grid is chunked like the source grid, scaled to the new resolution. Each target chunk is computed
+    from the window of source grid cells contributing to it, including the partially contributing ones at its
+    borders, so that the result is the same as the one of :py:func:`resample_nd` for any chunking. The exception
+    are DS_MEAN, DS_VAR and DS_STD for large downsampling factors, which are computed from integral images whose
+    rounding depends on the window, so that they may differ in the last digits. The chunks are computed in parallel
+    by any dask scheduler, e.g. ``result.compute(scheduler='threads')`` or ``result.compute(scheduler='processes')``.
+    Requires the ``dask`` package.
+
+    For an ``xarray.DataArray``, pass its ``data`` attribute.
+
+    :param src: *dask.array.Array* or *ndarray* with at least two dimensions
+    :param w: *int*
+        New grid width
+    :param h:  *int*
+        New grid height
+    :param ds_method: one of the *DS_* constants, optional
+        Grid cell aggregation method for a possible downsampling
+    :param us_method: one of the *US_* constants, optional
+        Grid cell interpolation method for a possible upsampling
+    :param fill_value: *scalar*, optional
+        If ``None``, numpy's default value for the source data type is used.
+    :param mode_rank: *scalar*, optional
+        The rank of the frequency determined by the *ds_method* ``DS_MODE``. One (the default) means
+        most frequent value, zwo means second most frequent value, and so forth.
+    :param chunks: optional
+        The chunks used to convert *src* into a dask array, if it is not already one.
+    :return: A lazy, resampled version of the *src* array as *dask.array.Array*.
+    """
+    import dask.array as da
+
+    if not isinstance(src, da.Array):
+        src = da.from_array(src, chunks='auto' if chunks is None else chunks)
+    if src.ndim < 2:
+        raise ValueError("'src' must have at least two dimensions")
+    if ds_method == DS_MODE and mode_rank < 1:
+        raise ValueError('mode_rank must be >= 1')
+    if src.shape[-2:] == (h, w):
+        return src
+    fill_value = _get_fill_value(fill_value, np.zeros(0, dtype=src.dtype), None)
+    plan = get_resampling_plan(src.shape, (h, w), ds_method=ds_method, us_method=us_method)
+    blocks = []
+    for dst_y0, dst_y1 in _get_chunk_ranges(src.chunks[-2], h):
+        src_y0, src_y1 = plan.source_rows(dst_y0, dst_y1)
+        row = []
+        for dst_x0, dst_x1 in _get_chunk_ranges(src.chunks[-1], w):
+            src_x0, src_x1 = plan.source_cols(dst_x0, dst_x1)
+            window = src[..., src_y0:src_y1, src_x0:src_x1].rechunk({-2: -1, -1: -1})
+            row.append(window.map_blocks(_resample_window, plan, dst_y0, dst_x0, (dst_y1 - dst_y0, dst_x1 - dst_x0),
+                                         fill_value, mode_rank,
+                                         dtype=_get_out_dtype(src.dtype, src.shape, (h, w), ds_method),
+                                         chunks=window.chunks[:-2] + ((dst_y1 - dst_y0,), (dst_x1 - dst_x0,))))
+        blocks.append(row)
+    return da.block(blocks)
+
+
+def build_pyramid(src, levels=None, method=DS_MEAN, fill_value=None, out=None, parallel=False, num_threads=None):
+    """
+    Build an overview pyramid of a 2-D grid by repeatedly downsampling it by a factor of two.
+
+    Level *k* (starting at one) has the shape ``(ceil(height / 2**k), ceil(width / 2**k))``. Each of its grid cells
+    aggregates the block of 2**k x 2**k source grid cells it covers, clipped at the right and bottom borders.
+    Every level is derived from the previous one, so the source grid is read only once. The level values are
+    nevertheless exact, because the number of valid source grid cells, their mean, and, for ``DS_VAR`` and
+    ``DS_STD``, the sum of their squared deviations from the mean are carried from level to level.
+    If *width* and *height* are multiples of 2**k, level *k* equals the result of :py:func:`downsample_2d`.
+
+    :param src: 2-D *ndarray*
+    :param levels: *int*, optional
+        The number of levels. Defaults to the number of levels required to reach a single grid cell.
+    :param method: one of ``DS_MEAN``, ``DS_VAR``, or ``DS_STD``, optional
+        Grid cell aggregation method
+    :param fill_value: *scalar*, optional
+        If ``None``, it is taken from **src** if it is a masked array,
+        otherwise numpy's default value is used.
+    :param out: sequence of 2-D *ndarray*, optional
+        Alternate output arrays in which to place the levels. The default is *None*; if provided, it must have
+        one array of the expected shape per level.
+    :param parallel: *bool*, optional
+        If ``True``, the rows of each level are computed by multiple threads.
+    :param num_threads: *int*, optional
+        The number of threads used if *parallel* is ``True``.
+    :return: A list of the levels, starting with the one of half the resolution of *src*.
+    """
+    if method not in (DS_MEAN, DS_VAR, DS_STD):
+        raise ValueError('invalid downsampling method')
+    h, w = src.shape
+    shapes = []
+    while (h, w) != (1, 1) and (levels is None or len(shapes) < levels):
+        h, w = (h + 1) // 2, (w + 1) // 2
+        shapes.append((h, w))
+    if levels is not None and len(shapes) != levels:
+        raise ValueError('invalid number of levels')
+    if out is None:
+        out = [np.zeros(shape, dtype=src.dtype) for shape in shapes]
+    elif [level.shape for level in out] != shapes:
+        raise ValueError("'levels' and 'out' are incompatible")
+    mask, use_mask = _get_mask(src)
+    fill_value = _get_fill_value(fill_value, src, out[0] if out else None)
+    planes = None
+    src_masked = isinstance(src, np.ma.MaskedArray)
+    out_masks = []
+    with _num_threads(num_threads):
+        for shape, level in zip(shapes, out):
+            # number of valid source grid cells, their mean, and the sum of their squared deviations from the mean
+            next_planes = np.zeros((3, 1) + shape, dtype=np.float64)
+            if planes is None:
+                kernel = _get_kernel(_pyramid_base_kernel, parallel, method, use_mask)
+                kernel(_as_stack(src), _as_stack(mask), fill_value, next_planes, _as_stack(level))
+            else:
+                kernel = _get_kernel(_pyramid_kernel, parallel, method)
+                kernel(planes, fill_value, next_planes, _as_stack(level))
+            planes = next_planes
+            # levels are masked where the number of valid source grid cells is zero
+            masked = src_masked or isinstance(level, np.ma.MaskedArray)
+            out_masks.append(planes[0, 0] == 0 if masked else None)
+    return [_mask_or_not(level, src, fill_value, out_mask) for level, out_mask in zip(out, out_masks)]
+
+
+class ResamplingPlan(object):
+    """
+    A reusable plan for resampling grids of a given shape to a new resolution.
+
+    The plan computes the source index ranges and weights of the target grid cells once, separately
+    for each axis, and applies them to any number of source grids. Plans are immutable and are best
+    obtained from :py:func:`get_resampling_plan`, which caches them.
+
+    If one axis shrinks and the other grows, the grid is first downsampled along the shrinking axis
+    and then upsampled along the growing one. For ``DS_MEAN``, ``DS_VAR``, and ``DS_STD``, both steps are
+    fused into a single pass, which aggregates the intermediate rows only as the interpolation needs them.
+
+    If the source grid size is an integer multiple of the target grid size, downsampling aggregates
+    plain blocks of source grid cells. Otherwise, for large downsampling factors, ``DS_MEAN``, ``DS_VAR``,
+    and ``DS_STD`` are computed from integral images, which yields the sums of each target grid cell in
+    constant time.
+
+    :param src_shape: shape of the source grids, only the last two dimensions (height, width) are used
+    :param dst_shape: shape of the target grids, only the last two dimensions (height, width) are used
+    :param ds_method: one of the *DS_* constants, optional
+        Grid cell aggregation method for a possible downsampling
+    :param us_method: one of the *US_* constants, optional
+        Grid cell interpolation method for a possible upsampling
+    """
+
+    def __init__(self, src_shape, dst_shape, ds_method=DS_MEAN, us_method=US_LINEAR):
+        src_h, src_w = src_shape[-2:]
+        dst_h, dst_w = dst_shape[-2:]
+        self._src_shape = (src_h, src_w)
+        self._dst_shape = (dst_h, dst_w)
+        self._ds_method = ds_method
+        self._us_method = us_method
+        self._temp_shape = (min(src_h, dst_h), min(src_w, dst_w))
+        temp_h, temp_w = self._temp_shape
+        self._ds_tables = None
+        self._us_tables = None
+        if self._temp_shape != self._src_shape:
+            weighted = ds_method != DS_FIRST and ds_method != DS_LAST
+            self._ds_tables = _downsample_axis(src_h, temp_h, weighted) + _downsample_axis(src_w, temp_w, weighted)
+        self._ds_factors = None
+        if src_h % temp_h == 0 and src_w % temp_w == 0:
+            self._ds_factors = (src_h // temp_h, src_w // temp_w)
+        self._ds_histogram = (ds_method == DS_MODE
+                              and src_h * src_w >= _HISTOGRAM_MIN_CELL_COUNT * temp_h * temp_w)
+        self._ds_integral = (self._ds_factors is None and ds_method in (DS_MEAN, DS_VAR, DS_STD)
+                             and src_h * src_w >= _INTEGRAL_MIN_CELL_COUNT * temp_h * temp_w)
+        if self._temp_shape != self._dst_shape:
+            self._us_tables = _upsample_axis(temp_h, dst_h, us_method) + _upsample_axis(temp_w, dst_w, us_method)
+
+    @property
+    def src_shape(self):
+        """The (height, width) of the source grids."""
+        return self._src_shape
+
+    @property
+    def dst_shape(self):
+        """The (height, width) of the target grids."""
+        return self._dst_shape
+
+    @property
+    def ds_method(self):
+        """The grid cell aggregation method."""
+        return self._ds_method
+
+    @property
+    def us_method(self):
+        """The grid cell interpolation method."""
+        return self._us_method
+
+    def apply(self, src, fill_value=None, mode_rank=1, out=None, parallel=False, num_threads=None, out_mask=None,
+              assume_valid=False):
+        """
+        Resample a 2-D grid or a stack of 2-D grids according to this plan.
+
+        :param src: *ndarray* of shape (..., height, width), where (height, width) must equal *src_shape*
+        :param fill_value: *scalar*, optional
+            If ``None``, it is taken from **src** if it is a masked array,
+            otherwise from *out* if it is a masked array,
+            otherwise numpy's default value is used.
+        :param mode_rank: *scalar*, optional
+            The rank of the frequency determined by the *ds_method* ``DS_MODE``. One (the default) means
+            most frequent value, zwo means second most frequent value, and so forth.
+        :param out: *ndarray*, optional
+            Alternate output array in which to place the result. The default is *None*; if provided, it must have
+            the same shape as the expected output.
+        :param parallel: *bool*, optional
+            If ``True``, the rows of the output grid are computed by multiple threads.
+        :param num_threads: *int*, optional
+            The number of threads used if *parallel* is ``True``.
+        :param out_mask: boolean *ndarray*, optional
+            Alternate output array in which to mark the target grid cells without valid source grid cells, which
+            are set to *fill_value*. If provided, it must have the same shape as the expected output.
+        :param assume_valid: *bool*, optional
+            If ``True``, all cells of *src* are assumed to be finite and not masked, so that the resampling
+            kernels skip testing them for validity. The result is undefined if *src* has invalid cells.
+        :return: A resampled version of the *src* array.
+        """
+        if src.shape[-2:] != self._src_shape:
+            raise ValueError("'src' and plan are incompatible")
+        if self._ds_method == DS_MODE and mode_rank < 1:
+            raise ValueError('mode_rank must be >= 1')
+        out = _get_out(out, src, src.shape[:-2] + self._dst_shape, self._ds_method)
+        if out is None or out.shape == src.shape:
+            return src
+        fill_value = _get_fill_value(fill_value, src, out)
+        out_mask = _get_out_mask(out_mask, src, out)
+        src_3d, mask_3d, use_mask, out_3d = _get_nd_args(src, out)
+        out_mask_3d = _get_nd_out_mask(out_mask)
+        with _num_threads(num_threads):
+            self._resample(src_3d, mask_3d, use_mask, fill_value, mode_rank, out_3d, parallel, out_mask=out_mask_3d,
+                           valid=assume_valid)
+        return _mask_or_not(_set_nd_out(out, out_3d), src, fill_value, _set_nd_out(out_mask, out_mask_3d))
+
+    def source_rows(self, dst_y0, dst_y1):
+        """
+        Get the range of source grid rows that contribute to a range of target grid rows.
+
+        :param dst_y0: index of the first target grid row
+        :param dst_y1: index of the target grid row following the last one
+        :return: a tuple (src_y0, src_y1) giving the index of the first source grid row and of the
+            source grid row following the last one
+        """
+        return self._src_range(0, *self._temp_range(0, dst_y0, dst_y1))
+
+    def source_cols(self, dst_x0, dst_x1):
+        """
+        Get the range of source grid columns that contribute to a range of target grid columns.
+
+        :param dst_x0: index of the first target grid column
+        :param dst_x1: index of the target grid column following the last one
+        :return: a tuple (src_x0, src_x1) giving the index of the first source grid column and of the
+            source grid column following the last one
+        """
+        return self._src_range(1, *self._temp_range(1, dst_x0, dst_x1))
+
+    def _temp_range(self, axis, dst_0, dst_1):
+        if self._us_tables is None:
+            return dst_0, dst_1
+        index = self._us_tables[2 * axis]
+        return int(index[dst_0, 0]), int(index[dst_1 - 1, 1]) + 1
+
+    def _src_range(self, axis, temp_0, temp_1):
+        if self._ds_tables is None:
+            return temp_0, temp_1
+        index = self._ds_tables[2 * axis]
+        return int(index[temp_0, 0]), int(index[temp_1 - 1, 1]) + 1
+
+    def _resample(self, src, mask, use_mask, fill_value, mode_rank, out, parallel, dst_y0=0, dst_x0=0,
+                  out_mask=None, valid=False):
+        """
+        Resample the grid stack *src* into *out*. If *out* holds only the target grid window starting at
+        (*dst_y0*, *dst_x0*), *src* and *mask* hold only the source grid window given by
+        :py:meth:`source_rows` and :py:meth:`source_cols`. If *out_mask* is given, the target grid cells
+        without valid source grid cells are marked in it. If *valid* is set, all cells of *src* are assumed
+        to be valid, so that the kernels test no cell for validity.
+        """
+        if self._ds_tables is None and self._us_tables is None:
+            return src
+        if out_mask is None:
+            out_mask = _NOOUTMASK
+        if not valid and not use_mask:
+            # integer grids without a mask have no invalid cells, and a source grid that is only upsampled is
+            # small compared to the target grid, so that scanning it for non-finite cells is cheap
+            valid = src.dtype.kind in 'biu' or (self._ds_tables is None and _all_finite(src))
+        if valid:
+            use_mask = False
+        ds_valid = valid and self._ds_method in (DS_MEAN, DS_VAR, DS_STD)
+        dst_y1 = dst_y0 + out.shape[-2]
+        dst_x1 = dst_x0 + out.shape[-1]
+        temp_y0, temp_y1 = self._temp_range(0, dst_y0, dst_y1)
+        temp_x0, temp_x1 = self._temp_range(1, dst_x0, dst_x1)
+        src_y0, _ = self._src_range(0, temp_y0, temp_y1)
+        src_x0, _ = self._src_range(1, temp_x0, temp_x1)
+        if self._ds_tables is not None and self._us_tables is not None \
+                and self._ds_method in (DS_MEAN, DS_VAR, DS_STD):
+            y_index, y_weight, x_index, x_weight = self._ds_tables
+            ds_tables = (y_index[temp_y0:temp_y1] - src_y0, y_weight[temp_y0:temp_y1],
+                         x_index[temp_x0:temp_x1] - src_x0, x_weight[temp_x0:temp_x1])
+            y_index, y_weight, x_index, x_weight = self._us_tables
+            us_tables = (y_index[dst_y0:dst_y1] - temp_y0, y_weight[dst_y0:dst_y1],
+                         x_index[dst_x0:dst_x1] - temp_x0, x_weight[dst_x0:dst_x1])
+            kernel = _get_kernel(_resample_fused_kernel, parallel, self._ds_method, self._us_method, use_mask,
+                                 valid)
+            return kernel(src, mask, fill_value, *ds_tables, *us_tables, out, out_mask)
+        temp = out
+        temp_mask = out_mask
+        if self._ds_tables is not None:
+            if self._us_tables is not None:
+                temp = np.zeros(src.shape[:-2] + (temp_y1 - temp_y0, temp_x1 - temp_x0),
+                                dtype=_get_out_dtype(src.dtype, self._src_shape, self._temp_shape, self._ds_method))
+                # the aggregated grid cells marked invalid by the downsampling step
+                temp_mask = np.zeros(temp.shape, dtype=np.bool_)
+            y_index, y_weight, x_index, x_weight = self._ds_tables
+            ds_tables = (y_index[temp_y0:temp_y1] - src_y0, y_weight[temp_y0:temp_y1],
+                         x_index[temp_x0:temp_x1] - src_x0, x_weight[temp_x0:temp_x1])
+            if self._ds_method in (DS_MIN, DS_MAX, DS_COUNT, DS_COVERAGE):
+                kernel = _get_kernel(_downsample_stats_kernel, parallel, use_mask)
+                kernel(src, mask, np.array([self._ds_method]), fill_value, *ds_tables, temp[np.newaxis],
+                       temp_mask[np.newaxis])
+            elif self._ds_histogram and src.dtype in _HISTOGRAM_DTYPES:
+                kernel = _get_kernel(_downsample_histogram_kernel, parallel, use_mask)
+                kernel(src, mask, _get_class_count(src.dtype), mode_rank, fill_value, *ds_tables, temp, _NOFRACTIONS,
+                       temp_mask)
+            elif self._ds_factors is not None:
+                kernel = _get_kernel(_downsample_block_kernel, parallel, self._ds_method, use_mask, ds_valid)
+                kernel(src, mask, fill_value, mode_rank, *self._ds_factors, temp, temp_mask)
+            elif self._ds_integral:
+                kernel = _get_kernel(_downsample_integral_kernel, parallel, self._ds_method, use_mask, ds_valid)
+                kernel(src, mask, fill_value, *ds_tables, temp, temp_mask)
+            else:
+                kernel = _get_kernel(_downsample_kernel, parallel, self._ds_method, use_mask, ds_valid)
+                kernel(src, mask, fill_value, mode_rank, *ds_tables, temp, temp_mask)
+            if self._us_tables is None:
+                return out
+            # every aggregated grid cell of a valid source grid is valid, except for modes of higher ranks
+            valid = valid and not (self._ds_method == DS_MODE and mode_rank > 1)
+            mask = temp_mask
+            use_mask = not valid
+        else:
+            temp = src
+        y_index, y_weight, x_index, x_weight = self._us_tables
+        us_tables = (y_index[dst_y0:dst_y1] - temp_y0, y_weight[dst_y0:dst_y1],
+                     x_index[dst_x0:dst_x1] - temp_x0, x_weight[dst_x0:dst_x1])
+        kernel = _get_kernel(_upsample_kernel, parallel, self._us_method, use_mask, False, valid)
+        return kernel(temp, mask, fill_value, *us_tables, out, out_mask)
+
+
+def get_resampling_plan(src_shape, dst_shape, ds_method=DS_MEAN, us_method=US_LINEAR):
+    """
+    Get a cached :py:class:`ResamplingPlan`. The most recently used plans are kept in memory,
+    so that repeatedly resampling grids of the same shapes does not recompute the grid cell geometry.
+
+    :param src_shape: shape of the source grids, only the last two dimensions (height, width) are used
+    :param dst_shape: shape of the target grids, only the last two dimensions (height, width) are used
+    :param ds_method: one of the *DS_* constants, optional
+        Grid cell aggregation method for a possible downsampling
+    :param us_method: one of the *US_* constants, optional
+        Grid cell interpolation method for a possible upsampling
+    :return: a :py:class:`ResamplingPlan`
+    """
+    return _get_resampling_plan(tuple(src_shape[-2:]), tuple(dst_shape[-2:]), ds_method, us_method)
+
+
+@lru_cache(maxsize=_PLAN_CACHE_SIZE)
+def _get_resampling_plan(src_shape, dst_shape, ds_method, us_method):
+    return ResamplingPlan(src_shape, dst_shape, ds_method=ds_method, us_method=us_method)
+
+
+def _get_band_height(plan, src_itemsize, out_itemsize, use_mask, max_memory):
+    (src_h, src_w), (temp_h, temp_w), (dst_h, dst_w) = plan.src_shape, plan._temp_shape, plan.dst_shape
+    src_row_size = src_w * (src_itemsize + (1 if use_mask else 0))
+    # a band of n target grid rows needs about n * src_h / dst_h source grid rows, plus two partial ones
+    # at its borders, and, if one axis shrinks and the other grows, n * temp_h / dst_h + 2 intermediate rows
+    row_size = src_row_size * src_h / dst_h + out_itemsize * (dst_w + temp_w * temp_h / dst_h)
+    band_height = int((max_memory - 2 * (src_row_size + out_itemsize * temp_w)) // row_size)
+    return min(max(band_height, 1), dst_h)
+
+
+def _get_chunk_ranges(src_chunks, dst_size):
+    # scale the source chunk boundaries to the target grid, dropping chunks that become empty
+    src_size = sum(src_chunks)
+    bounds = sorted(set(int(round(bound * dst_size / src_size)) for bound in np.cumsum((0,) + tuple(src_chunks))))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _resample_window(src, plan, dst_y0, dst_x0, dst_shape, fill_value, mode_rank):
+    dtype = _get_out_dtype(src.dtype, plan.src_shape, plan.dst_shape, plan._ds_method)
+    out = np.zeros(src.shape[:-2] + dst_shape, dtype=dtype)
+    out_mask = _get_out_mask(None, src, out)
+    src_3d, mask_3d, use_mask, out_3d = _get_nd_args(src, out)
+    plan._resample(src_3d, mask_3d, use_mask, fill_value, mode_rank, out_3d, False, dst_y0=dst_y0, dst_x0=dst_x0,
+                   out_mask=_get_nd_out_mask(out_mask))
+    return _mask_or_not(out, src, fill_value, out_mask)
+
+
+def _get_out_dtype(dtype, src_shape, dst_shape, ds_method):
+    # counts and coverage fractions generally do not fit into the type of the source grid
+    if ds_method in (DS_COUNT, DS_COVERAGE) and (dst_shape[-2] < src_shape[-2] or dst_shape[-1] < src_shape[-1]):
+        return np.dtype(np.float64)
+    return np.dtype(dtype)
+
+
+def _get_class_count(dtype):
+    return 1 << (8 * np.dtype(dtype).itemsize)
+
+
+def _get_out(out, src, shape, ds_method=None):
+    if out is None:
+        return np.zeros(shape, dtype=_get_out_dtype(src.dtype, src.shape, shape, ds_method))
     else:
         if out.shape != shape:
             raise ValueError("'shape' and 'out' are incompatible")
@@ -151,15 +1088,66 @@ def _get_mask(src):
     return _NOMASK2D, False
 
 
-def _mask_or_not(out, src, fill_value):
-    if isinstance(src, np.ma.MaskedArray):
-        if not isinstance(out, np.ma.MaskedArray):
-            if np.isfinite(fill_value):
-                masked = np.ma.masked_equal(out, fill_value, copy=False)
-            else:
-                masked = np.ma.masked_invalid(out, copy=False)
-            masked.set_fill_value(fill_value)
-            return masked
+def _concatenate_masks(data_blocks, mask_blocks):
+    return np.concatenate([np.zeros(data.shape, dtype=np.bool_) if mask is None else mask
+                           for data, mask in zip(data_blocks, mask_blocks)])
+
+
+def _as_stack(a):
+    if a is None:
+        return _NOOUTMASK
+    return np.ma.getdata(a)[np.newaxis]
+
+
+def _get_nd_args(src, out):
+    if src.ndim < 2:
+        raise ValueError("'src' must have at least two dimensions")
+    src_3d = np.ma.getdata(src).reshape((-1,) + src.shape[-2:])
+    mask, use_mask = _get_mask(src)
+    mask_3d = mask.reshape((-1,) + src.shape[-2:]) if use_mask else _NOMASK3D
+    out_3d = np.ma.getdata(out).reshape((-1,) + out.shape[-2:])
+    return src_3d, mask_3d, use_mask, out_3d
+
+
+def _set_nd_out(out, out_3d):
+    if out is None:
+        return None
+    if not np.may_share_memory(out, out_3d):
+        # reshaping a non-contiguous out array has created a copy
+        out[...] = out_3d.reshape(out.shape)
+    return out
+
+
+def _get_out_mask(out_mask, src, out):
+    """
+    Get the boolean array in which the kernels mark the target grid cells without valid source grid cells:
+    *out_mask* if given, a new one if *src* or *out* is a masked array, otherwise ``None``.
+    """
+    if out_mask is not None:
+        if out_mask.shape != out.shape:
+            raise ValueError("'out' and 'out_mask' are incompatible")
+        if out_mask.dtype != np.bool_:
+            raise ValueError("'out_mask' must be a boolean array")
+        return out_mask
+    if isinstance(src, np.ma.MaskedArray) or isinstance(out, np.ma.MaskedArray):
+        return np.zeros(out.shape, dtype=np.bool_)
+    return None
+
+
+def _get_nd_out_mask(out_mask):
+    if out_mask is None:
+        return _NOOUTMASK
+    return out_mask.reshape((-1,) + out_mask.shape[-2:])
+
+
+def _mask_or_not(out, src, fill_value, out_mask):
+    if out_mask is None:
+        return out
+    if isinstance(out, np.ma.MaskedArray):
+        out.mask = out_mask
+    elif isinstance(src, np.ma.MaskedArray):
+        out = np.ma.MaskedArray(out, mask=out_mask, copy=False)
+        out.set_fill_value(fill_value)
     return out
 
 
@@ -175,332 +1163,1180 @@ def _get_fill_value(fill_value, src, out):
     return fill_value
 
 
-# This function will be JIT-compiled by Numba with nopython=True,
-# therefore all arg types must be either primitive scalars or numpy arrays.
+@contextmanager
+def _num_threads(num_threads):
+    if num_threads is None:
+        yield
+        return
+    old_num_threads = numba.get_num_threads()
+    numba.set_num_threads(num_threads)
+    try:
+        yield
+    finally:
+        numba.set_num_threads(old_num_threads)
+
+
+@lru_cache(maxsize=None)
+def _get_kernel(kernel_factory, parallel, *constants):
+    """
+    Get the JIT-compiled kernel created by *kernel_factory* for the given *constants*, e.g. an aggregation
+    method and whether a mask is used. Numba treats the constants as compile-time constants and removes the
+    branches of all other methods, so kernels are compiled lazily, only for the constants actually used.
+    If *parallel* is ``True``, a multi-threaded variant whose loops use ``prange`` is returned.
+    """
+    kernel = kernel_factory(*constants)
+    # Numba's on-disk cache identifies functions by their qualified names, so each variant gets its own name
+    kernel.__qualname__ = '_'.join([kernel_factory.__name__] + [str(c) for c in constants]) \
+                          + ('_parallel' if parallel else '')
+    return jit(nopython=True, nogil=True, parallel=parallel, cache=True)(kernel)
+
+
+def _resample(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out, parallel, out_mask=_NOOUTMASK,
+              valid=False):
+    plan = get_resampling_plan(src.shape, out.shape, ds_method=ds_method, us_method=us_method)
+    return plan._resample(src, mask, use_mask, fill_value, mode_rank, out, parallel, out_mask=out_mask, valid=valid)
+
+
+def _upsample(src, mask, use_mask, method, fill_value, out, parallel, out_mask=_NOOUTMASK, valid=False):
+    if out.shape[-1] < src.shape[-1] or out.shape[-2] < src.shape[-2]:
+        raise ValueError("invalid target size")
+    return _resample(src, mask, use_mask, DS_MEAN, method, fill_value, 1, out, parallel, out_mask, valid)
+
+
+def _upsample_gaps(src, out, method):
+    """Upsample the 2-D grid *src* into the cells of the 2-D grid *out* that are not finite."""
+    plan = get_resampling_plan(src.shape, out.shape, us_method=method)
+    kernel = _get_kernel(_upsample_kernel, False, method, False, True)
+    kernel(_as_stack(src), _NOMASK3D, np.nan, *plan._us_tables, _as_stack(out), _NOOUTMASK)
+
+
+def _downsample(src, mask, use_mask, method, fill_value, mode_rank, out, parallel, out_mask=_NOOUTMASK, valid=False):
+    if out.shape[-1] > src.shape[-1] or out.shape[-2] > src.shape[-2]:
+        raise ValueError("invalid target size")
+    return _resample(src, mask, use_mask, method, US_LINEAR, fill_value, mode_rank, out, parallel, out_mask, valid)
+
+
+@jit(nopython=True, cache=True)
+def _upsample_axis(src_size, out_size, method):
+    """
+    Compute the source indices and interpolation weights of all target grid cells along one axis.
+
+    :return: a tuple (index, weight), where *index* is an (out_size, 2) array holding the indices of
+        the lower and upper source grid cells and *weight* is an (out_size,) array holding the
+        interpolation weight of the upper source grid cell.
+    """
+    index = np.zeros((out_size, 2), dtype=np.int64)
+    weight = np.zeros((out_size,), dtype=np.float64)
+    if method == US_NEAREST:
+        scale = src_size / out_size
+        for i in range(out_size):
+            src_i = int(scale * i)
+            index[i, 0] = src_i
+            index[i, 1] = src_i
+    elif method == US_LINEAR:
+        scale = (src_size - 1.0) / ((out_size - 1.0) if out_size > 1 else 1.0)
+        for i in range(out_size):
+            src_f = scale * i
+            src_i0 = int(src_f)
+            src_i1 = src_i0 + 1
+            if src_i1 >= src_size:
+                src_i1 = src_i0
+            index[i, 0] = src_i0
+            index[i, 1] = src_i1
+            weight[i] = src_f - src_i0
+    else:
+        raise ValueError('invalid upsampling method')
+    return index, weight
+
+
+@jit(nopython=True, cache=True)
+def _downsample_axis(src_size, out_size, weighted):
+    """
+    Compute the source index ranges and edge weights of all target grid cells along one axis.
+
+    :param weighted: whether the ranges are used for an area-weighted aggregation. If so, source grid
+        cells whose contribution is below ``_EPS`` are excluded from a range.
+    :return: a tuple (index, weight), where *index* is an (out_size, 2) array holding the indices of
+        the first and last contributing source grid cells and *weight* is an (out_size, 2) array holding
+        their contribution weights. Source grid cells in between contribute with weight one.
+    """
+    scale = src_size / out_size
+    index = np.zeros((out_size, 2), dtype=np.int64)
+    weight = np.zeros((out_size, 2), dtype=np.float64)
+    for i in range(out_size):
+        src_f0 = scale * i
+        src_f1 = src_f0 + scale
+        src_i0 = int(src_f0)
+        src_i1 = int(src_f1)
+        w0 = 1.0 - (src_f0 - src_i0)
+        w1 = src_f1 - src_i1
+        if weighted:
+            if w1 < _EPS:
+                w1 = 1.0
+                if src_i1 > src_i0:
+                    src_i1 -= 1
+        elif src_i1 == src_f1 and src_i1 > src_i0:
+            src_i1 -= 1
+        if src_i1 >= src_size:
+            src_i1 = src_size - 1
+        index[i, 0] = src_i0
+        index[i, 1] = src_i1
+        weight[i, 0] = w0
+        weight[i, 1] = w1
+    return index, weight
+
+
+# This function creates a kernel for the given constants, which is JIT-compiled by Numba with nopython=True
+# by _get_kernel(), therefore all arg types must be either primitive scalars or numpy arrays.
 # Key-value args are not allowed.
 #
-@jit(nopython=True)
-def _resample_2d(src, mask, use_mask, ds_method, us_method, fill_value, mode_rank, out):
-    src_w = src.shape[-1]
-    src_h = src.shape[-2]
-    out_w = out.shape[-1]
-    out_h = out.shape[-2]
-
-    if out_w < src_w and out_h < src_h:
-        return _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, out)
-    elif out_w < src_w:
-        if out_h > src_h:
-            temp = np.zeros((src_h, out_w), dtype=src.dtype)
-            temp = _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, temp)
-            # todo - write test & fix: must use mask=np.ma.getmaskarray(temp) here if use_mask==True
-            return _upsample_2d(temp, mask, use_mask, us_method, fill_value, out)
-        else:
-            return _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, out)
-    elif out_h < src_h:
-        if out_w > src_w:
-            temp = np.zeros((out_h, src_w), dtype=src.dtype)
-            temp = _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, temp)
-            # todo - write test & fix: must use mask=np.ma.getmaskarray(temp) here if use_mask==True
-            return _upsample_2d(temp, mask, use_mask, us_method, fill_value, out)
+# The kernel operates on a stack of 2-D grids of shape (grid_count, height, width).
+# Its rows are independent of each other so that they can be processed in parallel.
+# If *gaps_only* is set, only the cells of *out* that are not finite are written.
+# If *valid* is set, all cells of *src* are known to be valid, and the kernel tests no cell for validity.
+#
+def _upsample_kernel(method, use_mask, gaps_only=False, valid=False):
+    def kernel(src, mask, fill_value, y_index, y_weight, x_index, x_weight, out, out_mask):
+        grid_count = out.shape[0]
+        out_w = out.shape[-1]
+        out_h = out.shape[-2]
+        with_out_mask = out_mask.size > 0
+
+        if method == US_NEAREST:
+            for row in prange(grid_count * out_h):
+                i = row // out_h
+                out_y = row % out_h
+                mask_i = i if use_mask else 0
+                src_y = y_index[out_y, 0]
+                for out_x in range(out_w):
+                    if gaps_only and np.isfinite(out[i, out_y, out_x]):
+                        continue
+                    src_x = x_index[out_x, 0]
+                    value = src[i, src_y, src_x]
+                    ok = valid or (np.isfinite(value) and not (use_mask and mask[mask_i, src_y, src_x]))
+                    if ok:
+                        out[i, out_y, out_x] = value
+                    else:
+                        out[i, out_y, out_x] = fill_value
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = not ok
+
+        elif method == US_LINEAR:
+            for row in prange(grid_count * out_h):
+                i = row // out_h
+                out_y = row % out_h
+                mask_i = i if use_mask else 0
+                src_y0 = y_index[out_y, 0]
+                src_y1 = y_index[out_y, 1]
+                wy = y_weight[out_y]
+                for out_x in range(out_w):
+                    if gaps_only and np.isfinite(out[i, out_y, out_x]):
+                        continue
+                    src_x0 = x_index[out_x, 0]
+                    src_x1 = x_index[out_x, 1]
+                    wx = x_weight[out_x]
+                    v00 = src[i, src_y0, src_x0]
+                    v01 = src[i, src_y0, src_x1]
+                    v10 = src[i, src_y1, src_x0]
+                    v11 = src[i, src_y1, src_x1]
+                    if valid:
+                        # no validity branches, so that the row loop can be vectorized
+                        v0 = v00 + wx * (v01 - v00)
+                        v1 = v10 + wx * (v11 - v10)
+                        out[i, out_y, out_x] = v0 + wy * (v1 - v0)
+                        if with_out_mask:
+                            out_mask[i, out_y, out_x] = False
+                        continue
+                    if use_mask:
+                        v00_ok = np.isfinite(v00) and not mask[mask_i, src_y0, src_x0]
+                        v01_ok = np.isfinite(v01) and not mask[mask_i, src_y0, src_x1]
+                        v10_ok = np.isfinite(v10) and not mask[mask_i, src_y1, src_x0]
+                        v11_ok = np.isfinite(v11) and not mask[mask_i, src_y1, src_x1]
+                    else:
+                        v00_ok = np.isfinite(v00)
+                        v01_ok = np.isfinite(v01)
+                        v10_ok = np.isfinite(v10)
+                        v11_ok = np.isfinite(v11)
+                    if v00_ok and v01_ok and v10_ok and v11_ok:
+                        ok = True
+                        v0 = v00 + wx * (v01 - v00)
+                        v1 = v10 + wx * (v11 - v10)
+                        value = v0 + wy * (v1 - v0)
+                    elif wx < 0.5:
+                        # NEAREST according to weight
+                        if wy < 0.5:
+                            ok = v00_ok
+                            value = v00
+                        else:
+                            ok = v10_ok
+                            value = v10
+                    else:
+                        # NEAREST according to weight
+                        if wy < 0.5:
+                            ok = v01_ok
+                            value = v01
+                        else:
+                            ok = v11_ok
+                            value = v11
+                    if ok:
+                        out[i, out_y, out_x] = value
+                    else:
+                        out[i, out_y, out_x] = fill_value
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = not ok
+
         else:
-            return _downsample_2d(src, mask, use_mask, ds_method, fill_value, mode_rank, out)
-    elif out_w > src_w or out_h > src_h:
-        return _upsample_2d(src, mask, use_mask, us_method, fill_value, out)
-    return src
+            raise ValueError('invalid upsampling method')
+
+        return out
 
+    return kernel
 
-# This function will be JIT-compiled by Numba with nopython=True,
-# therefore all arg types must be either primitive scalars or numpy arrays.
+
+# This function creates a kernel for the given constants, which is JIT-compiled by Numba with nopython=True
+# by _get_kernel(), therefore all arg types must be either primitive scalars or numpy arrays.
 # Key-value args are not allowed.
 #
-@jit(nopython=True)
-def _upsample_2d(src, mask, use_mask, method, fill_value, out):
-    src_w = src.shape[-1]
-    src_h = src.shape[-2]
-    out_w = out.shape[-1]
-    out_h = out.shape[-2]
-
-    if src_w == out_w and src_h == out_h:
-        return src
+# Fused variant of _downsample_kernel() followed by _upsample_kernel() for DS_MEAN, DS_VAR, and DS_STD,
+# used if one axis shrinks and the other grows. Instead of a full intermediate grid, each piece of
+# _FUSED_ROW_COUNT target rows keeps the two most recently aggregated intermediate rows, indexed by the
+# parity of their row index, together with their validity. The result is the same as the one of the two
+# separate steps.
+#
+# The kernel operates on a stack of 2-D grids of shape (grid_count, height, width).
+# Its pieces of rows are independent of each other so that they can be processed in parallel.
+# If *valid* is set, all cells of *src* are known to be valid, and the kernel tests no cell for validity.
+#
+def _resample_fused_kernel(ds_method, us_method, use_mask, valid=False):
+    def kernel(src, mask, fill_value, ds_y_index, ds_y_weight, ds_x_index, ds_x_weight,
+               us_y_index, us_y_weight, us_x_index, us_x_weight, out, out_mask):
+        grid_count = out.shape[0]
+        out_w = out.shape[-1]
+        out_h = out.shape[-2]
+        temp_w = ds_x_index.shape[0]
+        with_out_mask = out_mask.size > 0
 
-    if out_w < src_w or out_h < src_h:
-        raise ValueError("invalid target size")
+        if ds_method != DS_MEAN and ds_method != DS_VAR and ds_method != DS_STD:
+            raise ValueError('invalid downsampling method')
+        if us_method != US_NEAREST and us_method != US_LINEAR:
+            raise ValueError('invalid upsampling method')
+        linear = us_method == US_LINEAR
 
-    if method == US_NEAREST:
-        scale_x = src_w / out_w
-        scale_y = src_h / out_h
-        for out_y in range(out_h):
-            src_y = int(scale_y * out_y)
-            for out_x in range(out_w):
-                src_x = int(scale_x * out_x)
-                value = src[src_y, src_x]
-                if np.isfinite(value) and not (use_mask and mask[src_y, src_x]):
-                    out[out_y, out_x] = value
-                else:
-                    out[out_y, out_x] = fill_value
+        piece_count = (out_h + _FUSED_ROW_COUNT - 1) // _FUSED_ROW_COUNT
+        for piece in prange(grid_count * piece_count):
+            i = piece // piece_count
+            mask_i = i if use_mask else 0
+            out_y0 = (piece % piece_count) * _FUSED_ROW_COUNT
+            out_y1 = min(out_y0 + _FUSED_ROW_COUNT, out_h)
+            # Scratch buffers are piece-local so that pieces can be processed independently
+            temp = np.zeros((2, temp_w), dtype=src.dtype)
+            temp_valid = np.zeros((2, temp_w), dtype=np.bool_)
+            temp_rows = np.full((2,), -1, dtype=np.int64)
+            w_sums = np.zeros((temp_w,), dtype=np.float64)
+            wv_sums = np.zeros((temp_w,), dtype=np.float64)
+            wvv_sums = np.zeros((temp_w,), dtype=np.float64)
+            refs = np.zeros((temp_w,), dtype=np.float64)
+            for out_y in range(out_y0, out_y1):
+                temp_y0 = us_y_index[out_y, 0]
+                temp_y1 = us_y_index[out_y, 1] if linear else temp_y0
+                slot0 = temp_y0 % 2
+                slot1 = temp_y1 % 2
+                if temp_rows[slot0] != temp_y0:
+                    _aggregate_row(src[i], mask[mask_i], use_mask, valid, ds_method, ds_y_index[temp_y0],
+                                   ds_y_weight[temp_y0], ds_x_index, ds_x_weight, refs, w_sums, wv_sums,
+                                   wvv_sums, temp[slot0], temp_valid[slot0])
+                    temp_rows[slot0] = temp_y0
+                if temp_rows[slot1] != temp_y1:
+                    _aggregate_row(src[i], mask[mask_i], use_mask, valid, ds_method, ds_y_index[temp_y1],
+                                   ds_y_weight[temp_y1], ds_x_index, ds_x_weight, refs, w_sums, wv_sums,
+                                   wvv_sums, temp[slot1], temp_valid[slot1])
+                    temp_rows[slot1] = temp_y1
+                wy = us_y_weight[out_y]
+                for out_x in range(out_w):
+                    temp_x0 = us_x_index[out_x, 0]
+                    if linear:
+                        temp_x1 = us_x_index[out_x, 1]
+                        wx = us_x_weight[out_x]
+                        v00 = temp[slot0, temp_x0]
+                        v01 = temp[slot0, temp_x1]
+                        v10 = temp[slot1, temp_x0]
+                        v11 = temp[slot1, temp_x1]
+                        v00_ok = temp_valid[slot0, temp_x0]
+                        v01_ok = temp_valid[slot0, temp_x1]
+                        v10_ok = temp_valid[slot1, temp_x0]
+                        v11_ok = temp_valid[slot1, temp_x1]
+                        if valid or (v00_ok and v01_ok and v10_ok and v11_ok):
+                            ok = True
+                            v0 = v00 + wx * (v01 - v00)
+                            v1 = v10 + wx * (v11 - v10)
+                            value = v0 + wy * (v1 - v0)
+                        elif wx < 0.5:
+                            # NEAREST according to weight
+                            if wy < 0.5:
+                                ok = v00_ok
+                                value = v00
+                            else:
+                                ok = v10_ok
+                                value = v10
+                        else:
+                            # NEAREST according to weight
+                            if wy < 0.5:
+                                ok = v01_ok
+                                value = v01
+                            else:
+                                ok = v11_ok
+                                value = v11
+                    else:
+                        ok = valid or temp_valid[slot0, temp_x0]
+                        value = temp[slot0, temp_x0]
+                    if ok:
+                        out[i, out_y, out_x] = value
+                    else:
+                        out[i, out_y, out_x] = fill_value
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = not ok
 
-    elif method == US_LINEAR:
-        scale_x = (src_w - 1.0) / ((out_w - 1.0) if out_w > 1 else 1.0)
-        scale_y = (src_h - 1.0) / ((out_h - 1.0) if out_h > 1 else 1.0)
-        for out_y in range(out_h):
-            src_yf = scale_y * out_y
-            src_y0 = int(src_yf)
-            wy = src_yf - src_y0
-            src_y1 = src_y0 + 1
-            if src_y1 >= src_h:
-                src_y1 = src_y0
+        return out
+
+    return kernel
+
+
+# This function creates a kernel for the given constants, which is JIT-compiled by Numba with nopython=True
+# by _get_kernel(), therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# The kernel operates on a stack of 2-D grids of shape (grid_count, height, width).
+# Its rows are independent of each other so that they can be processed in parallel.
+# If *valid* is set, all cells of *src* are known to be valid, and DS_MEAN, DS_VAR, and DS_STD
+# test no cell for validity.
+#
+def _downsample_kernel(method, use_mask, valid=False):
+    def kernel(src, mask, fill_value, mode_rank, y_index, y_weight, x_index, x_weight, out, out_mask):
+        grid_count = out.shape[0]
+        out_w = out.shape[-1]
+        out_h = out.shape[-2]
+        with_out_mask = out_mask.size > 0
+
+        if method == DS_FIRST or method == DS_LAST:
+            for row in prange(grid_count * out_h):
+                i = row // out_h
+                out_y = row % out_h
+                mask_i = i if use_mask else 0
+                src_y0 = y_index[out_y, 0]
+                src_y1 = y_index[out_y, 1]
+                for out_x in range(out_w):
+                    src_x0 = x_index[out_x, 0]
+                    src_x1 = x_index[out_x, 1]
+                    done = False
+                    found = False
+                    value = fill_value
+                    for src_y in range(src_y0, src_y1 + 1):
+                        for src_x in range(src_x0, src_x1 + 1):
+                            v = src[i, src_y, src_x]
+                            if np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x]):
+                                value = v
+                                found = True
+                                if method == DS_FIRST:
+                                    done = True
+                                    break
+                        if done:
+                            break
+                    out[i, out_y, out_x] = value
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = not found
+
+        elif method == DS_MODE:
+            window_h = 1
+            for out_y in range(out_h):
+                window_h = max(window_h, y_index[out_y, 1] - y_index[out_y, 0] + 1)
+            window_w = 1
             for out_x in range(out_w):
-                src_xf = scale_x * out_x
-                src_x0 = int(src_xf)
-                wx = src_xf - src_x0
-                src_x1 = src_x0 + 1
-                if src_x1 >= src_w:
-                    src_x1 = src_x0
-                v00 = src[src_y0, src_x0]
-                v01 = src[src_y0, src_x1]
-                v10 = src[src_y1, src_x0]
-                v11 = src[src_y1, src_x1]
-                if use_mask:
-                    v00_ok = np.isfinite(v00) and not mask[src_y0, src_x0]
-                    v01_ok = np.isfinite(v01) and not mask[src_y0, src_x1]
-                    v10_ok = np.isfinite(v10) and not mask[src_y1, src_x0]
-                    v11_ok = np.isfinite(v11) and not mask[src_y1, src_x1]
-                else:
-                    v00_ok = np.isfinite(v00)
-                    v01_ok = np.isfinite(v01)
-                    v10_ok = np.isfinite(v10)
-                    v11_ok = np.isfinite(v11)
-                if v00_ok and v01_ok and v10_ok and v11_ok:
-                    ok = True
-                    v0 = v00 + wx * (v01 - v00)
-                    v1 = v10 + wx * (v11 - v10)
-                    value = v0 + wy * (v1 - v0)
-                elif wx < 0.5:
-                    # NEAREST according to weight
-                    if wy < 0.5:
-                        ok = v00_ok
-                        value = v00
+                window_w = max(window_w, x_index[out_x, 1] - x_index[out_x, 0] + 1)
+            max_value_count = window_h * window_w
+            for row in prange(grid_count * out_h):
+                i = row // out_h
+                out_y = row % out_h
+                mask_i = i if use_mask else 0
+                # Scratch buffers are row-local so that rows can be processed independently
+                values = np.zeros((max_value_count,), dtype=src.dtype)
+                frequencies = np.zeros((max_value_count,), dtype=np.float64)
+                src_y0 = y_index[out_y, 0]
+                src_y1 = y_index[out_y, 1]
+                wy0 = y_weight[out_y, 0]
+                wy1 = y_weight[out_y, 1]
+                for out_x in range(out_w):
+                    src_x0 = x_index[out_x, 0]
+                    src_x1 = x_index[out_x, 1]
+                    wx0 = x_weight[out_x, 0]
+                    wx1 = x_weight[out_x, 1]
+                    value_count = 0
+                    for src_y in range(src_y0, src_y1 + 1):
+                        wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
+                        for src_x in range(src_x0, src_x1 + 1):
+                            wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
+                            v = src[i, src_y, src_x]
+                            if np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x]):
+                                w = wx * wy
+                                found = False
+                                for k in range(value_count):
+                                    if v == values[k]:
+                                        frequencies[k] += w
+                                        found = True
+                                        break
+                                if not found:
+                                    values[value_count] = v
+                                    frequencies[value_count] = w
+                                    value_count += 1
+                    out[i, out_y, out_x] = _select_mode(values, frequencies, value_count, mode_rank, fill_value)
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = mode_rank > value_count
+
+        elif method == DS_MEAN or method == DS_VAR or method == DS_STD:
+            # Area weights are separable: each source row is first aggregated along x into the
+            # weighted sums of the target row, which are then accumulated along y. For DS_VAR and DS_STD,
+            # values are summed relative to the first valid value of their target cell, see _cell_references()
+            with_squares = method != DS_MEAN
+            for row in prange(grid_count * out_h):
+                i = row // out_h
+                out_y = row % out_h
+                mask_i = i if use_mask else 0
+                src_y0 = y_index[out_y, 0]
+                src_y1 = y_index[out_y, 1]
+                wy0 = y_weight[out_y, 0]
+                wy1 = y_weight[out_y, 1]
+                refs = np.zeros((out_w,), dtype=np.float64)
+                if with_squares:
+                    _cell_references(src[i], mask[mask_i], use_mask, src_y0, src_y1, x_index, refs)
+                w_sums = np.zeros((out_w,), dtype=np.float64)
+                wv_sums = np.zeros((out_w,), dtype=np.float64)
+                wvv_sums = np.zeros((out_w,), dtype=np.float64)
+                for src_y in range(src_y0, src_y1 + 1):
+                    wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
+                    if valid:
+                        _accumulate_valid_row(src[i, src_y], x_index, x_weight, wy, refs, with_squares,
+                                              w_sums, wv_sums, wvv_sums)
                     else:
-                        ok = v10_ok
-                        value = v10
-                else:
-                    # NEAREST according to weight
-                    if wy < 0.5:
-                        ok = v01_ok
-                        value = v01
+                        _accumulate_row(src[i, src_y], mask[mask_i, src_y if use_mask else 0], use_mask,
+                                        x_index, x_weight, wy, refs, with_squares, w_sums, wv_sums, wvv_sums)
+                for out_x in range(out_w):
+                    w_sum = w_sums[out_x]
+                    wv_sum = wv_sums[out_x]
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = w_sum < _EPS
+                    if w_sum < _EPS:
+                        out[i, out_y, out_x] = fill_value
+                    elif method == DS_MEAN:
+                        out[i, out_y, out_x] = wv_sum / w_sum
                     else:
-                        ok = v11_ok
-                        value = v11
-                if ok:
-                    out[out_y, out_x] = value
-                else:
-                    out[out_y, out_x] = fill_value
+                        # rounding may leave a tiny negative variance for constant values
+                        var = max((wvv_sums[out_x] * w_sum - wv_sum * wv_sum) / w_sum / w_sum, 0.0)
+                        out[i, out_y, out_x] = np.sqrt(var) if method == DS_STD else var
+        else:
+            raise ValueError('invalid downsampling method')
 
-    else:
-        raise ValueError('invalid upsampling method')
+        return out
 
-    return out
+    return kernel
 
 
-# This function will be JIT-compiled by Numba with nopython=True,
-# therefore all arg types must be either primitive scalars or numpy arrays.
+# This function creates a kernel for the given constants, which is JIT-compiled by Numba with nopython=True
+# by _get_kernel(), therefore all arg types must be either primitive scalars or numpy arrays.
 # Key-value args are not allowed.
 #
-@jit(nopython=True)
-def _downsample_2d(src, mask, use_mask, method, fill_value, mode_rank, out):
-    src_w = src.shape[-1]
-    src_h = src.shape[-2]
-    out_w = out.shape[-1]
-    out_h = out.shape[-2]
-
-    if src_w == out_w and src_h == out_h:
-        return src
+# Block variant of _downsample_kernel() for integer downsampling factors *factor_y* and *factor_x*.
+# Every target cell aggregates a block of factor_y x factor_x source cells, which all contribute
+# with weight one, so no index tables and weights are needed. For DS_MEAN, DS_VAR, and DS_STD,
+# blocks are accumulated row by row into sums of the target row, whose inner loops run over
+# consecutive source cells.
+#
+def _downsample_block_kernel(method, use_mask, valid=False):
+    def kernel(src, mask, fill_value, mode_rank, factor_y, factor_x, out, out_mask):
+        grid_count = out.shape[0]
+        out_w = out.shape[-1]
+        out_h = out.shape[-2]
+        with_out_mask = out_mask.size > 0
 
-    if out_w > src_w or out_h > src_h:
-        raise ValueError("invalid target size")
+        if method == DS_FIRST or method == DS_LAST:
+            for row in prange(grid_count * out_h):
+                i = row // out_h
+                out_y = row % out_h
+                mask_i = i if use_mask else 0
+                src_y0 = out_y * factor_y
+                for out_x in range(out_w):
+                    src_x0 = out_x * factor_x
+                    done = False
+                    found = False
+                    value = fill_value
+                    for src_y in range(src_y0, src_y0 + factor_y):
+                        for src_x in range(src_x0, src_x0 + factor_x):
+                            v = src[i, src_y, src_x]
+                            if np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x]):
+                                value = v
+                                found = True
+                                if method == DS_FIRST:
+                                    done = True
+                                    break
+                        if done:
+                            break
+                    out[i, out_y, out_x] = value
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = not found
 
-    scale_x = src_w / out_w
-    scale_y = src_h / out_h
+        elif method == DS_MODE:
+            max_value_count = factor_y * factor_x
+            for row in prange(grid_count * out_h):
+                i = row // out_h
+                out_y = row % out_h
+                mask_i = i if use_mask else 0
+                values = np.zeros((max_value_count,), dtype=src.dtype)
+                frequencies = np.zeros((max_value_count,), dtype=np.int64)
+                src_y0 = out_y * factor_y
+                for out_x in range(out_w):
+                    src_x0 = out_x * factor_x
+                    value_count = 0
+                    for src_y in range(src_y0, src_y0 + factor_y):
+                        for src_x in range(src_x0, src_x0 + factor_x):
+                            v = src[i, src_y, src_x]
+                            if np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x]):
+                                found = False
+                                for k in range(value_count):
+                                    if v == values[k]:
+                                        frequencies[k] += 1
+                                        found = True
+                                        break
+                                if not found:
+                                    values[value_count] = v
+                                    frequencies[value_count] = 1
+                                    value_count += 1
+                    out[i, out_y, out_x] = _select_mode(values, frequencies, value_count, mode_rank, fill_value)
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = mode_rank > value_count
 
-    if method == DS_FIRST or method == DS_LAST:
-        for out_y in range(out_h):
-            src_yf0 = scale_y * out_y
-            src_yf1 = src_yf0 + scale_y
-            src_y0 = int(src_yf0)
-            src_y1 = int(src_yf1)
-            if src_y1 == src_yf1 and src_y1 > src_y0:
-                src_y1 -= 1
-            for out_x in range(out_w):
-                src_xf0 = scale_x * out_x
-                src_xf1 = src_xf0 + scale_x
-                src_x0 = int(src_xf0)
-                src_x1 = int(src_xf1)
-                if src_x1 == src_xf1 and src_x1 > src_x0:
-                    src_x1 -= 1
-                done = False
-                value = fill_value
-                for src_y in range(src_y0, src_y1 + 1):
-                    for src_x in range(src_x0, src_x1 + 1):
-                        v = src[src_y, src_x]
-                        if np.isfinite(v) and not (use_mask and mask[src_y, src_x]):
-                            value = v
-                            if method == DS_FIRST:
-                                done = True
+        elif method == DS_MEAN or method == DS_VAR or method == DS_STD:
+            with_squares = method != DS_MEAN
+            for row in prange(grid_count * out_h):
+                i = row // out_h
+                out_y = row % out_h
+                mask_i = i if use_mask else 0
+                src_y0 = out_y * factor_y
+                # Values are summed relative to the first valid value of their target cell, see _cell_references()
+                refs = np.zeros((out_w,), dtype=np.float64)
+                for out_x in range(out_w):
+                    src_x0 = out_x * factor_x
+                    found = False
+                    for src_y in range(src_y0, src_y0 + factor_y):
+                        for src_x in range(src_x0, src_x0 + factor_x):
+                            v = src[i, src_y, src_x]
+                            if valid or (np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x])):
+                                refs[out_x] = v
+                                found = True
                                 break
-                    if done:
-                        break
-                out[out_y, out_x] = value
+                        if found:
+                            break
+                counts = np.zeros((out_w,), dtype=np.int64)
+                d_sums = np.zeros((out_w,), dtype=np.float64)
+                dd_sums = np.zeros((out_w,), dtype=np.float64)
+                for src_y in range(src_y0, src_y0 + factor_y):
+                    for out_x in range(out_w):
+                        src_x0 = out_x * factor_x
+                        count = 0
+                        d_sum = 0.0
+                        dd_sum = 0.0
+                        ref = refs[out_x]
+                        if valid:
+                            count = factor_x
+                            for src_x in range(src_x0, src_x0 + factor_x):
+                                d = src[i, src_y, src_x] - ref
+                                d_sum += d
+                                if with_squares:
+                                    dd_sum += d * d
+                            counts[out_x] += count
+                            d_sums[out_x] += d_sum
+                            dd_sums[out_x] += dd_sum
+                            continue
+                        for src_x in range(src_x0, src_x0 + factor_x):
+                            v = src[i, src_y, src_x]
+                            if np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x]):
+                                d = v - ref
+                                count += 1
+                                d_sum += d
+                                if with_squares:
+                                    dd_sum += d * d
+                        counts[out_x] += count
+                        d_sums[out_x] += d_sum
+                        dd_sums[out_x] += dd_sum
+                for out_x in range(out_w):
+                    count = counts[out_x]
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = count == 0
+                    if count == 0:
+                        out[i, out_y, out_x] = fill_value
+                    elif method == DS_MEAN:
+                        out[i, out_y, out_x] = refs[out_x] + d_sums[out_x] / count
+                    else:
+                        d_sum = d_sums[out_x]
+                        # rounding may leave a tiny negative variance for constant values
+                        var = max((dd_sums[out_x] * count - d_sum * d_sum) / count / count, 0.0)
+                        out[i, out_y, out_x] = np.sqrt(var) if method == DS_STD else var
+
+        else:
+            raise ValueError('invalid downsampling method')
+
+        return out
+
+    return kernel
+
 
-    elif method == DS_MODE:
-        max_value_count = int(scale_x + 1) * int(scale_y + 1)
-        values = np.zeros((max_value_count,), dtype=src.dtype)
-        frequencies = np.zeros((max_value_count,), dtype=np.uint32)
+# This function creates a kernel for the given constants, which is JIT-compiled by Numba with nopython=True
+# by _get_kernel(), therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Histogram variant of _downsample_kernel() for DS_MODE on grids of integer class values less than
+# *class_count*. Class frequencies are accumulated by direct indexing into a dense histogram, of which only
+# the entries of the classes seen in a target cell are visited and reset. If *fractions* is not empty,
+# it receives the fractions of the valid area of each target cell covered by each class.
+#
+def _downsample_histogram_kernel(use_mask):
+    def kernel(src, mask, class_count, mode_rank, fill_value, y_index, y_weight, x_index, x_weight, out, fractions,
+               out_mask):
+        grid_count = out.shape[0]
+        out_w = out.shape[-1]
+        out_h = out.shape[-2]
+        with_fractions = fractions.size > 0
+        with_out_mask = out_mask.size > 0
+
+        window_h = 1
         for out_y in range(out_h):
-            src_yf0 = scale_y * out_y
-            src_yf1 = src_yf0 + scale_y
-            src_y0 = int(src_yf0)
-            src_y1 = int(src_yf1)
-            wy0 = 1.0 - (src_yf0 - src_y0)
-            wy1 = src_yf1 - src_y1
-            if wy1 < _EPS:
-                wy1 = 1.0
-                if src_y1 > src_y0:
-                    src_y1 -= 1
+            window_h = max(window_h, y_index[out_y, 1] - y_index[out_y, 0] + 1)
+        window_w = 1
+        for out_x in range(out_w):
+            window_w = max(window_w, x_index[out_x, 1] - x_index[out_x, 0] + 1)
+        max_value_count = min(class_count, window_h * window_w)
+
+        for row in prange(grid_count * out_h):
+            i = row // out_h
+            out_y = row % out_h
+            mask_i = i if use_mask else 0
+            histogram = np.zeros((class_count,), dtype=np.float64)
+            classes = np.zeros((max_value_count,), dtype=np.int64)
+            frequencies = np.zeros((max_value_count,), dtype=np.float64)
+            src_y0 = y_index[out_y, 0]
+            src_y1 = y_index[out_y, 1]
+            wy0 = y_weight[out_y, 0]
+            wy1 = y_weight[out_y, 1]
             for out_x in range(out_w):
-                src_xf0 = scale_x * out_x
-                src_xf1 = src_xf0 + scale_x
-                src_x0 = int(src_xf0)
-                src_x1 = int(src_xf1)
-                wx0 = 1.0 - (src_xf0 - src_x0)
-                wx1 = src_xf1 - src_x1
-                if wx1 < _EPS:
-                    wx1 = 1.0
-                    if src_x1 > src_x0:
-                        src_x1 -= 1
+                src_x0 = x_index[out_x, 0]
+                src_x1 = x_index[out_x, 1]
+                wx0 = x_weight[out_x, 0]
+                wx1 = x_weight[out_x, 1]
                 value_count = 0
+                w_sum = 0.0
                 for src_y in range(src_y0, src_y1 + 1):
                     wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
                     for src_x in range(src_x0, src_x1 + 1):
                         wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
-                        v = src[src_y, src_x]
-                        if np.isfinite(v) and not (use_mask and mask[src_y, src_x]):
+                        v = src[i, src_y, src_x]
+                        if 0 <= v < class_count and not (use_mask and mask[mask_i, src_y, src_x]):
                             w = wx * wy
-                            found = False
-                            for i in range(value_count):
-                                if v == values[i]:
-                                    frequencies[i] += w
-                                    found = True
-                                    break
-                            if not found:
-                                values[value_count] = v
-                                frequencies[value_count] = w
+                            if histogram[v] == 0.0:
+                                classes[value_count] = v
                                 value_count += 1
-                w_max = -1.
-                value = fill_value
-                if mode_rank == 1:
-                    for i in range(value_count):
-                        w = frequencies[i]
-                        if w > w_max:
-                            w_max = w
-                            value = values[i]
-                elif mode_rank <= max_value_count:
-                    max_frequencies = np.full(mode_rank, -1.0, dtype=np.float64)
-                    indices = np.zeros(mode_rank, dtype=np.int64)
-                    for i in range(value_count):
-                        w = frequencies[i]
-                        for j in range(mode_rank):
-                            if w > max_frequencies[j]:
-                                max_frequencies[j] = w
-                                indices[j] = i
-                                break
-                    value = values[indices[mode_rank - 1]]
+                            histogram[v] += w
+                            w_sum += w
+                for k in range(value_count):
+                    frequencies[k] = histogram[classes[k]]
+                    histogram[classes[k]] = 0.0
+                out[i, out_y, out_x] = _select_mode(classes, frequencies, value_count, mode_rank, fill_value)
+                if with_out_mask:
+                    out_mask[i, out_y, out_x] = mode_rank > value_count
+                if with_fractions:
+                    for k in range(value_count):
+                        fractions[i, classes[k], out_y, out_x] = frequencies[k] / w_sum
 
-                out[out_y, out_x] = value
+        return out
 
-    elif method == DS_MEAN:
-        for out_y in range(out_h):
-            src_yf0 = scale_y * out_y
-            src_yf1 = src_yf0 + scale_y
-            src_y0 = int(src_yf0)
-            src_y1 = int(src_yf1)
-            wy0 = 1.0 - (src_yf0 - src_y0)
-            wy1 = src_yf1 - src_y1
-            if wy1 < _EPS:
-                wy1 = 1.0
-                if src_y1 > src_y0:
-                    src_y1 -= 1
+    return kernel
+
+
+# This function creates a kernel for the given constants, which is JIT-compiled by Numba with nopython=True
+# by _get_kernel(), therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Multi-statistics variant of _downsample_kernel(). Computes the aggregation *stats*, an array of
+# DS_* constants, in a single traversal of the contributing source grid cells and writes them into
+# *out*, which has the shape (stat_count, grid_count, height, width). Values are summed relative to
+# the first valid value of a target cell, which avoids cancellation in the variance.
+#
+def _downsample_stats_kernel(use_mask):
+    def kernel(src, mask, stats, fill_value, y_index, y_weight, x_index, x_weight, out, out_mask):
+        grid_count = out.shape[1]
+        out_w = out.shape[-1]
+        out_h = out.shape[-2]
+        with_out_mask = out_mask.size > 0
+
+        for row in prange(grid_count * out_h):
+            i = row // out_h
+            out_y = row % out_h
+            mask_i = i if use_mask else 0
+            src_y0 = y_index[out_y, 0]
+            src_y1 = y_index[out_y, 1]
+            wy0 = y_weight[out_y, 0]
+            wy1 = y_weight[out_y, 1]
+            area_y = 0.0
+            for src_y in range(src_y0, src_y1 + 1):
+                area_y += wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
             for out_x in range(out_w):
-                src_xf0 = scale_x * out_x
-                src_xf1 = src_xf0 + scale_x
-                src_x0 = int(src_xf0)
-                src_x1 = int(src_xf1)
-                wx0 = 1.0 - (src_xf0 - src_x0)
-                wx1 = src_xf1 - src_x1
-                if wx1 < _EPS:
-                    wx1 = 1.0
-                    if src_x1 > src_x0:
-                        src_x1 -= 1
-                v_sum = 0.0
+                src_x0 = x_index[out_x, 0]
+                src_x1 = x_index[out_x, 1]
+                wx0 = x_weight[out_x, 0]
+                wx1 = x_weight[out_x, 1]
+                area_x = 0.0
+                count = 0
                 w_sum = 0.0
+                wd_sum = 0.0
+                wdd_sum = 0.0
+                ref = 0.0
+                v_first = 0.0
+                v_last = 0.0
+                v_min = 0.0
+                v_max = 0.0
+                for src_x in range(src_x0, src_x1 + 1):
+                    area_x += wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
                 for src_y in range(src_y0, src_y1 + 1):
                     wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
                     for src_x in range(src_x0, src_x1 + 1):
                         wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
-                        v = src[src_y, src_x]
-                        if np.isfinite(v) and not (use_mask and mask[src_y, src_x]):
+                        v = src[i, src_y, src_x]
+                        if np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x]):
                             w = wx * wy
-                            v_sum += w * v
+                            if count == 0:
+                                ref = np.float64(v)
+                                v_first = v
+                                v_min = v
+                                v_max = v
+                            elif v < v_min:
+                                v_min = v
+                            elif v > v_max:
+                                v_max = v
+                            v_last = v
+                            d = v - ref
+                            count += 1
                             w_sum += w
-                if w_sum < _EPS:
-                    out[out_y, out_x] = fill_value
-                else:
-                    out[out_y, out_x] = v_sum / w_sum
+                            wd_sum += w * d
+                            wdd_sum += w * d * d
+                for s in range(stats.shape[0]):
+                    method = stats[s]
+                    if with_out_mask:
+                        out_mask[s, i, out_y, out_x] = method != DS_COUNT and method != DS_COVERAGE \
+                                                       and (count == 0 or w_sum < _EPS)
+                    if method == DS_COUNT:
+                        out[s, i, out_y, out_x] = count
+                    elif method == DS_COVERAGE:
+                        out[s, i, out_y, out_x] = w_sum / (area_x * area_y)
+                    elif count == 0 or w_sum < _EPS:
+                        out[s, i, out_y, out_x] = fill_value
+                    elif method == DS_FIRST:
+                        out[s, i, out_y, out_x] = v_first
+                    elif method == DS_LAST:
+                        out[s, i, out_y, out_x] = v_last
+                    elif method == DS_MIN:
+                        out[s, i, out_y, out_x] = v_min
+                    elif method == DS_MAX:
+                        out[s, i, out_y, out_x] = v_max
+                    elif method == DS_MEAN:
+                        out[s, i, out_y, out_x] = ref + wd_sum / w_sum
+                    else:
+                        # rounding may leave a tiny negative variance for constant values
+                        var = max((wdd_sum * w_sum - wd_sum * wd_sum) / w_sum / w_sum, 0.0)
+                        out[s, i, out_y, out_x] = np.sqrt(var) if method == DS_STD else var
 
-    elif method == DS_VAR or method == DS_STD:
-        for out_y in range(out_h):
-            src_yf0 = scale_y * out_y
-            src_yf1 = src_yf0 + scale_y
-            src_y0 = int(src_yf0)
-            src_y1 = int(src_yf1)
-            wy0 = 1.0 - (src_yf0 - src_y0)
-            wy1 = src_yf1 - src_y1
-            if wy1 < _EPS:
-                wy1 = 1.0
-                if src_y1 > src_y0:
-                    src_y1 -= 1
-            for out_x in range(out_w):
-                src_xf0 = scale_x * out_x
-                src_xf1 = src_xf0 + scale_x
-                src_x0 = int(src_xf0)
-                src_x1 = int(src_xf1)
-                wx0 = 1.0 - (src_xf0 - src_x0)
-                wx1 = src_xf1 - src_x1
-                if wx1 < _EPS:
-                    wx1 = 1.0
-                    if src_x1 > src_x0:
-                        src_x1 -= 1
-                v_sum = 0.0
-                w_sum = 0.0
-                wv_sum = 0.0
-                wvv_sum = 0.0
+        return out
+
+    return kernel
+
+
+@jit(nopython=True, cache=True)
+def _select_mode(values, frequencies, value_count, mode_rank, fill_value):
+    """
+    Select the value with the *mode_rank*-th highest frequency from the first *value_count* values and
+    their frequencies. Values of equal frequency are ranked in the order of their first occurrence.
+    """
+    if mode_rank > value_count:
+        return fill_value
+    if mode_rank == 1:
+        k_max = 0
+        for k in range(1, value_count):
+            if frequencies[k] > frequencies[k_max]:
+                k_max = k
+        return values[k_max]
+    # Partial selection: keep the indices of the mode_rank most frequent values, sorted by frequency
+    top_indices = np.zeros(mode_rank, dtype=np.int64)
+    top_count = 0
+    for k in range(value_count):
+        w = frequencies[k]
+        j = top_count
+        while j > 0 and frequencies[top_indices[j - 1]] < w:
+            j -= 1
+        if j < mode_rank:
+            for m in range(min(top_count, mode_rank - 1), j, -1):
+                top_indices[m] = top_indices[m - 1]
+            top_indices[j] = k
+            if top_count < mode_rank:
+                top_count += 1
+    return values[top_indices[mode_rank - 1]]
+
+
+@jit(nopython=True, cache=True)
+def _aggregate_row(src, mask, use_mask, valid, method, y_index, y_weight, x_index, x_weight, refs, w_sums, wv_sums,
+                   wvv_sums, out_row, out_valid):
+    """
+    Aggregate the source rows *y_index[0]* to *y_index[1]* into a single row of DS_MEAN, DS_VAR, or
+    DS_STD values *out_row* as _downsample_kernel() does, and mark its valid cells in *out_valid*.
+    The references and sums are scratch buffers of the row's length.
+    """
+    with_squares = method != DS_MEAN
+    refs[:] = 0.0
+    if with_squares:
+        _cell_references(src, mask, use_mask, y_index[0], y_index[1], x_index, refs)
+    w_sums[:] = 0.0
+    wv_sums[:] = 0.0
+    wvv_sums[:] = 0.0
+    for src_y in range(y_index[0], y_index[1] + 1):
+        wy = y_weight[0] if (src_y == y_index[0]) else y_weight[1] if (src_y == y_index[1]) else 1.0
+        if valid:
+            _accumulate_valid_row(src[src_y], x_index, x_weight, wy, refs, with_squares, w_sums, wv_sums, wvv_sums)
+        else:
+            _accumulate_row(src[src_y], mask[src_y if use_mask else 0], use_mask,
+                            x_index, x_weight, wy, refs, with_squares, w_sums, wv_sums, wvv_sums)
+    for x in range(out_row.shape[0]):
+        w_sum = w_sums[x]
+        wv_sum = wv_sums[x]
+        if w_sum < _EPS:
+            out_valid[x] = False
+            continue
+        if method == DS_MEAN:
+            out_row[x] = wv_sum / w_sum
+        else:
+            # rounding may leave a tiny negative variance for constant values
+            var = max((wvv_sums[x] * w_sum - wv_sum * wv_sum) / w_sum / w_sum, 0.0)
+            out_row[x] = np.sqrt(var) if method == DS_STD else var
+        out_valid[x] = np.isfinite(out_row[x])
+
+
+@jit(nopython=True, cache=True)
+def _cell_references(src, mask, use_mask, src_y0, src_y1, x_index, refs):
+    """
+    Set *refs* to the first valid value of each target cell of the source rows *src_y0* to *src_y1*,
+    or to zero if there is none. Sums of values relative to it avoid cancellation in the variance.
+    As the references depend on the target cells only, so does the rounding, whatever source grid window
+    the target cells are computed from.
+    """
+    for out_x in range(x_index.shape[0]):
+        refs[out_x] = 0.0
+        found = False
+        for src_y in range(src_y0, src_y1 + 1):
+            for src_x in range(x_index[out_x, 0], x_index[out_x, 1] + 1):
+                v = src[src_y, src_x]
+                if np.isfinite(v) and not (use_mask and mask[src_y, src_x]):
+                    refs[out_x] = v
+                    found = True
+                    break
+            if found:
+                break
+
+
+@jit(nopython=True, cache=True)
+def _all_finite(src):
+    """
+    Test whether all cells of the grid stack *src* are finite.
+    """
+    for i in range(src.shape[0]):
+        for y in range(src.shape[1]):
+            for x in range(src.shape[2]):
+                if not np.isfinite(src[i, y, x]):
+                    return False
+    return True
+
+
+@jit(nopython=True, cache=True)
+def _accumulate_valid_row(src_row, x_index, x_weight, wy, refs, with_squares, w_sums, wv_sums, wvv_sums):
+    """
+    Variant of :py:func:`_accumulate_row` for source rows whose cells are all valid, so that
+    the sum of weights of a target cell is known beforehand and no cell is tested for validity.
+    """
+    for out_x in range(x_index.shape[0]):
+        src_x0 = x_index[out_x, 0]
+        src_x1 = x_index[out_x, 1]
+        ref = refs[out_x]
+        wx0 = x_weight[out_x, 0]
+        v = src_row[src_x0] - ref
+        w_sum = wx0
+        wv_sum = wx0 * v
+        wvv_sum = wx0 * v * v if with_squares else 0.0
+        for src_x in range(src_x0 + 1, src_x1):
+            v = src_row[src_x] - ref
+            wv_sum += v
+            if with_squares:
+                wvv_sum += 1.0 * v * v
+        if src_x1 > src_x0:
+            wx1 = x_weight[out_x, 1]
+            v = src_row[src_x1] - ref
+            w_sum += (src_x1 - src_x0 - 1) + wx1
+            wv_sum += wx1 * v
+            if with_squares:
+                wvv_sum += wx1 * v * v
+        w_sums[out_x] += wy * w_sum
+        wv_sums[out_x] += wy * wv_sum
+        if with_squares:
+            wvv_sums[out_x] += wy * wvv_sum
+
+
+@jit(nopython=True, cache=True)
+def _accumulate_row(src_row, mask_row, use_mask, x_index, x_weight, wy, refs, with_squares,
+                    w_sums, wv_sums, wvv_sums):
+    """
+    Aggregate the valid cells of a source row along x and add the results, weighted by *wy*,
+    to the sums of weights, weighted values and, if *with_squares* is set, weighted squared values
+    of the target row. Values are taken relative to the reference *refs* of their target cell. Only the first
+    and last source cells of a target cell have fractional weights, so the loop over the cells in between needs
+    no weights at all.
+    """
+    for out_x in range(x_index.shape[0]):
+        src_x0 = x_index[out_x, 0]
+        src_x1 = x_index[out_x, 1]
+        ref = refs[out_x]
+        w_sum = 0.0
+        wv_sum = 0.0
+        wvv_sum = 0.0
+        v = src_row[src_x0]
+        if np.isfinite(v) and not (use_mask and mask_row[src_x0]):
+            v -= ref
+            wx = x_weight[out_x, 0]
+            w_sum += wx
+            wv_sum += wx * v
+            if with_squares:
+                wvv_sum += wx * v * v
+        for src_x in range(src_x0 + 1, src_x1):
+            v = src_row[src_x]
+            if np.isfinite(v) and not (use_mask and mask_row[src_x]):
+                v -= ref
+                w_sum += 1.0
+                wv_sum += v
+                if with_squares:
+                    wvv_sum += 1.0 * v * v
+        if src_x1 > src_x0:
+            v = src_row[src_x1]
+            if np.isfinite(v) and not (use_mask and mask_row[src_x1]):
+                v -= ref
+                wx = x_weight[out_x, 1]
+                w_sum += wx
+                wv_sum += wx * v
+                if with_squares:
+                    wvv_sum += wx * v * v
+        w_sums[out_x] += wy * w_sum
+        wv_sums[out_x] += wy * wv_sum
+        if with_squares:
+            wvv_sums[out_x] += wy * wvv_sum
+
+
+# This function creates a kernel for the given constants, which is JIT-compiled by Numba with nopython=True
+# by _get_kernel(), therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Integral image variant of _downsample_kernel() for DS_MEAN, DS_VAR, and DS_STD, which is used for
+# large downsampling factors. For each target row, the source rows it covers are summed up column-wise,
+# weighted by their row weights. Prefix sums of these column sums then give the weighted sums of any
+# target cell in O(1), including its fractional edge columns.
+#
+# Numerical drift is limited by accumulating in float64, by computing an integral image per target
+# row rather than for the whole grid, and by summing values relative to the first valid value of a row
+# band, which also avoids cancellation in the variance.
+# If *valid* is set, all cells of *src* are known to be valid, and the kernel tests no cell for validity.
+#
+def _downsample_integral_kernel(method, use_mask, valid=False):
+    def kernel(src, mask, fill_value, y_index, y_weight, x_index, x_weight, out, out_mask):
+        grid_count = out.shape[0]
+        out_w = out.shape[-1]
+        out_h = out.shape[-2]
+        src_w = src.shape[-1]
+        with_out_mask = out_mask.size > 0
+
+        if method != DS_MEAN and method != DS_VAR and method != DS_STD:
+            raise ValueError('invalid downsampling method')
+
+        with_squares = method != DS_MEAN
+        for row in prange(grid_count * out_h):
+            i = row // out_h
+            out_y = row % out_h
+            mask_i = i if use_mask else 0
+            src_y0 = y_index[out_y, 0]
+            src_y1 = y_index[out_y, 1]
+            wy0 = y_weight[out_y, 0]
+            wy1 = y_weight[out_y, 1]
+
+            ref = 0.0
+            found = False
+            for src_y in range(src_y0, src_y1 + 1):
+                for src_x in range(src_w):
+                    v = src[i, src_y, src_x]
+                    if valid or (np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x])):
+                        ref = np.float64(v)
+                        found = True
+                        break
+                if found:
+                    break
+
+            w_sums = np.zeros((src_w + 1,), dtype=np.float64)
+            wd_sums = np.zeros((src_w + 1,), dtype=np.float64)
+            wdd_sums = np.zeros((src_w + 1,), dtype=np.float64)
+            if found:
                 for src_y in range(src_y0, src_y1 + 1):
                     wy = wy0 if (src_y == src_y0) else wy1 if (src_y == src_y1) else 1.0
-                    for src_x in range(src_x0, src_x1 + 1):
-                        wx = wx0 if (src_x == src_x0) else wx1 if (src_x == src_x1) else 1.0
-                        v = src[src_y, src_x]
-                        if np.isfinite(v) and not (use_mask and mask[src_y, src_x]):
-                            w = wx * wy
-                            v_sum += v
-                            w_sum += w
-                            wv_sum += w * v
-                            wvv_sum += w * v * v
+                    if valid:
+                        for src_x in range(src_w):
+                            d = src[i, src_y, src_x] - ref
+                            w_sums[src_x + 1] += wy
+                            wd_sums[src_x + 1] += wy * d
+                            if with_squares:
+                                wdd_sums[src_x + 1] += wy * d * d
+                        continue
+                    for src_x in range(src_w):
+                        v = src[i, src_y, src_x]
+                        if np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x]):
+                            d = v - ref
+                            w_sums[src_x + 1] += wy
+                            wd_sums[src_x + 1] += wy * d
+                            if with_squares:
+                                wdd_sums[src_x + 1] += wy * d * d
+                for src_x in range(src_w):
+                    w_sums[src_x + 1] += w_sums[src_x]
+                    wd_sums[src_x + 1] += wd_sums[src_x]
+                    if with_squares:
+                        wdd_sums[src_x + 1] += wdd_sums[src_x]
+
+            for out_x in range(out_w):
+                if not found:
+                    out[i, out_y, out_x] = fill_value
+                    if with_out_mask:
+                        out_mask[i, out_y, out_x] = True
+                    continue
+                src_x0 = x_index[out_x, 0]
+                src_x1 = x_index[out_x, 1]
+                wx0 = x_weight[out_x, 0]
+                wx1 = x_weight[out_x, 1]
+                w_sum = wx0 * (w_sums[src_x0 + 1] - w_sums[src_x0])
+                wd_sum = wx0 * (wd_sums[src_x0 + 1] - wd_sums[src_x0])
+                wdd_sum = wx0 * (wdd_sums[src_x0 + 1] - wdd_sums[src_x0])
+                if src_x1 > src_x0:
+                    w_sum += (w_sums[src_x1] - w_sums[src_x0 + 1]) + wx1 * (w_sums[src_x1 + 1] - w_sums[src_x1])
+                    wd_sum += (wd_sums[src_x1] - wd_sums[src_x0 + 1]) + wx1 * (wd_sums[src_x1 + 1] - wd_sums[src_x1])
+                    wdd_sum += ((wdd_sums[src_x1] - wdd_sums[src_x0 + 1])
+                                + wx1 * (wdd_sums[src_x1 + 1] - wdd_sums[src_x1]))
+                if with_out_mask:
+                    out_mask[i, out_y, out_x] = w_sum < _EPS
                 if w_sum < _EPS:
-                    out[out_y, out_x] = fill_value
+                    out[i, out_y, out_x] = fill_value
+                elif method == DS_MEAN:
+                    out[i, out_y, out_x] = ref + wd_sum / w_sum
                 else:
-                    out[out_y, out_x] = (wvv_sum * w_sum - wv_sum * wv_sum) / w_sum / w_sum
-        if method == DS_STD:
-            out = np.sqrt(out).astype(out.dtype)
-    else:
-        raise ValueError('invalid upsampling method')
+                    # rounding may leave a tiny negative variance for constant values
+                    var = max((wdd_sum * w_sum - wd_sum * wd_sum) / w_sum / w_sum, 0.0)
+                    out[i, out_y, out_x] = np.sqrt(var) if method == DS_STD else var
 
-    return out
+        return out
+
+    return kernel
+
+
+# This function creates a kernel for the given constants, which is JIT-compiled by Numba with nopython=True
+# by _get_kernel(), therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Computes the first level of a pyramid from the source grid stack *src*. Every target cell aggregates a
+# block of 2 x 2 source cells, clipped at the grid borders. *planes* of shape (3, grid_count, height, width)
+# receives the count, mean, and sum of squared deviations of the valid source cells of each target cell.
+#
+def _pyramid_base_kernel(method, use_mask):
+    def kernel(src, mask, fill_value, planes, out):
+        grid_count = out.shape[0]
+        out_w = out.shape[-1]
+        out_h = out.shape[-2]
+        src_w = src.shape[-1]
+        src_h = src.shape[-2]
+
+        for row in prange(grid_count * out_h):
+            i = row // out_h
+            out_y = row % out_h
+            mask_i = i if use_mask else 0
+            for out_x in range(out_w):
+                w_sum = 0.0
+                mean = 0.0
+                m2 = 0.0
+                for src_y in range(2 * out_y, min(2 * out_y + 2, src_h)):
+                    for src_x in range(2 * out_x, min(2 * out_x + 2, src_w)):
+                        v = src[i, src_y, src_x]
+                        if np.isfinite(v) and not (use_mask and mask[mask_i, src_y, src_x]):
+                            # Welford's update
+                            w_sum += 1.0
+                            delta = v - mean
+                            mean += delta / w_sum
+                            m2 += delta * (v - mean)
+                _set_pyramid_cell(method, fill_value, w_sum, mean, m2, planes, out, i, out_y, out_x)
+
+        return out
+
+    return kernel
+
+
+# This function creates a kernel for the given constants, which is JIT-compiled by Numba with nopython=True
+# by _get_kernel(), therefore all arg types must be either primitive scalars or numpy arrays.
+# Key-value args are not allowed.
+#
+# Computes the next level of a pyramid from the *src_planes* of the previous one. Every target cell combines
+# the counts, means, and sums of squared deviations of 2 x 2 cells of the previous level, clipped at the grid
+# borders, using the pairwise update of Chan et al., which gives the exact values of the covered source cells.
+#
+def _pyramid_kernel(method):
+    def kernel(src_planes, fill_value, planes, out):
+        grid_count = out.shape[0]
+        out_w = out.shape[-1]
+        out_h = out.shape[-2]
+        src_w = src_planes.shape[-1]
+        src_h = src_planes.shape[-2]
+
+        for row in prange(grid_count * out_h):
+            i = row // out_h
+            out_y = row % out_h
+            for out_x in range(out_w):
+                w_sum = 0.0
+                mean = 0.0
+                m2 = 0.0
+                for src_y in range(2 * out_y, min(2 * out_y + 2, src_h)):
+                    for src_x in range(2 * out_x, min(2 * out_x + 2, src_w)):
+                        w = src_planes[0, i, src_y, src_x]
+                        if w > 0.0:
+                            new_w_sum = w_sum + w
+                            delta = src_planes[1, i, src_y, src_x] - mean
+                            mean += delta * w / new_w_sum
+                            m2 += src_planes[2, i, src_y, src_x] + delta * delta * w_sum * w / new_w_sum
+                            w_sum = new_w_sum
+                _set_pyramid_cell(method, fill_value, w_sum, mean, m2, planes, out, i, out_y, out_x)
+
+        return out
+
+    return kernel
+
+
+@jit(nopython=True, cache=True)
+def _set_pyramid_cell(method, fill_value, w_sum, mean, m2, planes, out, i, out_y, out_x):
+    planes[0, i, out_y, out_x] = w_sum
+    planes[1, i, out_y, out_x] = mean
+    planes[2, i, out_y, out_x] = m2
+    if w_sum == 0.0:
+        out[i, out_y, out_x] = fill_value
+    elif method == DS_MEAN:
+        out[i, out_y, out_x] = mean
+    elif method == DS_VAR:
+        out[i, out_y, out_x] = m2 / w_sum
+    else:
+        out[i, out_y, out_x] = np.sqrt(m2 / w_sum)
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+NAN = np.nan
+
+
+def _make_grid(shape, seed=0):
+    src = np.random.RandomState(seed).uniform(0.0, 10.0, shape)
+    src[3, 4] = NAN
+    src[5:9, 2:7] = NAN
+    return src
+
+
+def _block_stats(src, factor):
+    h, w = src.shape
+    out_h, out_w = (h + factor - 1) // factor, (w + factor - 1) // factor
+    mean = np.full((out_h, out_w), -1.)
+    var = np.full((out_h, out_w), -1.)
+    for y in range(out_h):
+        for x in range(out_w):
+            block = src[y * factor:(y + 1) * factor, x * factor:(x + 1) * factor]
+            block = block[np.isfinite(block)]
+            if block.size:
+                mean[y, x] = block.mean()
+                var[y, x] = block.var()
+    return mean, var
+
+
+class BuildPyramidTest(unittest.TestCase):
+    def test_shapes(self):
+        levels = gtr.build_pyramid(np.zeros((13, 6)))
+        self.assertEqual([(7, 3), (4, 2), (2, 1), (1, 1)], [level.shape for level in levels])
+        levels = gtr.build_pyramid(np.zeros((13, 6)), levels=2)
+        self.assertEqual([(7, 3), (4, 2)], [level.shape for level in levels])
+        self.assertEqual([], gtr.build_pyramid(np.zeros((1, 1))))
+
+    def test_equals_downsample_2d(self):
+        src = _make_grid((32, 16))
+        for method in (gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_STD):
+            levels = gtr.build_pyramid(src, method=method, fill_value=-1.)
+            for level in levels:
+                h, w = level.shape
+                assert_almost_equal(level, gtr.downsample_2d(src, w, h, method=method, fill_value=-1.))
+
+    def test_clipped_blocks(self):
+        src = _make_grid((21, 11))
+        means = gtr.build_pyramid(src, method=gtr.DS_MEAN, fill_value=-1.)
+        variances = gtr.build_pyramid(src, method=gtr.DS_VAR, fill_value=-1.)
+        for k in range(len(means)):
+            mean, var = _block_stats(src, 2 ** (k + 1))
+            assert_almost_equal(means[k], mean)
+            assert_almost_equal(variances[k], var)
+
+    def test_masked(self):
+        src = np.ma.masked_invalid(_make_grid((8, 8)))
+        levels = gtr.build_pyramid(src, fill_value=-1.)
+        self.assertIsInstance(levels[0], np.ma.MaskedArray)
+        assert_equal(levels[0].mask, gtr.downsample_2d(src, 4, 4, fill_value=-1.).mask)
+
+    def test_out(self):
+        src = _make_grid((8, 8))
+        out = [np.zeros((4, 4)), np.zeros((2, 2)), np.zeros((1, 1))]
+        levels = gtr.build_pyramid(src, out=out)
+        for level, buffer in zip(levels, out):
+            self.assertIs(level, buffer)
+        with self.assertRaises(ValueError):
+            gtr.build_pyramid(src, out=out[:2])
+
+    def test_parallel(self):
+        src = _make_grid((37, 29))
+        desired = gtr.build_pyramid(src, method=gtr.DS_STD)
+        actual = gtr.build_pyramid(src, method=gtr.DS_STD, parallel=True)
+        for a, d in zip(actual, desired):
+            assert_equal(a, d)
+
+    def test_invalid_args(self):
+        with self.assertRaises(ValueError):
+            gtr.build_pyramid(np.zeros((8, 8)), method=gtr.DS_MODE)
+        with self.assertRaises(ValueError):
+            gtr.build_pyramid(np.zeros((8, 8)), levels=4)
@@ -97,6 +97,12 @@ class Downsample2dTest(unittest.TestCase):
                                  [[5, 1],
                                   [4, 3]], mode_rank=2)
 
+    def test_aggregation_mode_rank(self):
+        for mode_rank, desired in ((1, 3), (2, 2), (3, 1), (4, 0)):
+            self._test_downsample_2d([[1, 2, 3, 3, 2, 3]],
+                                     1, 1, gtr.DS_MODE, 0,
+                                     [[desired]], mode_rank=mode_rank)
+
     def test_aggregation_mode_masked(self):
 
         self._test_downsample_2d(np.ma.array([[3, 5, 2, 1],
@@ -181,3 +187,83 @@ class Downsample2dTest(unittest.TestCase):
                                  2, 2, gtr.DS_STD, -1,
                                  [[0.36055513, 1.24721913],
                                   [0., 0.82192187]])
+
+    def test_aggregation_var_std_constant(self):
+        # rounding must not yield negative variances or invalid standard deviations
+        for value in (0.1, 1000.1, -273.15):
+            for shape in ((10, 10), (30, 30), (31, 29)):
+                src = np.full(shape, value)
+                for kwargs in ({}, dict(assume_valid=True)):
+                    np.testing.assert_almost_equal(gtr.downsample_2d(src, 3, 3, method=gtr.DS_VAR, **kwargs),
+                                                   np.zeros((3, 3)))
+                    np.testing.assert_almost_equal(gtr.downsample_2d(src, 3, 3, method=gtr.DS_STD, **kwargs),
+                                                   np.zeros((3, 3)))
+
+    def test_aggregation_var_offset(self):
+        # values with a large offset and a small spread keep their variance
+        rs = np.random.RandomState(4)
+        src = rs.uniform(0.0, 1.0, (30, 20))
+        src[5, 6] = NAN
+        for method in (gtr.DS_VAR, gtr.DS_STD):
+            desired = gtr.downsample_2d(src, 7, 9, method=method)
+            np.testing.assert_almost_equal(gtr.downsample_2d(src + 1000.0, 7, 9, method=method), desired, decimal=8)
+
+    def test_parallel(self):
+        src = np.random.RandomState(0).uniform(0.0, 10.0, (31, 40))
+        src[3, 4] = NAN
+        for method in (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_STD):
+            desired = gtr.downsample_2d(src, 13, 7, method=method, fill_value=-1.)
+            actual = gtr.downsample_2d(src, 13, 7, method=method, fill_value=-1., parallel=True)
+            np.testing.assert_array_equal(actual, desired)
+
+        src = np.random.RandomState(0).randint(0, 5, (31, 40))
+        desired = gtr.downsample_2d(src, 13, 7, method=gtr.DS_MODE, fill_value=-1)
+        actual = gtr.downsample_2d(src, 13, 7, method=gtr.DS_MODE, fill_value=-1, parallel=True)
+        np.testing.assert_array_equal(actual, desired)
+
+    def test_aggregation_mean_var_large_factor(self):
+        src = np.random.RandomState(2).uniform(0.0, 10.0, (60, 80))
+        src[10:25, 5:30] = NAN
+        blocks = src.reshape((3, 20, 4, 20)).transpose((0, 2, 1, 3)).reshape((3, 4, 400))
+        np.testing.assert_almost_equal(gtr.downsample_2d(src, 4, 3, method=gtr.DS_MEAN),
+                                       np.nanmean(blocks, axis=-1))
+        np.testing.assert_almost_equal(gtr.downsample_2d(src, 4, 3, method=gtr.DS_VAR),
+                                       np.nanvar(blocks, axis=-1))
+
+    def test_aggregation_mean_var_std_fractional_large_factor(self):
+        def overlaps(src_size, out_size):
+            scale = src_size / out_size
+            o = np.arange(out_size)[:, np.newaxis]
+            s = np.arange(src_size)[np.newaxis, :]
+            return np.clip(np.minimum((o + 1) * scale, s + 1) - np.maximum(o * scale, s), 0, None)
+
+        rs = np.random.RandomState(3)
+        src = np.ma.array(rs.uniform(250.0, 300.0, (101, 203)), mask=rs.uniform(size=(101, 203)) < 0.3)
+        src[40:60, 50:90] = NAN
+        valid = np.isfinite(src.data) & ~src.mask
+        v = np.where(valid, src.data, 0.0)
+        wy = overlaps(101, 7)
+        wx = overlaps(203, 9)
+        w_sum = wy @ valid @ wx.T
+        mean = (wy @ v @ wx.T) / w_sum
+        var = (wy @ (v * v) @ wx.T) / w_sum - mean * mean
+
+        np.testing.assert_almost_equal(gtr.downsample_2d(src, 9, 7, method=gtr.DS_MEAN).data, mean)
+        np.testing.assert_almost_equal(gtr.downsample_2d(src, 9, 7, method=gtr.DS_VAR).data, var, decimal=5)
+        np.testing.assert_almost_equal(gtr.downsample_2d(src, 9, 7, method=gtr.DS_STD).data, np.sqrt(var), decimal=5)
+
+    def test_aggregation_count_coverage_integer(self):
+        src = np.ma.array(np.arange(16, dtype=np.int32).reshape((4, 4)), mask=np.eye(4, dtype=np.bool_))
+
+        actual = gtr.downsample_2d(src, 2, 2, method=gtr.DS_COVERAGE)
+        self.assertEqual(np.float64, actual.dtype)
+        np.testing.assert_equal(actual, [[0.5, 1.0], [1.0, 0.5]])
+        actual = gtr.downsample_2d(src, 2, 2, method=gtr.DS_COUNT)
+        self.assertEqual(np.float64, actual.dtype)
+        np.testing.assert_equal(actual, [[2.0, 4.0], [4.0, 2.0]])
+        actual = gtr.resample_2d(src, 2, 2, ds_method=gtr.DS_COVERAGE)
+        np.testing.assert_equal(actual, [[0.5, 1.0], [1.0, 0.5]])
+        actual = gtr.resample_2d(src, 8, 2, ds_method=gtr.DS_COVERAGE, us_method=gtr.US_NEAREST)
+        self.assertEqual(np.float64, actual.dtype)
+        np.testing.assert_equal(actual, [[0.5, 0.5, 0.5, 0.5, 1.0, 1.0, 1.0, 1.0],
+                                         [1.0, 1.0, 1.0, 1.0, 0.5, 0.5, 0.5, 0.5]])
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+NAN = np.nan
+
+
+def _make_grid(shape, seed=0):
+    src = np.random.RandomState(seed).uniform(0.0, 10.0, shape)
+    src[3, 4] = NAN
+    return src
+
+
+def _blocks(src, size):
+    for y in range(0, src.shape[0], size):
+        yield src[y:y + size]
+
+
+class Downsample2dStreamTest(unittest.TestCase):
+    def test_against_downsample_2d(self):
+        src = _make_grid((37, 23))
+        methods = (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MAX, gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_STD, gtr.DS_COUNT)
+        cases = [(src, 7, 9, dict(method=method, fill_value=-1.)) for method in methods]
+        cases += [(_make_grid((36, 24)), 8, 9, dict(method=gtr.DS_MEAN, fill_value=-1.)),
+                  (_make_grid((120, 90)), 11, 10, dict(method=gtr.DS_MEAN, fill_value=-1.)),
+                  (np.random.RandomState(1).randint(0, 4, (30, 20)).astype(np.uint8), 6, 7,
+                   dict(method=gtr.DS_MODE, fill_value=0, mode_rank=2))]
+        for src, w, h, kwargs in cases:
+            desired = gtr.downsample_2d(src, w, h, **kwargs)
+            for size in (1, 4, src.shape[0]):
+                actual = np.array(list(gtr.downsample_2d_stream(_blocks(src, size), src.shape[0], w, h, **kwargs)))
+                assert_almost_equal(actual, desired)
+
+    def test_row_block_boundaries(self):
+        # the middle source row contributes to both target rows, whether it starts or ends a block of rows
+        src = np.array([[0., 0.],
+                        [3., 3.],
+                        [6., 6.]])
+        for size in (1, 2, 3):
+            actual = list(gtr.downsample_2d_stream(_blocks(src, size), 3, 2, 2))
+            assert_equal(actual, [[1., 1.], [5., 5.]])
+        actual = list(gtr.downsample_2d_stream([src[:1], src[1:]], 3, 2, 2, method=gtr.DS_LAST))
+        assert_equal(actual, [[3., 3.], [6., 6.]])
+
+    def test_rows_are_emitted_early(self):
+        src = 3. * np.arange(6.).reshape((6, 1))
+        received = []
+
+        def rows():
+            for y, row in enumerate(src):
+                received.append(y)
+                yield row
+
+        stream = gtr.downsample_2d_stream(rows(), 6, 1, 4)
+        # the first target row covers source rows 0 to 1.5
+        assert_equal(next(stream), [1.])
+        self.assertEqual([0, 1], received)
+        assert_equal(next(stream), [5.])
+        self.assertEqual([0, 1, 2], received)
+
+    def test_masked(self):
+        src = np.ma.array(np.arange(16.).reshape((4, 4)), mask=[[1, 1, 0, 0],
+                                                                [1, 1, 0, 0],
+                                                                [0, 0, 0, 1],
+                                                                [0, 0, 1, 0]])
+        actual = list(gtr.downsample_2d_stream(_blocks(src, 3), 4, 2, 2, fill_value=-1.))
+        self.assertTrue(all(isinstance(row, np.ma.MaskedArray) for row in actual))
+        actual = np.ma.array(actual)
+        assert_equal(actual.mask, [[True, False], [False, False]])
+        assert_equal(actual.filled(-1.), [[-1., 4.5], [10.5, 12.5]])
+
+    def test_invalid_row_count(self):
+        src = np.zeros((8, 8))
+        with self.assertRaises(ValueError):
+            list(gtr.downsample_2d_stream(src[:7], 8, 4, 4))
+        with self.assertRaises(ValueError):
+            list(gtr.downsample_2d_stream(src, 7, 4, 4))
+
+    def test_invalid_target_size(self):
+        with self.assertRaises(ValueError):
+            list(gtr.downsample_2d_stream(np.zeros((8, 8)), 8, 9, 4))
@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+
+class DownsampleClasses2dTest(unittest.TestCase):
+    def test_mode_and_fractions(self):
+        src = np.array([[2, 4, 1],
+                        [1, 2, 2],
+                        [1, 1, 1]], dtype=np.uint8)
+        classes, fractions = gtr.downsample_classes_2d(src, 2, 2)
+        assert_equal(classes, [[2, 1],
+                               [1, 1]])
+        self.assertEqual(np.uint8, classes.dtype)
+        self.assertEqual((256, 2, 2), fractions.shape)
+        assert_almost_equal(fractions[2], [[1.25 / 2.25, 0.75 / 2.25],
+                                           [0.25 / 2.25, 0.75 / 2.25]])
+        assert_almost_equal(fractions[4], [[0.5 / 2.25, 0.5 / 2.25],
+                                           [0.0, 0.0]])
+        assert_almost_equal(fractions.sum(axis=0), np.ones((2, 2)))
+
+    def test_equals_downsample_2d(self):
+        src = np.random.RandomState(0).randint(0, 7, (37, 53)).astype(np.uint16)
+        for mode_rank in (1, 2, 3):
+            classes, _ = gtr.downsample_classes_2d(src, 9, 8, mode_rank=mode_rank, fill_value=99)
+            assert_equal(classes, gtr.downsample_2d(src.astype(np.int64), 9, 8, method=gtr.DS_MODE,
+                                                    mode_rank=mode_rank, fill_value=99))
+            assert_equal(classes, gtr.downsample_2d(src, 9, 8, method=gtr.DS_MODE,
+                                                    mode_rank=mode_rank, fill_value=99))
+
+    def test_masked(self):
+        src = np.ma.array([[3, 5, 2, 1],
+                           [3, 5, 4, 3],
+                           [1, 1, 3, 4],
+                           [4, 1, 4, 4]],
+                          mask=[[0, 0, 1, 1],
+                                [0, 0, 1, 1],
+                                [0, 0, 0, 0],
+                                [0, 0, 0, 0]], dtype=np.int32)
+        classes, fractions = gtr.downsample_classes_2d(src, 2, 2, class_count=6, fill_value=9)
+        assert_equal(classes.mask, [[0, 1], [0, 0]])
+        assert_equal(classes.filled(), [[3, 9], [1, 4]])
+        assert_almost_equal(fractions[:, 0, 1], np.zeros(6))
+        assert_almost_equal(fractions[:, 1, 1], [0, 0, 0, 0.25, 0.75, 0])
+
+    def test_out_fractions(self):
+        src = np.array([[0, 1], [1, 1]], dtype=np.uint8)
+        out_fractions = np.ones((2, 1, 1), dtype=np.float32)
+        _, fractions = gtr.downsample_classes_2d(src, 1, 1, class_count=2, out_fractions=out_fractions)
+        self.assertIs(fractions, out_fractions)
+        assert_almost_equal(fractions[:, 0, 0], [0.25, 0.75])
+
+    def test_invalid_args(self):
+        with self.assertRaises(ValueError):
+            gtr.downsample_classes_2d(np.zeros((4, 4), dtype=np.int32), 2, 2)
+        with self.assertRaises(ValueError):
+            gtr.downsample_classes_2d(np.zeros((4, 4)), 2, 2, class_count=3)
+        with self.assertRaises(ValueError):
+            gtr.downsample_classes_2d(np.zeros((4, 4), dtype=np.uint8), 2, 2, out_fractions=np.zeros((3, 2, 2)))
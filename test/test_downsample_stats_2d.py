@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+NAN = np.nan
+
+
+class DownsampleStats2dTest(unittest.TestCase):
+    def test_stats(self):
+        src = np.array([[0.9, 0.5, 3.0, 4.0],
+                        [1.1, 1.5, 1.0, NAN],
+                        [NAN, 2.1, 3.0, 5.0],
+                        [NAN, NAN, NAN, NAN]])
+        stats = (gtr.DS_MIN, gtr.DS_MAX, gtr.DS_COUNT, gtr.DS_COVERAGE)
+        actual = gtr.downsample_stats_2d(src, 2, 2, stats=stats, fill_value=-1.)
+        self.assertEqual((4, 2, 2), actual.shape)
+        assert_almost_equal(actual, [[[0.5, 1.0],
+                                      [2.1, 3.0]],
+                                     [[1.5, 4.0],
+                                      [2.1, 5.0]],
+                                     [[4, 3],
+                                      [1, 2]],
+                                     [[1.0, 0.75],
+                                      [0.25, 0.5]]])
+
+    def test_equals_downsample_2d(self):
+        rs = np.random.RandomState(0)
+        stats = (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_STD, gtr.DS_MIN, gtr.DS_MAX)
+        # random, constant, and offset values with a small spread
+        for src in (rs.uniform(0.0, 10.0, (17, 23)), np.full((17, 23), 0.1), rs.uniform(1000.0, 1000.01, (17, 23))):
+            src[3:7, 4:9] = NAN
+            actual = gtr.downsample_stats_2d(src, 5, 4, stats=stats, fill_value=-1.)
+            for i, method in enumerate(stats):
+                assert_almost_equal(actual[i], gtr.downsample_2d(src, 5, 4, method=method, fill_value=-1.),
+                                    decimal=10)
+        actual = gtr.downsample_stats_2d(np.full((60, 80), 0.1), 3, 3, stats=(gtr.DS_VAR, gtr.DS_STD))
+        assert_equal(actual, np.zeros((2, 3, 3)))
+
+    def test_out(self):
+        src = np.random.RandomState(1).uniform(0.0, 10.0, (8, 8))
+        out = np.zeros((2, 3, 3), dtype=np.float32)
+        actual = gtr.downsample_stats_2d(src, 3, 3, stats=(gtr.DS_MEAN, gtr.DS_COUNT), out=out)
+        self.assertIs(actual, out)
+        assert_equal(out[1], [[9, 12, 9], [12, 16, 12], [9, 12, 9]])
+
+    def test_invalid_stats(self):
+        with self.assertRaises(ValueError):
+            gtr.downsample_stats_2d(np.zeros((4, 4)), 2, 2, stats=(gtr.DS_MEAN, gtr.DS_MODE))
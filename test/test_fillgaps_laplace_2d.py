@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.gapfilling as gtg
+
+GAP = np.nan
+
+
+class FillgapsLaplace2dTest(unittest.TestCase):
+    def test_linear_function(self):
+        # linear functions are harmonic, so they are reproduced by the fill
+        y, x = np.indices((40, 50))
+        desired = 0.3 * y + 0.7 * x
+        src = desired.copy()
+        src[5:35, 3:45] = GAP
+        actual, result = gtg.fillgaps_laplace_2d(src, tolerance=1e-10, full_output=True)
+        assert_almost_equal(actual, desired, decimal=6)
+        self.assertTrue(result.converged)
+        self.assertLessEqual(result.residual, 1e-10)
+        self.assertLess(result.cycle_count, 30)
+
+    def test_valid_cells_unchanged(self):
+        src = np.random.RandomState(0).uniform(0.0, 10.0, (33, 27))
+        src[np.random.RandomState(1).uniform(size=src.shape) < 0.6] = GAP
+        src[4:20, 2:18] = GAP
+        actual = gtg.fillgaps_laplace_2d(src)
+        valid = np.isfinite(src)
+        assert_equal(actual[valid], src[valid])
+        self.assertEqual(0, gtg.count_gaps(actual))
+        # the filled values are means of their neighbours
+        padded = np.pad(actual, 1, mode='edge')
+        means = (padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:]) / 4
+        inner = ~valid
+        inner[0, :] = inner[-1, :] = inner[:, 0] = inner[:, -1] = False
+        assert_almost_equal(actual[inner], means[inner], decimal=4)
+
+    def test_max_cycles(self):
+        src = np.random.RandomState(0).uniform(0.0, 10.0, (30, 30))
+        src[3:27, 3:27] = GAP
+        _, result = gtg.fillgaps_laplace_2d(src, tolerance=0.0, max_cycles=2, full_output=True)
+        self.assertEqual(2, result.cycle_count)
+        self.assertFalse(result.converged)
+
+    def test_constant_and_all_gaps(self):
+        src = np.array([[1.0, GAP], [1.0, 1.0]])
+        assert_equal(gtg.fillgaps_laplace_2d(src), np.ones((2, 2)))
+        src = np.full((3, 3), GAP)
+        assert_equal(gtg.fillgaps_laplace_2d(src), src)
@@ -121,3 +121,67 @@ class FillgapsLowpass2d(unittest.TestCase):
                              [5.0, F1_, F2_, F3_],
                              [9.0, F4_, F6_, F7_],
                              [13., F5_, F8_, F9_]], 9)
+
+    def test_equals_sweeps(self):
+        src = np.random.RandomState(0).uniform(0.0, 10.0, (40, 50))
+        src[5:25, 10:30] = GAP
+        src[30:, 35:] = GAP
+        src[np.random.RandomState(1).uniform(size=src.shape) < 0.2] = GAP
+        kernel = np.array([[0.5, 0.7, 0.5, 0.1],
+                           [0.7, 1.0, 0.7, 0.2],
+                           [0.5, 0.7, 0.5, 0.3]])
+        for threshold in (1, 2.5):
+            actual = gtg.fillgaps_lowpass_2d(src, kernel=kernel, threshold=threshold)
+            np.testing.assert_array_equal(actual, _fillgaps_sweeps(src, kernel, threshold))
+
+    def test_threshold_never_reached(self):
+        src = np.array([[1.0, GAP, GAP, GAP]])
+        actual, result = gtg.fillgaps_lowpass_2d(src, kernel=KERNEL, threshold=2, full_output=True)
+        np.testing.assert_array_equal(actual, src)
+        self.assertEqual(1, result.iteration_count)
+        self.assertEqual(3, result.gap_count)
+        self.assertTrue(result.stalled)
+
+    def test_max_iterations(self):
+        src = np.array([[1.0, GAP, GAP, GAP]])
+        actual, result = gtg.fillgaps_lowpass_2d(src, kernel=KERNEL, max_iterations=2, full_output=True)
+        np.testing.assert_array_equal(actual, [[1.0, 1.0, 1.0, GAP]])
+        self.assertEqual((2, 1, False), result[:3])
+        self.assertEqual(2, len(result.iteration_times))
+
+    def test_progress(self):
+        src = np.array([[1.0, GAP, GAP, GAP]])
+        calls = []
+        actual, result = gtg.fillgaps_lowpass_2d(src, kernel=KERNEL, full_output=True,
+                                                 progress=lambda i, gap_count: calls.append((i, gap_count)))
+        np.testing.assert_array_equal(actual, [[1.0, 1.0, 1.0, 1.0]])
+        self.assertEqual([(1, 2), (2, 1), (3, 0)], calls)
+        self.assertEqual(gtg.LowpassResult(3, 0, False, result.iteration_times), result)
+
+
+def _fillgaps_sweeps(src, kernel, threshold):
+    # reference implementation: sweeps over all grid cells until no more gaps are filled
+    h, w = src.shape
+    kh, kw = kernel.shape
+    out = src.copy()
+    while True:
+        data = out.copy()
+        filled = 0
+        for y in range(h):
+            for x in range(w):
+                if np.isfinite(data[y, x]):
+                    continue
+                v_sum = 0.
+                k_sum = 0.
+                for ky in range(kh):
+                    yy = y + ky - kh // 2
+                    for kx in range(kw):
+                        xx = x + kx - kw // 2
+                        if 0 <= yy < h and 0 <= xx < w and np.isfinite(data[yy, xx]):
+                            v_sum += kernel[ky, kx] * data[yy, xx]
+                            k_sum += kernel[ky, kx]
+                if k_sum != 0 and k_sum >= threshold:
+                    out[y, x] = v_sum / k_sum
+                    filled += 1
+        if filled == 0:
+            return out
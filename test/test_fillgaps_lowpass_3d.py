@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.gapfilling as gtg
+
+NAN = np.nan
+
+
+def _make_cube(shape, seed=0):
+    random = np.random.RandomState(seed)
+    src = random.uniform(0.0, 10.0, shape)
+    src[random.uniform(size=shape) < 0.3] = NAN
+    src[:, 3:8, 4:10] = NAN
+    return src
+
+
+class FillgapsLowpass3dTest(unittest.TestCase):
+    def test_single_time_step(self):
+        src = _make_cube((1, 12, 15))
+        actual = gtg.fillgaps_lowpass_3d(src, kernel=gtg.DEFAULT_KERNEL[np.newaxis])
+        assert_equal(actual[0], gtg.fillgaps_lowpass_2d(src[0]))
+
+    def test_temporal_neighbours(self):
+        src = np.array([[[1.0, 1.0, 1.0]],
+                        [[NAN, NAN, NAN]],
+                        [[3.0, 3.0, 3.0]]])
+        # no valid neighbours within the time step, the mean of the previous and the next one
+        assert_almost_equal(gtg.fillgaps_lowpass_3d(src), [[[1.0, 1.0, 1.0]],
+                                                           [[2.0, 2.0, 2.0]],
+                                                           [[3.0, 3.0, 3.0]]])
+
+    def test_parallel(self):
+        src = _make_cube((6, 20, 25))
+        desired, result = gtg.fillgaps_lowpass_3d(src, full_output=True)
+        self.assertEqual(result.gap_count, 0)
+        self.assertFalse(np.isnan(desired).any())
+        assert_equal(gtg.fillgaps_lowpass_3d(src, parallel=True), desired)
+
+    def test_spatial_and_temporal_neighbours(self):
+        src = np.array([[[1.0, 1.0, 1.0]],
+                        [[5.0, NAN, 5.0]],
+                        [[1.0, 1.0, 1.0]]])
+        kernel = gtg.DEFAULT_KERNEL_3D[:, 1]
+        desired = (kernel[0].sum() + 5.0 * (kernel[1, 0] + kernel[1, 2]) + kernel[2].sum()) \
+            / (kernel[0].sum() + kernel[1, 0] + kernel[1, 2] + kernel[2].sum())
+        assert_almost_equal(gtg.fillgaps_lowpass_3d(src)[1, 0, 1], desired)
+
+    def test_max_iterations(self):
+        src = np.array([[[1.0, NAN, NAN, NAN, NAN, NAN, 1.0]],
+                        [[1.0, NAN, NAN, NAN, NAN, NAN, 1.0]]])
+        actual, result = gtg.fillgaps_lowpass_3d(src, max_iterations=1, full_output=True)
+        self.assertEqual(result.iteration_count, 1)
+        self.assertEqual(result.gap_count, 6)
+        assert_equal(actual, [[[1.0, 1.0, NAN, NAN, NAN, 1.0, 1.0]],
+                              [[1.0, 1.0, NAN, NAN, NAN, 1.0, 1.0]]])
+
+    def test_make_kernel_3d(self):
+        assert_almost_equal(gtg.make_kernel_3d(), gtg.DEFAULT_KERNEL_3D)
+        kernel = gtg.make_kernel_3d(time_scale=2.0, time_radius=2)
+        self.assertEqual(kernel.shape, (5, 3, 3))
+        assert_almost_equal(kernel[2], gtg.DEFAULT_KERNEL)
+        assert_almost_equal(kernel[0], gtg.DEFAULT_KERNEL * 0.7 ** 4)
+        assert_almost_equal(kernel[3], gtg.DEFAULT_KERNEL * 0.7 ** 2)
+
+    def test_invalid_args(self):
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_lowpass_3d(np.zeros((4, 4)))
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_lowpass_3d(np.zeros((2, 4, 4)), kernel=gtg.DEFAULT_KERNEL)
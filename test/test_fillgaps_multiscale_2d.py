@@ -124,3 +124,47 @@ class Resample2dWithMeanOfNearestMultiScaleTest(unittest.TestCase):
     #                          [5.0, F1_, F2_, F3_],
     #                          [9.0, F4_, F6_, F7_],
     #                          [13., F5_, F8_, F9_]], 9)
+
+    def test_equals_pyramid_of_copies(self):
+        src = np.random.RandomState(0).uniform(0.0, 10.0, (37, 45))
+        src[5:30, 10:40] = GAP
+        src[np.random.RandomState(1).uniform(size=src.shape) < 0.3] = GAP
+        for ds_iter in (True, False):
+            for us_method in (gtr.US_NEAREST, gtr.US_LINEAR):
+                actual = gtg.fillgaps_multiscale_2d(src, ds_iter=ds_iter, us_method=us_method)
+                desired = _fillgaps_multiscale(src, ds_iter, gtr.DS_MEAN, us_method)
+                np.testing.assert_array_equal(actual, desired)
+
+    def test_workspace(self):
+        workspace = gtg.MultiscaleWorkspace((9, 7))
+        self.assertEqual([(5, 4), (3, 2), (2, 1), (1, 1)], [level.shape for level in workspace.levels])
+        for seed in range(3):
+            src = np.random.RandomState(seed).uniform(0.0, 10.0, (9, 7))
+            src[2:7, 1:5] = GAP
+            desired = gtg.fillgaps_multiscale_2d(src)
+            assert_almost_equal(gtg.fillgaps_multiscale_2d(src, workspace=workspace), desired)
+            self.assertIs(gtg.fillgaps_multiscale_2d(src, workspace=workspace, out=src), src)
+            assert_almost_equal(src, desired)
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_multiscale_2d(np.zeros((9, 8)), workspace=workspace)
+
+
+def _fillgaps_multiscale(src, ds_iter, ds_method, us_method):
+    # reference implementation: fills copies of the pyramid levels
+    h, w = src.shape
+    pyramid = [src]
+    s = 2
+    while True:
+        out_w = (w + s - 1) // s
+        out_h = (h + s - 1) // s
+        s *= 2
+        out = gtr.downsample_2d(pyramid[-1] if ds_iter else src, out_w, out_h, method=ds_method, fill_value=np.nan)
+        pyramid.append(out)
+        gap_count = gtg.count_gaps(out)
+        if gap_count == 0 or gap_count == out_w * out_h or (out_w == 1 and out_h == 1):
+            break
+    out_low = pyramid[-1]
+    for out_hi in reversed(pyramid[:-1]):
+        fill_data = gtr.upsample_2d(out_low, out_hi.shape[-1], out_hi.shape[-2], method=us_method, fill_value=np.nan)
+        out_low = np.where(np.isfinite(out_hi), out_hi, fill_data)
+    return out_low
@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.gapfilling as gtg
+import gridtools.resampling as gtr
+
+NAN = np.nan
+
+
+def _make_cube(shape, seed=0):
+    random = np.random.RandomState(seed)
+    src = random.uniform(0.0, 10.0, shape)
+    src[random.uniform(size=shape) < 0.3] = NAN
+    src[:, shape[1] // 4:shape[1] // 2 + 1, 2:shape[2] - 2] = NAN
+    return src
+
+
+class FillgapsMultiscale3dTest(unittest.TestCase):
+    def test_single_time_step(self):
+        for shape in ((1, 13, 17), (1, 40, 50), (1, 1, 9)):
+            src = _make_cube(shape)
+            for kwargs in (dict(), dict(ds_iter=False), dict(us_method=gtr.US_NEAREST)):
+                actual = gtg.fillgaps_multiscale_3d(src, **kwargs)
+                assert_almost_equal(actual[0], gtg.fillgaps_multiscale_2d(src[0], **kwargs))
+
+    def test_temporal_neighbours(self):
+        src = np.array([[[1.0, 1.0]],
+                        [[NAN, NAN]],
+                        [[3.0, 3.0]],
+                        [[3.0, 3.0]]])
+        # level 1 aggregates the first two and the last two time steps
+        assert_almost_equal(gtg.fillgaps_multiscale_3d(src, us_method=gtr.US_NEAREST)[1], [[1.0, 1.0]])
+        # without temporal aggregation, the time step remains a gap
+        assert_equal(gtg.fillgaps_multiscale_3d(src, time_scale=100.0)[1], [[NAN, NAN]])
+
+    def test_time_scale(self):
+        src = np.array([[[1.0, 1.0]],
+                        [[NAN, NAN]],
+                        [[3.0, 3.0]],
+                        [[3.0, 3.0]]])
+        # level 1 aggregates all time steps for time scales of at most 0.5, pairs of them for 1.0, and none for 4.0
+        for time_scale, desired in ((0.0, 7.0 / 3.0), (0.5, 7.0 / 3.0), (1.0, 1.0), (4.0, NAN)):
+            actual = gtg.fillgaps_multiscale_3d(src, time_scale=time_scale, us_method=gtr.US_NEAREST)
+            assert_almost_equal(actual[1], [[desired, desired]])
+            assert_equal(actual[[0, 2, 3]], src[[0, 2, 3]])
+
+    def test_parallel_and_out(self):
+        src = _make_cube((6, 20, 25))
+        desired = gtg.fillgaps_multiscale_3d(src)
+        out = np.zeros_like(src)
+        self.assertIs(gtg.fillgaps_multiscale_3d(src, out=out, parallel=True), out)
+        assert_equal(out, desired)
+        self.assertIs(gtg.fillgaps_multiscale_3d(src, out=src), src)
+        assert_equal(src, desired)
+
+    def test_invalid_args(self):
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_multiscale_3d(np.zeros((4, 4)))
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_multiscale_3d(np.zeros((2, 4, 4)), out=np.zeros((1, 4, 4)))
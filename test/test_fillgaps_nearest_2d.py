@@ -0,0 +1,61 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.gapfilling as gtg
+
+GAP = np.nan
+
+
+def _nearest_distances(src):
+    valid_y, valid_x = np.nonzero(np.isfinite(src))
+    y, x = np.indices(src.shape)
+    d2 = (y[..., np.newaxis] - valid_y) ** 2 + (x[..., np.newaxis] - valid_x) ** 2
+    return np.sqrt(d2.min(axis=-1))
+
+
+class FillgapsNearest2dTest(unittest.TestCase):
+    def test_nearest(self):
+        src = np.array([[1.0, GAP, GAP, 2.0],
+                        [GAP, GAP, GAP, GAP],
+                        [GAP, GAP, GAP, GAP],
+                        [GAP, GAP, GAP, 3.0]])
+        assert_equal(gtg.fillgaps_nearest_2d(src),
+                     [[1.0, 1.0, 2.0, 2.0],
+                      [1.0, 1.0, 2.0, 2.0],
+                      [1.0, 1.0, 3.0, 3.0],
+                      [1.0, 3.0, 3.0, 3.0]])
+
+    def test_exact_distances(self):
+        src = np.random.RandomState(0).uniform(0.0, 10.0, (23, 31))
+        src[np.random.RandomState(1).uniform(size=src.shape) < 0.9] = GAP
+        src[2:20, 5:25] = GAP
+        actual = gtg.fillgaps_nearest_2d(src)
+        self.assertEqual(0, gtg.count_gaps(actual))
+        # every gap is filled with the value of a valid cell at the minimum distance
+        desired_d = _nearest_distances(src)
+        valid = np.isfinite(src)
+        for y, x in zip(*np.nonzero(~valid)):
+            matches = np.nonzero(valid & (src == actual[y, x]))
+            d = np.sqrt((matches[0] - y) ** 2 + (matches[1] - x) ** 2).min()
+            self.assertAlmostEqual(desired_d[y, x], d)
+
+    def test_idw(self):
+        src = np.array([[1.0, GAP, 3.0]])
+        assert_almost_equal(gtg.fillgaps_nearest_2d(src, k=2), [[1.0, 2.0, 3.0]])
+        src = np.array([[1.0, GAP, GAP, 4.0]])
+        assert_almost_equal(gtg.fillgaps_nearest_2d(src, k=2, power=1.0),
+                            [[1.0, (1.0 + 4.0 / 2) / 1.5, (1.0 / 2 + 4.0) / 1.5, 4.0]])
+
+    def test_max_distance(self):
+        src = np.array([[1.0, GAP, GAP, GAP]])
+        assert_equal(gtg.fillgaps_nearest_2d(src, max_distance=2), [[1.0, 1.0, 1.0, GAP]])
+
+    def test_all_gaps(self):
+        src = np.full((3, 4), GAP)
+        assert_equal(gtg.fillgaps_nearest_2d(src), src)
+
+    def test_invalid_k(self):
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_nearest_2d(np.zeros((2, 2)), k=0)
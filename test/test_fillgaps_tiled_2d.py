@@ -0,0 +1,79 @@
+import concurrent.futures
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.gapfilling as gtg
+
+NAN = np.nan
+
+
+def _make_grid(shape, seed=0):
+    random = np.random.RandomState(seed)
+    src = random.uniform(0.0, 10.0, shape)
+    src[random.uniform(size=shape) < 0.3] = NAN
+    src[5:20, 8:30] = NAN
+    return src
+
+
+class _RecordingExecutor(concurrent.futures.ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.window_widths = []
+
+    def submit(self, fn, window, *args):
+        self.window_widths.append(window.shape[1])
+        return super().submit(fn, window, *args)
+
+
+class FillgapsTiled2dTest(unittest.TestCase):
+    def test_against_whole_grid(self):
+        src = _make_grid((40, 50))
+        cases = [(gtg.fillgaps_lowpass_2d, 7, 1, {}),
+                 (gtg.fillgaps_lowpass_2d, 16, 4, dict(num_workers=2)),
+                 (gtg.fillgaps_lowpass_2d, 8, 2, dict(kernel=np.ones((5, 3)), threshold=4)),
+                 (gtg.fillgaps_nearest_2d, 9, 2, dict(k=1)),
+                 (gtg.fillgaps_nearest_2d, 9, 2, dict(k=3))]
+        for fill_func, tile_size, halo, kwargs in cases:
+            fill_kwargs = {key: value for key, value in kwargs.items() if key != 'num_workers'}
+            desired = fill_func(src, **fill_kwargs)
+            actual = gtg.fillgaps_tiled_2d(src, fill_func, tile_size=tile_size, halo=halo, **kwargs)
+            assert_almost_equal(actual, desired)
+
+    def test_halo_escalation(self):
+        # the gaps of the two middle tiles are not filled exactly with a halo of 1 and 2, and need the whole grid
+        src = np.array([[1., NAN, NAN, NAN, NAN, NAN, NAN, 3.]])
+        with _RecordingExecutor() as executor:
+            actual = gtg.fillgaps_tiled_2d(src, gtg.fillgaps_nearest_2d, tile_size=2, halo=1, executor=executor)
+        assert_equal(actual, [[1., 1., 1., 1., 3., 3., 3., 3.]])
+        self.assertEqual([3, 4, 4, 3, 6, 6, 8, 8], executor.window_widths)
+
+        src = np.array([[2., NAN, NAN, NAN, NAN, NAN, NAN, 2.],
+                        [2., NAN, NAN, NAN, NAN, NAN, NAN, 2.]])
+        with _RecordingExecutor() as executor:
+            actual = gtg.fillgaps_tiled_2d(src, tile_size=2, halo=1, executor=executor)
+        assert_equal(actual, np.full((2, 8), 2.))
+        self.assertEqual(8, max(executor.window_widths))
+
+    def test_no_valid_cells_in_tile(self):
+        src = np.full((20, 20), NAN)
+        src[0, 0] = 1.0
+        src[19, 19] = 3.0
+        for fill_func in (gtg.fillgaps_lowpass_2d, gtg.fillgaps_nearest_2d):
+            actual = gtg.fillgaps_tiled_2d(src, fill_func, tile_size=5, halo=1)
+            assert_almost_equal(actual, fill_func(src))
+
+    def test_out(self):
+        src = np.array([[1., NAN, NAN, 3.],
+                        [NAN, NAN, NAN, NAN]])
+        out = np.zeros_like(src)
+        actual = gtg.fillgaps_tiled_2d(src, gtg.fillgaps_nearest_2d, tile_size=1, halo=1, out=out)
+        self.assertIs(actual, out)
+        assert_equal(out, [[1., 1., 3., 3.], [1., 1., 3., 3.]])
+
+    def test_invalid_args(self):
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_tiled_2d(np.zeros((8, 8)), gtg.fillgaps_multiscale_2d)
+        with self.assertRaises(ValueError):
+            gtg.fillgaps_tiled_2d(np.zeros((8, 8)), out=np.zeros((4, 8)))
@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.gapfilling as gtg
+import gridtools.resampling as gtr
+
+NAN = np.nan
+
+
+def _make_stack(shape, count=4, seed=0):
+    random = np.random.RandomState(seed)
+    mask = random.uniform(size=shape) < 0.2
+    mask[shape[0] // 4:shape[0] // 2 + 1, 2:shape[1] - 2] = True
+    src = random.uniform(0.0, 10.0, (count,) + shape)
+    src[:, mask] = NAN
+    return mask, src
+
+
+class MultiscalePlanTest(unittest.TestCase):
+    def _test_against_2d(self, shape, **kwargs):
+        mask, src = _make_stack(shape)
+        plan = gtg.MultiscalePlan(mask, **kwargs)
+        self.assertEqual(plan.shape, shape)
+        self.assertEqual(plan.gap_count, np.count_nonzero(mask))
+        actual = plan.apply(src)
+        for i in range(src.shape[0]):
+            assert_almost_equal(actual[i], gtg.fillgaps_multiscale_2d(src[i], **kwargs))
+        assert_almost_equal(plan.apply(src[0]), actual[0])
+
+    def test_against_2d(self):
+        for shape in ((13, 17), (40, 50), (1, 9), (64, 64)):
+            self._test_against_2d(shape)
+            self._test_against_2d(shape, ds_iter=False)
+            self._test_against_2d(shape, us_method=gtr.US_NEAREST)
+
+    def test_levels(self):
+        plan = gtg.MultiscalePlan(np.array([[True, False],
+                                            [False, False]]))
+        self.assertEqual(plan.level_count, 1)
+        self.assertEqual(plan.cell_count, 1)
+        assert_almost_equal(plan.apply(np.array([[NAN, 2.0],
+                                                 [3.0, 4.0]])), [[3.0, 2.0],
+                                                                 [3.0, 4.0]])
+
+    def test_stack(self):
+        # the grids of a stack share the gap mask, but are filled from their own valid cells
+        plan = gtg.MultiscalePlan(np.array([[False, True, True, False]]))
+        self.assertEqual(plan.level_count, 1)
+        self.assertEqual(plan.cell_count, 2)
+        src = np.array([[[2.0, NAN, NAN, 2.0]],
+                        [[1.0, NAN, NAN, 5.0]]])
+        assert_almost_equal(plan.apply(src), [[[2.0, 2.0, 2.0, 2.0]],
+                                              [[1.0, 7.0 / 3.0, 11.0 / 3.0, 5.0]]])
+        assert_almost_equal(plan.apply(src[1]), [[1.0, 7.0 / 3.0, 11.0 / 3.0, 5.0]])
+
+    def test_no_and_only_gaps(self):
+        src = np.ones((5, 6))
+        assert_equal(gtg.MultiscalePlan(np.zeros((5, 6), dtype=np.bool_)).apply(src), src)
+        src = np.full((5, 6), NAN)
+        assert_equal(gtg.MultiscalePlan(np.ones((5, 6), dtype=np.bool_)).apply(src), src)
+
+    def test_out(self):
+        mask = np.array([[False, True, True, False]])
+        src = np.array([[[2.0, NAN, NAN, 2.0]],
+                        [[1.0, NAN, NAN, 1.0]]], dtype=np.float32)
+        desired = gtg.MultiscalePlan(mask).apply(src)
+        self.assertEqual(desired.dtype, np.float32)
+        assert_equal(desired, [[[2.0, 2.0, 2.0, 2.0]],
+                               [[1.0, 1.0, 1.0, 1.0]]])
+        out = src.copy()
+        self.assertIs(gtg.MultiscalePlan(mask).apply(out, out=out), out)
+        assert_equal(out, desired)
+
+    def test_invalid_src(self):
+        mask = np.array([[False, True, False]])
+        plan = gtg.MultiscalePlan(mask)
+        src = np.array([[[1.0, NAN, 3.0]],
+                        [[4.0, NAN, 6.0]]])
+        with self.assertRaises(ValueError):
+            plan.apply(src[..., :2])
+        with self.assertRaises(ValueError):
+            plan.apply(src, out=src[:1])
+        with self.assertRaises(ValueError):
+            plan.apply(np.array([[NAN, NAN, 3.0]]))
+
+    def test_invalid_src_unchanged(self):
+        # a failing in-place fill leaves the grids untouched
+        mask = np.array([[False, True, False]])
+        src = np.array([[[1.0, NAN, 3.0]],
+                        [[4.0, NAN, NAN]]])
+        desired = src.copy()
+        with self.assertRaises(ValueError):
+            gtg.MultiscalePlan(mask).apply(src, out=src)
+        assert_equal(src, desired)
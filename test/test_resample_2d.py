@@ -1,10 +1,12 @@
 import unittest
 
 import numpy as np
-from numpy.testing import assert_almost_equal
+from numpy.testing import assert_almost_equal, assert_equal
 
 import gridtools.resampling as gtr
 
+NAN = np.nan
+
 
 def _test_resample_2d(src, out_w, out_h, ds_method, us_method, desired_out):
     actual = gtr.resample_2d(np.array(src), out_w, out_h,
@@ -82,3 +84,84 @@ class Resample2dTest(unittest.TestCase):
                           8, 2, gtr.DS_MEAN, gtr.US_NEAREST,
                           [[1., 1., 1., 1., 2., 2., 3., 3.],
                            [3.5, 3.5, 3.5, 3.5, 3., 3., 3., 3.]])
+
+    def test_masked_valid_fill_value(self):
+        # a valid aggregate that equals the fill value is not masked
+        src = np.ma.array([[1., 1., 2., 4.],
+                           [1., 1., 6., 4.]], mask=[[False, False, True, True],
+                                                    [False, False, True, True]], fill_value=1.)
+        actual = gtr.resample_2d(src, 2, 1, ds_method=gtr.DS_MEAN)
+        assert_almost_equal(actual.data, [[1., 1.]])
+        assert_equal(actual.mask, [[False, True]])
+
+    def test_out_mask(self):
+        src = np.array([[1., NAN, 2., NAN],
+                        [3., NAN, 4., NAN]])
+        out_mask = np.ones((4, 2), dtype=np.bool_)
+        actual = gtr.resample_2d(src, 2, 4, ds_method=gtr.DS_MEAN, us_method=gtr.US_NEAREST,
+                                 out_mask=out_mask)
+        self.assertNotIsInstance(actual, np.ma.MaskedArray)
+        assert_equal(out_mask, np.zeros((4, 2), dtype=np.bool_))
+        src[:, 2] = NAN
+        gtr.resample_2d(src, 2, 4, ds_method=gtr.DS_MEAN, us_method=gtr.US_NEAREST, out_mask=out_mask)
+        assert_equal(out_mask, [[False, True]] * 4)
+        with self.assertRaises(ValueError):
+            gtr.resample_2d(src, 2, 4, out_mask=np.zeros((2, 4), dtype=np.bool_))
+        with self.assertRaises(ValueError):
+            gtr.resample_2d(src, 2, 4, out_mask=np.zeros((4, 2), dtype=np.uint8))
+
+    def test_aggregate_w_interpolate_h_finite_fill_value(self):
+        # valid aggregates that equal a finite fill value are not taken for gaps by the interpolation
+        src = np.array([[-1., -1., NAN, NAN],
+                        [3., 3., 5., 5.]])
+        out_mask = np.zeros((4, 2), dtype=np.bool_)
+        actual = gtr.resample_2d(src, 2, 4, ds_method=gtr.DS_MEAN, us_method=gtr.US_NEAREST, fill_value=-1.,
+                                 out_mask=out_mask)
+        assert_almost_equal(actual, [[-1., -1.],
+                                     [-1., -1.],
+                                     [3., 5.],
+                                     [3., 5.]])
+        assert_equal(out_mask, [[False, True], [False, True], [False, False], [False, False]])
+
+    def test_aggregate_interpolate_fused(self):
+        # the fused single-pass kernel yields the result of a downsampling followed by an upsampling
+        rs = np.random.RandomState(0)
+        src = rs.uniform(0., 10., (23, 70))
+        src[rs.uniform(size=src.shape) < 0.3] = NAN
+        for shape in ((50, 9), (7, 101)):
+            h, w = shape
+            temp_h, temp_w = min(h, src.shape[0]), min(w, src.shape[1])
+            for ds_method in (gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_STD):
+                for us_method in (gtr.US_NEAREST, gtr.US_LINEAR):
+                    temp_mask = np.zeros((temp_h, temp_w), dtype=np.bool_)
+                    temp = gtr.downsample_2d(src, temp_w, temp_h, method=ds_method, out_mask=temp_mask)
+                    desired = gtr.upsample_2d(np.ma.array(temp, mask=temp_mask), w, h, method=us_method,
+                                              fill_value=-1.)
+                    actual = gtr.resample_2d(src, w, h, ds_method=ds_method, us_method=us_method, fill_value=-1.)
+                    assert_almost_equal(actual, np.ma.getdata(desired))
+
+    def test_aggregate_interpolate_constant(self):
+        # rounding must not yield negative variances or invalid standard deviations
+        for src_shape, shape in (((600, 800), (3, 1000)), ((800, 600), (1000, 3))):
+            src = np.full(src_shape, 0.1)
+            h, w = shape
+            for ds_method in (gtr.DS_VAR, gtr.DS_STD):
+                for us_method in (gtr.US_NEAREST, gtr.US_LINEAR):
+                    for kwargs in ({}, dict(assume_valid=True)):
+                        actual = gtr.resample_2d(src, w, h, ds_method=ds_method, us_method=us_method, **kwargs)
+                        assert_almost_equal(actual, np.zeros(shape))
+
+    def test_assume_valid(self):
+        # the kernels without validity tests yield the results of the ones with validity tests
+        src = np.random.RandomState(1).uniform(0., 10., (40, 36))
+        for shape in ((9, 7), (8, 9), (20, 18), (3, 2), (90, 7), (9, 101)):
+            h, w = shape
+            for ds_method in (gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_STD, gtr.DS_MODE):
+                for us_method in (gtr.US_NEAREST, gtr.US_LINEAR):
+                    kwargs = dict(ds_method=ds_method, us_method=us_method)
+                    desired = gtr.resample_2d(np.ma.array(src, mask=False), w, h, **kwargs)
+                    actual = gtr.resample_2d(src, w, h, assume_valid=True, **kwargs)
+                    assert_almost_equal(actual, desired)
+                    actual = gtr.resample_2d(np.round(src).astype(np.int32), w, h, **kwargs)
+                    desired = gtr.resample_2d(np.ma.array(np.round(src).astype(np.int32), mask=False), w, h, **kwargs)
+                    assert_equal(actual, desired)
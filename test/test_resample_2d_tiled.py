@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+NAN = np.nan
+
+
+def _make_grid(shape, seed=0):
+    src = np.random.RandomState(seed).uniform(0.0, 10.0, shape)
+    src[3, 4] = NAN
+    return src
+
+
+class Resample2dTiledTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_against_resample_2d(self):
+        src = _make_grid((37, 23))
+        cases = [(src, 7, 9, dict(ds_method=ds_method))
+                 for ds_method in (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MIN, gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_COVERAGE)]
+        cases += [(_make_grid((36, 24)), 8, 9, dict(ds_method=gtr.DS_MEAN)),
+                  (_make_grid((120, 130)), 11, 12, dict(ds_method=gtr.DS_STD)),
+                  (np.random.RandomState(1).randint(0, 4, (30, 20)), 6, 7, dict(ds_method=gtr.DS_MODE, mode_rank=2)),
+                  (_make_grid((9, 7)), 20, 31, dict(us_method=gtr.US_LINEAR)),
+                  (_make_grid((8, 30)), 7, 21, {})]
+        for src, w, h, kwargs in cases:
+            desired = gtr.resample_2d(src, w, h, fill_value=-1., **kwargs)
+            for max_memory in (1, 2000):
+                actual = gtr.resample_2d_tiled(src, w, h, fill_value=-1., max_memory=max_memory, **kwargs)
+                assert_almost_equal(actual, desired)
+
+    def test_downsample_band_borders(self):
+        # with bands of a single target row, the middle source row contributes to both bands
+        src = np.array([[0., 0.],
+                        [3., 3.],
+                        [6., 6.]])
+        assert_equal(gtr.resample_2d_tiled(src, 2, 2, ds_method=gtr.DS_MEAN, max_memory=1), [[1., 1.], [5., 5.]])
+        assert_equal(gtr.resample_2d_tiled(src, 2, 2, ds_method=gtr.DS_FIRST, max_memory=1), [[0., 0.], [3., 3.]])
+        assert_equal(gtr.resample_2d_tiled(src, 2, 2, ds_method=gtr.DS_LAST, max_memory=1), [[3., 3.], [6., 6.]])
+
+    def test_upsample_band_borders(self):
+        src = np.array([[0., 10.],
+                        [6., 16.]])
+        assert_equal(gtr.resample_2d_tiled(src, 2, 4, us_method=gtr.US_LINEAR, max_memory=1),
+                     [[0., 10.], [2., 12.], [4., 14.], [6., 16.]])
+
+    def test_masked(self):
+        src = np.ma.array(np.arange(16.).reshape((4, 4)), mask=[[1, 1, 0, 0],
+                                                                [1, 1, 0, 0],
+                                                                [0, 0, 0, 1],
+                                                                [0, 0, 1, 0]])
+        actual = gtr.resample_2d_tiled(src, 2, 2, fill_value=-1., max_memory=1)
+        self.assertIsInstance(actual, np.ma.MaskedArray)
+        assert_equal(actual.mask, [[True, False], [False, False]])
+        assert_equal(actual.filled(-1.), [[-1., 4.5], [10.5, 12.5]])
+
+    def test_npy_files(self):
+        src = _make_grid((41, 33))
+        src_path = os.path.join(self.dir, 'src.npy')
+        out_path = os.path.join(self.dir, 'out.npy')
+        np.save(src_path, src)
+        actual = gtr.resample_2d_tiled(src_path, 10, 12, fill_value=-1., out=out_path, max_memory=1000)
+        self.assertIsInstance(actual, np.memmap)
+        del actual
+        assert_almost_equal(np.load(out_path), gtr.resample_2d(src, 10, 12, fill_value=-1.))
+
+    def test_no_op(self):
+        src = _make_grid((5, 6))
+        self.assertIs(gtr.resample_2d_tiled(src, 6, 5), src)
+        out = np.zeros((5, 6))
+        self.assertIs(gtr.resample_2d_tiled(src, 6, 5, out=out, max_memory=1), out)
+        assert_equal(out, src)
+
+    def test_invalid_out(self):
+        with self.assertRaises(ValueError):
+            gtr.resample_2d_tiled(np.zeros((8, 8)), 4, 4, out=np.zeros((3, 4)))
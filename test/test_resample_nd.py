@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+NAN = np.nan
+
+
+def _make_stack(shape, seed=0):
+    src = np.random.RandomState(seed).uniform(0.0, 10.0, shape)
+    src[..., 1, 2] = NAN
+    return src
+
+
+class ResampleNdTest(unittest.TestCase):
+    def _test_against_2d(self, src, out_w, out_h, **kwargs):
+        actual = gtr.resample_nd(src, out_w, out_h, **kwargs)
+        self.assertEqual(src.shape[:-2] + (out_h, out_w), actual.shape)
+        for index in np.ndindex(*src.shape[:-2]):
+            desired = gtr.resample_2d(src[index], out_w, out_h, **kwargs)
+            assert_equal(actual[index], desired)
+        return actual
+
+    def test_downsample(self):
+        src = _make_stack((3, 7, 9))
+        for ds_method in (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_STD):
+            self._test_against_2d(src, 4, 3, ds_method=ds_method, fill_value=-1.)
+
+    def test_downsample_mode(self):
+        src = np.random.RandomState(1).randint(0, 4, (2, 3, 8, 8))
+        self._test_against_2d(src, 3, 3, ds_method=gtr.DS_MODE, fill_value=0)
+        self._test_against_2d(src, 3, 3, ds_method=gtr.DS_MODE, fill_value=0, mode_rank=2)
+
+    def test_upsample(self):
+        src = _make_stack((2, 4, 5))
+        for us_method in (gtr.US_NEAREST, gtr.US_LINEAR):
+            self._test_against_2d(src, 11, 9, us_method=us_method, fill_value=-1.)
+
+    def test_aggregate_w_interpolate_h(self):
+        src = _make_stack((4, 3, 8))
+        self._test_against_2d(src, 3, 7, ds_method=gtr.DS_MEAN, us_method=gtr.US_LINEAR, fill_value=-1.)
+
+    def test_no_op(self):
+        src = _make_stack((2, 3, 4))
+        self.assertIs(gtr.resample_nd(src, 4, 3), src)
+
+    def test_out(self):
+        src = _make_stack((2, 6, 6))
+        out = np.zeros((3, 2, 3), dtype=np.float64).transpose((1, 0, 2))
+        actual = gtr.downsample_nd(src, 3, 3, method=gtr.DS_MEAN, out=out)
+        self.assertIs(actual, out)
+        assert_equal(out, gtr.downsample_nd(src, 3, 3, method=gtr.DS_MEAN))
+
+    def test_masked(self):
+        src = np.ma.array([[[0.9, 0.5, 3.0, 4.0],
+                            [1.1, NAN, 1.0, 2.0],
+                            [4.0, 2.1, 3.0, 5.0],
+                            [3.0, 4.9, NAN, 1.0]],
+                           [[1.0, 2.0, 3.0, 4.0],
+                            [5.0, 6.0, 7.0, 8.0],
+                            [9.0, 1.0, 2.0, 3.0],
+                            [4.0, 5.0, 6.0, 7.0]]],
+                          mask=[[[1, 1, 0, 0],
+                                 [1, 1, 0, 0],
+                                 [0, 0, 0, 1],
+                                 [0, 0, 0, 0]],
+                                [[0, 0, 0, 0],
+                                 [0, 0, 0, 0],
+                                 [0, 0, 1, 1],
+                                 [0, 0, 1, 1]]])
+        actual = gtr.downsample_nd(src, 2, 2, method=gtr.DS_MEAN, fill_value=NAN)
+        self.assertIsInstance(actual, np.ma.MaskedArray)
+        assert_equal(actual.mask, [[[1, 0], [0, 0]], [[0, 0], [0, 1]]])
+        assert_equal(actual.filled(-1.), [[[-1., 2.5], [3.5, 2.0]], [[3.5, 5.5], [4.75, -1.]]])
+
+    def test_invalid_shape(self):
+        with self.assertRaises(ValueError):
+            gtr.downsample_nd(np.zeros((4,)), 2, 2)
@@ -0,0 +1,89 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_equal
+
+import gridtools.resampling as gtr
+
+try:
+    import dask.array as da
+except ImportError:
+    da = None
+
+NAN = np.nan
+
+
+def _make_stack(shape, seed=0):
+    src = np.random.RandomState(seed).uniform(0.0, 10.0, shape)
+    src[..., 3, 4] = NAN
+    return src
+
+
+@unittest.skipIf(da is None, 'dask is not installed')
+class ResampleNdDaskTest(unittest.TestCase):
+    def test_against_resample_nd(self):
+        src = _make_stack((37, 23))
+        cases = [(src, 7, 9, (10, 6), dict(ds_method=ds_method))
+                 for ds_method in (gtr.DS_FIRST, gtr.DS_LAST, gtr.DS_MIN, gtr.DS_MEAN, gtr.DS_VAR, gtr.DS_COUNT)]
+        cases += [(_make_stack((36, 24)), 8, 9, (12, 9), dict(ds_method=gtr.DS_MEAN)),
+                  (_make_stack((120, 130)), 11, 12, (50, 45), dict(ds_method=gtr.DS_STD)),
+                  (np.random.RandomState(1).randint(0, 4, (30, 20)).astype(np.uint8), 6, 7, (7, 9),
+                   dict(ds_method=gtr.DS_MODE)),
+                  (_make_stack((9, 7)), 20, 31, (4, 3), dict(us_method=gtr.US_LINEAR)),
+                  (_make_stack((8, 30)), 7, 21, (3, 11), {}),
+                  (_make_stack((3, 2, 19, 17)), 5, 6, (2, 1, 7, 5), dict(ds_method=gtr.DS_MEAN))]
+        for src, w, h, chunks, kwargs in cases:
+            desired = gtr.resample_nd(src, w, h, fill_value=-1., **kwargs)
+            actual = gtr.resample_nd_dask(da.from_array(src, chunks=chunks), w, h, fill_value=-1., **kwargs)
+            self.assertIsInstance(actual, da.Array)
+            self.assertEqual(desired.shape, actual.shape)
+            assert_almost_equal(actual.compute(scheduler='threads'), desired)
+
+    def test_chunks(self):
+        actual = gtr.resample_nd_dask(da.zeros((37, 23), chunks=(10, 6)), 7, 9)
+        self.assertEqual(((2, 3, 2, 2), (2, 2, 1, 2)), actual.chunks)
+
+    def test_downsample_std_uneven_chunks(self):
+        src = np.ma.masked_invalid(_make_stack((16, 31)) + 1000.0)
+        src[5, 10] = np.ma.masked
+        desired = gtr.resample_nd(src, 9, 5, ds_method=gtr.DS_STD, fill_value=-1.)
+        for chunks in ((16, (4, 9, 1, 17)), (16, (13, 5, 13)), ((7, 9), (2, 29))):
+            actual = gtr.resample_nd_dask(da.from_array(src, chunks=chunks), 9, 5, ds_method=gtr.DS_STD,
+                                          fill_value=-1.)
+            assert_equal(actual.compute(scheduler='threads'), desired)
+
+    def test_downsample_chunk_borders(self):
+        # the middle source column contributes to both target chunks
+        src = np.array([[0., 3., 6.],
+                        [0., 3., 6.]])
+        for chunks in ((2, (2, 1)), (2, (1, 2))):
+            actual = gtr.resample_nd_dask(da.from_array(src, chunks=chunks), 2, 2, ds_method=gtr.DS_MEAN)
+            self.assertEqual(((2,), (1, 1)), actual.chunks)
+            assert_equal(actual.compute(), [[1., 5.], [1., 5.]])
+            actual = gtr.resample_nd_dask(da.from_array(src, chunks=chunks), 2, 2, ds_method=gtr.DS_LAST)
+            assert_equal(actual.compute(), [[3., 6.], [3., 6.]])
+
+    def test_upsample_chunk_borders(self):
+        # both target chunks interpolate between the two source columns
+        actual = gtr.resample_nd_dask(da.from_array(np.array([[0., 6.]]), chunks=1), 4, 1, us_method=gtr.US_LINEAR)
+        self.assertEqual(((1,), (2, 2)), actual.chunks)
+        assert_equal(actual.compute(), [[0., 2., 4., 6.]])
+
+    def test_masked(self):
+        src = np.ma.array(np.arange(16.).reshape((4, 4)), mask=[[1, 1, 0, 0],
+                                                                [1, 1, 0, 0],
+                                                                [0, 0, 0, 1],
+                                                                [0, 0, 1, 0]])
+        actual = gtr.resample_nd_dask(da.from_array(src, chunks=2, asarray=False), 2, 2, fill_value=-1.)
+        actual = actual.compute(scheduler='synchronous')
+        self.assertIsInstance(actual, np.ma.MaskedArray)
+        assert_equal(actual.mask, [[True, False], [False, False]])
+        assert_equal(actual.filled(-1.), [[-1., 4.5], [10.5, 12.5]])
+
+    def test_ndarray(self):
+        actual = gtr.resample_nd_dask(np.arange(16.).reshape((4, 4)), 2, 2, chunks=3)
+        assert_equal(actual.compute(), [[2.5, 4.5], [10.5, 12.5]])
+
+    def test_no_op(self):
+        src = da.zeros((4, 5), chunks=2)
+        self.assertIs(gtr.resample_nd_dask(src, 5, 4), src)
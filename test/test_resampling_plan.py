@@ -0,0 +1,40 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal
+
+import gridtools.resampling as gtr
+
+NAN = np.nan
+
+
+class ResamplingPlanTest(unittest.TestCase):
+    def test_apply_equals_resample_2d(self):
+        src = np.random.RandomState(0).uniform(0.0, 10.0, (9, 12))
+        src[2, 3] = NAN
+        for w, h in ((5, 4), (20, 15), (5, 15), (20, 4)):
+            for ds_method in (gtr.DS_FIRST, gtr.DS_MEAN, gtr.DS_STD):
+                plan = gtr.ResamplingPlan(src.shape, (h, w), ds_method=ds_method, us_method=gtr.US_LINEAR)
+                self.assertEqual((9, 12), plan.src_shape)
+                self.assertEqual((h, w), plan.dst_shape)
+                assert_equal(plan.apply(src, fill_value=-1.),
+                             gtr.resample_2d(src, w, h, ds_method=ds_method, us_method=gtr.US_LINEAR, fill_value=-1.))
+
+    def test_apply_to_many(self):
+        plan = gtr.ResamplingPlan((8, 8), (3, 3), ds_method=gtr.DS_MEAN)
+        srcs = np.random.RandomState(1).uniform(0.0, 10.0, (4, 8, 8))
+        actual = plan.apply(srcs)
+        self.assertEqual((4, 3, 3), actual.shape)
+        for i in range(len(srcs)):
+            assert_equal(plan.apply(srcs[i]), actual[i])
+
+    def test_get_resampling_plan_is_cached(self):
+        plan = gtr.get_resampling_plan((7, 100, 50), (10, 20), ds_method=gtr.DS_VAR)
+        self.assertIs(gtr.get_resampling_plan((100, 50), (10, 20), ds_method=gtr.DS_VAR), plan)
+        self.assertIsNot(gtr.get_resampling_plan((100, 50), (10, 20), ds_method=gtr.DS_MEAN), plan)
+        self.assertEqual(gtr.DS_VAR, plan.ds_method)
+
+    def test_incompatible_src(self):
+        plan = gtr.ResamplingPlan((8, 8), (3, 3))
+        with self.assertRaises(ValueError):
+            plan.apply(np.zeros((8, 9)))
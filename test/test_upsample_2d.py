@@ -153,3 +153,11 @@ class Upsample2dTest(unittest.TestCase):
                                                  [0, 0, 0, 0, 0],
                                                  [0, 0, 0, 0, 0],
                                                  [0, 0, 0, 0, 1]]))
+
+    def test_parallel(self):
+        src = np.random.RandomState(0).uniform(0.0, 10.0, (13, 17))
+        src[3, 4] = NAN
+        for method in (gtr.US_NEAREST, gtr.US_LINEAR):
+            desired = gtr.upsample_2d(src, 40, 31, method=method, fill_value=-1.)
+            actual = gtr.upsample_2d(src, 40, 31, method=method, fill_value=-1., parallel=True)
+            np.testing.assert_array_equal(actual, desired)
@@ -0,0 +1,11 @@
+import unittest
+
+import gridtools
+
+
+class WarmupTest(unittest.TestCase):
+    def test_warmup(self):
+        timings = gridtools.warmup(dtypes=('float64', 'uint8'))
+        self.assertEqual({'float64', 'uint8'}, set(timings.keys()))
+        for seconds in timings.values():
+            self.assertGreaterEqual(seconds, 0.0)